@@ -0,0 +1,182 @@
+"""Admission control and load shedding
+
+Every request first takes a token from its client's token bucket (keyed by
+X-API-Key, else the client IP) and then a slot under a global concurrency
+limit. The client IP is the connection's peer address; X-Forwarded-For is only
+believed when that peer is one of ADMISSION_TRUSTED_PROXIES, since any client
+can send the header and rotating it would dodge its rate limit. Both checks are non-blocking, so an overloaded server answers at once
+with 429 or 503 and a Retry-After header instead of letting requests pile up
+until the client gives up.
+
+Each admitted request also gets a deadline: its arrival time (X-Request-Start
+from the proxy when present, so time spent in the server backlog counts) plus
+its budget (X-Request-Timeout in milliseconds, else ADMISSION_DEADLINE_MS).
+Work that is still queued when its deadline passes is shed instead of run,
+since the client has stopped waiting for it.
+"""
+import ipaddress
+import math
+import os
+import threading
+import time
+from collections import OrderedDict
+
+import metrics
+
+ADMISSION_CONTROL = os.getenv("ADMISSION_CONTROL", "1") == "1"
+ADMISSION_MAX_CONCURRENCY = int(os.getenv("ADMISSION_MAX_CONCURRENCY", "64"))
+ADMISSION_RATE = float(os.getenv("ADMISSION_RATE", "50"))
+ADMISSION_BURST = float(os.getenv("ADMISSION_BURST", "100"))
+ADMISSION_DEADLINE_MS = float(os.getenv("ADMISSION_DEADLINE_MS", "5000"))
+ADMISSION_RETRY_AFTER = int(os.getenv("ADMISSION_RETRY_AFTER", "1"))
+ADMISSION_MAX_CLIENTS = int(os.getenv("ADMISSION_MAX_CLIENTS", "10000"))
+# Comma-separated addresses or CIDR ranges of the reverse proxies in front of the app
+ADMISSION_TRUSTED_PROXIES = [ipaddress.ip_network(proxy.strip(), strict=False)
+                             for proxy in os.getenv("ADMISSION_TRUSTED_PROXIES", "").split(",") if proxy.strip()]
+
+
+class DeadlineExceeded(Exception):
+    """Raised when queued work is dropped because its deadline has passed"""
+
+
+class TokenBucket:
+    def __init__(self, rate, burst, now):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = now
+
+    def take(self, now):
+        """Take one token; returns 0 on success or the seconds until one is available"""
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0
+        return (1 - self.tokens) / self.rate
+
+
+class Rejection:
+    """Why a request was not admitted, ready to turn into a response"""
+
+    def __init__(self, status, error, retry_after):
+        self.status = status
+        self.error = error
+        self.retry_after = max(1, math.ceil(retry_after))
+
+    def payload(self):
+        return {"error": self.error, "status": "error"}
+
+    def headers(self):
+        return {"Retry-After": str(self.retry_after)}
+
+
+class AdmissionController:
+    """Per-client rate limits plus a global concurrency limit"""
+
+    def __init__(self, max_concurrency=ADMISSION_MAX_CONCURRENCY, rate=ADMISSION_RATE,
+                 burst=ADMISSION_BURST, max_clients=ADMISSION_MAX_CLIENTS, clock=time.monotonic):
+        self.max_concurrency = max_concurrency
+        self.rate = rate
+        self.burst = burst
+        self.max_clients = max_clients
+        self.clock = clock
+        self.in_flight = 0
+        self.admitted = 0
+        self.rate_limited = 0
+        self.overloaded = 0
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+
+    def admit(self, client):
+        """Admit a request from client, or return the Rejection to send"""
+        now = self.clock()
+        with self._lock:
+            bucket = self._buckets.get(client)
+            if bucket is None:
+                bucket = self._buckets[client] = TokenBucket(self.rate, self.burst, now)
+                if len(self._buckets) > self.max_clients:
+                    self._buckets.popitem(last=False)
+            else:
+                self._buckets.move_to_end(client)
+
+            wait = bucket.take(now)
+            if wait:
+                self.rate_limited += 1
+                return Rejection(429, "Rate limit exceeded", wait)
+
+            if self.in_flight >= self.max_concurrency:
+                # Give the token back, the request was never served
+                bucket.tokens += 1
+                self.overloaded += 1
+                return Rejection(503, "Server overloaded, try again later", ADMISSION_RETRY_AFTER)
+
+            self.in_flight += 1
+            self.admitted += 1
+        metrics.ADMISSION_IN_FLIGHT.inc()
+        return None
+
+    def release(self):
+        with self._lock:
+            self.in_flight -= 1
+        metrics.ADMISSION_IN_FLIGHT.dec()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "in_flight": self.in_flight,
+                "max_concurrency": self.max_concurrency,
+                "admitted": self.admitted,
+                "rate_limited": self.rate_limited,
+                "overloaded": self.overloaded,
+                "clients": len(self._buckets),
+            }
+
+
+def is_trusted_proxy(addr, trusted_proxies=None):
+    trusted_proxies = ADMISSION_TRUSTED_PROXIES if trusted_proxies is None else trusted_proxies
+    try:
+        ip = ipaddress.ip_address(addr)
+    except ValueError:
+        return False
+    return any(ip in network for network in trusted_proxies)
+
+
+def client_ip(headers, remote_addr, trusted_proxies=None):
+    """The peer address, or the last untrusted X-Forwarded-For hop when the peer is a trusted proxy"""
+    if not is_trusted_proxy(remote_addr, trusted_proxies):
+        return remote_addr
+    hops = [hop.strip() for hop in headers.get("X-Forwarded-For", "").split(",") if hop.strip()]
+    for hop in reversed(hops):
+        if not is_trusted_proxy(hop, trusted_proxies):
+            return hop
+    return hops[0] if hops else remote_addr
+
+
+def client_key(headers, remote_addr, trusted_proxies=None):
+    """API key when the client sends one, else its IP address"""
+    api_key = headers.get("X-API-Key")
+    if api_key:
+        return f"key:{api_key}"
+    return f"ip:{client_ip(headers, remote_addr, trusted_proxies)}"
+
+
+def request_deadline(headers, now=None):
+    """Monotonic deadline for a request, counting time spent queued before the app"""
+    now = time.monotonic() if now is None else now
+    try:
+        budget = float(headers.get("X-Request-Timeout", ADMISSION_DEADLINE_MS)) / 1000
+    except ValueError:
+        budget = ADMISSION_DEADLINE_MS / 1000
+
+    queued = 0.0
+    start = headers.get("X-Request-Start")
+    if start:
+        try:
+            # nginx style "t=1700000000.123" (seconds) or plain milliseconds
+            value = float(start.split("=", 1)[-1])
+            started = value / 1000 if value > 1e11 else value
+            queued = max(0.0, time.time() - started)
+        except ValueError:
+            pass
+    return now + budget - queued
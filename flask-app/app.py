@@ -1,11 +1,34 @@
-from flask import Flask, request, jsonify
+from flask import Flask, Response, g, request, jsonify, stream_with_context
 from flask_cors import CORS
+from flask.json.provider import DefaultJSONProvider
+from werkzeug.exceptions import HTTPException, MethodNotAllowed
+import hmac
+import io
+import math
 import os
 import sqlite3
-from datetime import datetime
+import time
+from datetime import datetime, timedelta
 import json
 import nltk
 import psycopg2
+import admission
+import batcher
+import bulk_import
+import export
+import idempotency
+import jobs
+import metrics
+import profiler
+import rescore
+import retention
+import rollup
+import scheduler
+import slowlog
+import structured_log
+import timing
+import traffic
+from db_utils import format_timestamp, parse_timestamp, utc_now
 
 # Set NLTK path for both Docker and local development
 nltk_data_paths = [
@@ -17,21 +40,40 @@ nltk_data_paths = [
 for path in nltk_data_paths:
     if os.path.exists(path):
         nltk.data.path.append(path)
-        print(f"Added NLTK path: {path}")
 
-print(f"Final NLTK paths: {nltk.data.path}")
+log = structured_log.get_logger("app")
+log.debug("nltk_paths", paths=nltk.data.path)
 
 # Import after setting NLTK path
-from model import predict_sentiment
+import model
+
+# Every scoring call is timed by text length for /metrics
+predict_sentiment = metrics.timed_scoring(model.predict_sentiment)
+
+# Swap in a new analyzer when ANALYZER_CONFIG_PATH changes
+model.watch()
+
+class TimedJSONProvider(DefaultJSONProvider):
+    """Counts JSON serialization towards the request's Server-Timing"""
+
+    def dumps(self, obj, **kwargs):
+        with timing.phase("serialize"):
+            return super().dumps(obj, **kwargs)
 
 app = Flask(__name__)
-CORS(app, resources={r"/*": {"origins": "*"}})
+app.json = TimedJSONProvider(app)
+CORS(app, resources={r"/*": {"origins": "*"}}, expose_headers=["Retry-After", "Server-Timing"])
 
  
 
 # Database configuration
 def get_db_config():
     """Determine database configuration based on environment"""
+    if os.getenv('DB_TYPE') == 'sqlite':  # Forced SQLite, e.g. for benchmarks and load tests
+        return {
+            'type': 'sqlite',
+            'path': os.getenv('SQLITE_PATH', os.path.join(os.path.dirname(__file__), 'reviews.db'))
+        }
     if os.path.exists('/app') or os.getenv('DOCKER_ENV'):  # Docker environment
         return {
             'type': 'postgresql',
@@ -54,10 +96,12 @@ DB_TYPE = DB_CONFIG['type']
 
 def get_db_connection():
     """Get database connection with fallback handling"""
+    start = time.perf_counter()
     try:
         if DB_TYPE == "sqlite":
-            conn = sqlite3.connect(DB_CONFIG['path'])
+            conn = sqlite3.connect(DB_CONFIG['path'], factory=metrics.SQLITE_CONNECTION)
             conn.row_factory = sqlite3.Row
+            metrics.observe_db("connect", start)
             return conn
         else:
             # Try multiple connection methods for PostgreSQL
@@ -69,24 +113,27 @@ def get_db_connection():
                     user=DB_CONFIG['user'],
                     password=DB_CONFIG['password'],
                     port=DB_CONFIG['port'],
-                    connect_timeout=5
+                    connect_timeout=5,
+                    connection_factory=metrics.PG_CONNECTION
                 ),
                 # Method 2: Connection URL
-                lambda: psycopg2.connect(DB_CONFIG['url']),
+                lambda: psycopg2.connect(DB_CONFIG['url'], connection_factory=metrics.PG_CONNECTION),
                 # Method 3: Localhost fallback
                 lambda: psycopg2.connect(
                     host="localhost",
                     database="moviesentiment",
                     user="postgres",
                     password="password",
-                    port="5432"
+                    port="5432",
+                    connection_factory=metrics.PG_CONNECTION
                 )
             ]
             
-            for method in connection_methods:
+            for attempt, method in enumerate(connection_methods, 1):
                 try:
                     conn = method()
-                    print(f"✅ Database connected using {method.__name__}")
+                    log.debug("db_connected", db_type=DB_TYPE, method=attempt)
+                    metrics.observe_db("connect", start)
                     return conn
                 except Exception as e:
                     continue
@@ -94,7 +141,7 @@ def get_db_connection():
             raise Exception("All database connection methods failed")
             
     except Exception as e:
-        print(f"❌ Database connection error: {e}")
+        log.warning("db_connection_failed", db_type=DB_TYPE, error=str(e))
         return None
 
 def init_db():
@@ -102,7 +149,7 @@ def init_db():
     try:
         conn = get_db_connection()
         if conn is None:
-            print("⚠️  Database not available, running in no-db mode")
+            log.warning("db_unavailable", mode="no-db")
             return
             
         cur = conn.cursor()
@@ -114,9 +161,18 @@ def init_db():
                     text TEXT NOT NULL,
                     sentiment TEXT NOT NULL,
                     confidence_score REAL,
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    analyzer_version TEXT
                 );
             """)
+        elif retention.partitioning_enabled(DB_TYPE):
+            retention.create_partitioned_table(cur)
+            if retention.is_partitioned(cur):
+                created = retention.ensure_partitions(cur)
+                if created:
+                    log.info("partitions_created", partitions=created)
+            else:
+                log.warning("partitions_skipped", reason="reviews already exists unpartitioned")
         else:
             cur.execute("""
                 CREATE TABLE IF NOT EXISTS reviews (
@@ -124,20 +180,233 @@ def init_db():
                     text TEXT NOT NULL,
                     sentiment TEXT NOT NULL,
                     confidence_score FLOAT,
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    analyzer_version TEXT
                 );
             """)
+
+        cur.execute("CREATE INDEX IF NOT EXISTS idx_reviews_created_at ON reviews(created_at);")
+        rollup.create_table(cur, DB_TYPE)
+        rescore.create_table(cur, DB_TYPE)
+        bulk_import.create_table(cur, DB_TYPE)
+        jobs.create_table(cur, DB_TYPE)
+        idempotency.create_table(cur, DB_TYPE)
             
         conn.commit()
         cur.close()
         conn.close()
-        print("✅ Database initialized successfully")
+        log.info("db_initialized", db_type=DB_TYPE)
     except Exception as e:
-        print(f"⚠️  Database initialization warning: {e}")
+        log.warning("db_init_failed", error=str(e))
 
 # Initialize database when app starts
 init_db()
 
+# Background scoring jobs run on a local process pool, started on first use
+job_runner = jobs.JobRunner(get_db_connection, DB_TYPE)
+
+# Reviews scored by an older analyzer are rescored in the background when enabled
+rescorer = rescore.Rescorer(get_db_connection, DB_TYPE)
+if rescore.RESCORE_BACKGROUND:
+    rescorer.start()
+
+def store_reviews(conn, rows, version):
+    """Insert (text, sentiment, confidence) rows scored by analyzer version in
+    one transaction and update the rollup; returns [(id, created_at), ...] in input order"""
+    cur = conn.cursor()
+
+    if DB_TYPE == "sqlite":
+        # One timestamp for the whole batch, like a single multi-row insert
+        cur.execute("SELECT CURRENT_TIMESTAMP;")
+        created_at = cur.fetchone()[0]
+        stored = []
+        for text, sentiment, confidence in rows:
+            cur.execute(
+                "INSERT INTO reviews (text, sentiment, confidence_score, created_at, analyzer_version) "
+                "VALUES (?, ?, ?, ?, ?);",
+                (text, sentiment, confidence, created_at, version)
+            )
+            stored.append((cur.lastrowid, created_at))
+    else:
+        values = ", ".join(["(%s, %s, %s, %s)"] * len(rows))
+        cur.execute(
+            f"INSERT INTO reviews (text, sentiment, confidence_score, analyzer_version) VALUES {values} "
+            "RETURNING id, created_at;",
+            [value for row in rows for value in (*row, version)]
+        )
+        stored = [(row[0], row[1]) for row in cur.fetchall()]
+
+    rollup.apply(cur, DB_TYPE, [(created_at, sentiment, confidence)
+                                for (_, sentiment, confidence), (_, created_at) in zip(rows, stored)])
+
+    conn.commit()
+    cur.close()
+    return stored
+
+def store_review(conn, text, sentiment, confidence, version):
+    """Insert one scored review and update the rollup; returns (id, created_at)"""
+    return store_reviews(conn, [(text, sentiment, confidence)], version)[0]
+
+def save_reviews(rows, version):
+    """Store scored rows if the database is reachable; ids are None otherwise"""
+    conn = get_db_connection()
+    if conn:
+        try:
+            return store_reviews(conn, rows, version)
+        except Exception as db_error:
+            log.warning("db_store_failed", error=str(db_error))
+            # Continue without database storage
+        finally:
+            conn.close()
+    return [(None, None)] * len(rows)
+
+def score_and_store(texts):
+    """Score a micro-batch of /predict texts and store them with one insert"""
+    analyzer = model.active()
+    scores = [predict_sentiment(text, analyzer) for text in texts]
+    stored = save_reviews([(text, sentiment, confidence) for text, (sentiment, confidence) in zip(texts, scores)],
+                          analyzer.version)
+    return [score + ids for score, ids in zip(scores, stored)]
+
+# Scoring runs on separate interactive and bulk lanes, chosen by cost
+score_scheduler = scheduler.LaneScheduler()
+
+# Optional micro-batching of concurrent /predict calls
+predict_batcher = batcher.MicroBatcher(score_and_store) if os.getenv("PREDICT_MICROBATCH") == "1" else None
+
+# Repeated /predict submissions with the same Idempotency-Key replay the first response
+idempotency_store = idempotency.IdempotencyStore(get_db_connection, DB_TYPE, dumps=app.json.dumps)
+
+# Per-client rate limits and a global concurrency limit, checked before any route runs
+admission_controller = admission.AdmissionController()
+ADMISSION_EXEMPT_PATHS = {"/", "/health", "/metrics"}
+
+def rejection_response(rejection):
+    """Fast 429/503 response telling the client when to retry"""
+    return jsonify(rejection.payload()), rejection.status, rejection.headers()
+
+BUSY = admission.Rejection(503, "Server busy, try again later", admission.ADMISSION_RETRY_AFTER)
+DEADLINE_EXCEEDED = admission.Rejection(
+    503, "Request deadline exceeded, try again later", admission.ADMISSION_RETRY_AFTER)
+
+@app.before_request
+def start_request_timer():
+    g.request_start = time.perf_counter()
+    if timing.SERVER_TIMING or slowlog.SLOW_LOG_ENABLED:
+        g.timing_token = timing.start()
+        g.route = request.url_rule.rule if request.url_rule is not None else "unmatched"
+        timing.note("route", g.route)
+        if request.is_json:
+            # Parsed once here so the time lands in its own phase; get_json caches it
+            with timing.phase("parse"):
+                request.get_json(silent=True)
+
+@app.after_request
+def record_request_metrics(response):
+    route = request.url_rule.rule if request.url_rule is not None else "unmatched"
+    metrics.observe_request(route, request.method, response.status_code,
+                            time.perf_counter() - g.get("request_start", time.perf_counter()))
+
+    g.response_status = response.status_code
+    request_timing = timing.current() if "timing_token" in g else None
+    if request_timing is not None and timing.SERVER_TIMING:
+        if timing.SERVER_TIMING_BODY and response.is_json and not response.is_streamed:
+            data = response.get_json(silent=True)
+            if isinstance(data, dict):
+                data["_timing"] = request_timing.as_dict()
+                response.set_data(app.json.dumps(data) + "\n")
+        response.headers["Server-Timing"] = request_timing.header()
+        response.headers["Timing-Allow-Origin"] = "*"
+    return response
+
+@app.teardown_request
+def finish_request_timer(exc=None):
+    token = g.pop("timing_token", None)
+    if token is not None:
+        # Checked here rather than in after_request so streamed responses count in full
+        slowlog.check_request(timing.current(), g.route, request.method, g.get("response_status", 500))
+        timing.finish(token)
+
+@app.before_request
+def record_traffic():
+    if traffic.recorder is not None and not request.environ.get("sentiment.recorded"):
+        body = request.get_data(cache=True) if traffic.records_body(request.path, request.content_type) else None
+        traffic.record(request.method, request.path, request.query_string.decode("latin-1"),
+                       request.headers, request.remote_addr, body)
+
+@app.before_request
+def admit_request():
+    """Reject requests over the client's rate limit or the server's concurrency limit"""
+    if request.environ.get("sentiment.admitted"):
+        # Already admitted by the ASGI server
+        g.deadline = request.environ.get("sentiment.deadline")
+        return None
+    if (not admission.ADMISSION_CONTROL or request.method == "OPTIONS"
+            or request.path in ADMISSION_EXEMPT_PATHS):
+        return None
+
+    rejection = admission_controller.admit(admission.client_key(request.headers, request.remote_addr))
+    if rejection is not None:
+        return rejection_response(rejection)
+    g.admitted = True
+    g.deadline = admission.request_deadline(request.headers)
+    return None
+
+@app.teardown_request
+def release_request(exc=None):
+    if g.pop("admitted", False):
+        admission_controller.release()
+
+def score_texts(texts, analyzer=None):
+    """Score each text with one analyzer, keeping per-text failures in the results"""
+    analyzer = analyzer or model.active()
+    results = []
+    for text in texts:
+        try:
+            sentiment, confidence = predict_sentiment(text, analyzer)
+            results.append({
+                "text": text,
+                "sentiment": sentiment,
+                "confidence_score": confidence
+            })
+        except Exception as e:
+            results.append({
+                "text": text,
+                "error": str(e),
+                "status": "failed"
+            })
+    return results
+
+def read_stats(conn):
+    """Collect review statistics from the database"""
+    cur = conn.cursor()
+
+    # Get total reviews count
+    cur.execute("SELECT COUNT(*) FROM reviews;")
+    total_reviews = cur.fetchone()[0]
+
+    # Get sentiment distribution
+    cur.execute("SELECT sentiment, COUNT(*) FROM reviews GROUP BY sentiment;")
+    sentiment_stats = {row[0]: row[1] for row in cur.fetchall()}
+
+    # Get latest review
+    cur.execute("SELECT created_at FROM reviews ORDER BY created_at DESC LIMIT 1;")
+    latest_review = cur.fetchone()
+    latest_date = latest_review[0] if latest_review else "No reviews yet"
+
+    cur.close()
+    return {
+        "total_reviews": total_reviews,
+        "sentiment_distribution": sentiment_stats,
+        "latest_review_date": latest_date,
+        "environment": "local" if DB_TYPE == "sqlite" else "docker",
+        "database_status": "connected"
+    }
+
+def analyzer_status():
+    """Report whether VADER or the fallback analyzer is in use"""
+    return model.active().kind
+
 @app.route("/")
 def home():
     return """
@@ -146,11 +415,24 @@ def home():
     <ul>
         <li><b>POST /predict</b> - Analyze sentiment of movie review</li>
         <li><b>GET /reviews</b> - Get all reviews</li>
+        <li><b>GET /reviews/export</b> - Stream all reviews as NDJSON or CSV</li>
+        <li><b>POST /reviews/import</b> - Bulk import reviews from CSV or NDJSON</li>
         <li><b>GET /reviews/&lt;id&gt;</b> - Get specific review</li>
         <li><b>DELETE /reviews/&lt;id&gt;</b> - Delete a review</li>
         <li><b>GET /stats</b> - Get API statistics</li>
+        <li><b>GET /stats/timeseries</b> - Sentiment counts per hour or day</li>
+        <li><b>POST /client-metrics</b> - Report client retry counts</li>
+        <li><b>GET /client-metrics</b> - Client-reported retry counts</li>
+        <li><b>GET /stats/lanes</b> - Scoring lane queue depths, wait times and admission counters</li>
+        <li><b>GET /stats/rescore</b> - Reviews per analyzer version and background rescoring progress</li>
         <li><b>GET /health</b> - Health check</li>
-        <li><b>POST /batch-predict</b> - Analyze multiple texts</li>
+        <li><b>GET /metrics</b> - Prometheus metrics</li>
+        <li><b>GET /admin/profile</b> - Sample this worker's stacks (admin token required)</li>
+        <li><b>POST /admin/analyzer/reload</b> - Rebuild the analyzer from its config file (admin token required)</li>
+        <li><b>POST /batch-predict</b> - Analyze multiple texts ("mode": "fast" for approximate bulk scoring)</li>
+        <li><b>POST /jobs</b> - Score a large batch or file in the background</li>
+        <li><b>GET /jobs/&lt;id&gt;</b> - Job progress, throughput and ETA</li>
+        <li><b>GET /jobs/&lt;id&gt;/results</b> - Stream job results as NDJSON</li>
     </ul>
     <p>Use POSTMAN or curl to test the API endpoints.</p>
     """
@@ -172,17 +454,11 @@ def health_check():
         else:
             db_status = "disconnected"
         
-        # Check NLTK status
-        try:
-            nltk.data.find('sentiment/vader_lexicon.zip')
-            nltk_status = "vader"
-        except LookupError:
-            nltk_status = "fallback"
-        
         return jsonify({
             "status": "healthy",
             "database": db_status,
-            "nltk": nltk_status,
+            "nltk": analyzer_status(),
+            "analyzer_version": model.active().version,
             "environment": "local" if DB_TYPE == "sqlite" else "docker",
             "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S")
         })
@@ -209,64 +485,90 @@ def predict():
     
     if not text:
         return jsonify({"error": "Text cannot be empty", "status": "error"}), 400
+    timing.note_texts([text])
 
-    # Predict sentiment
     try:
-        sentiment, confidence = predict_sentiment(text)
-        
-        # Try to store in database
-        conn = get_db_connection()
-        if conn:
-            try:
-                cur = conn.cursor()
-                
-                if DB_TYPE == "sqlite":
-                    cur.execute(
-                        "INSERT INTO reviews (text, sentiment, confidence_score) VALUES (?, ?, ?);",
-                        (text, sentiment, confidence)
-                    )
-                    review_id = cur.lastrowid
-                    # Get the created_at timestamp
-                    cur.execute("SELECT created_at FROM reviews WHERE id = ?;", (review_id,))
-                    result = cur.fetchone()
-                    created_at = result[0] if result else datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-                else:
-                    cur.execute(
-                        "INSERT INTO reviews (text, sentiment, confidence_score) VALUES (%s, %s, %s) RETURNING id, created_at;",
-                        (text, sentiment, confidence)
-                    )
-                    result = cur.fetchone()
-                    review_id, created_at = result[0], result[1]
-                    
-                conn.commit()
-                cur.close()
-                conn.close()
-                
-                return jsonify({
-                    "id": review_id,
-                    "text": text,
-                    "sentiment": sentiment,
-                    "confidence_score": confidence,
-                    "created_at": created_at,
-                    "database": "stored",
-                    "status": "success"
-                })
-            except Exception as db_error:
-                print(f"Database storage failed: {db_error}")
-                # Continue without database storage
-                conn.close()
+        analyzer = select_analyzer(data.get('overlay'), request.headers.get('X-API-Key'))
+    except model.UnknownOverlay as e:
+        return jsonify({"error": f"Unknown lexicon overlay: {e}", "status": "error"}), 400
+
+    key = request.headers.get('Idempotency-Key')
+    if not key:
+        payload, status, headers = predict_result(text, g.get("deadline"), analyzer)
+        return jsonify(payload), status, headers
+
+    if len(key) > idempotency.IDEMPOTENCY_KEY_MAX_LENGTH:
+        return jsonify({"error": "Idempotency-Key is too long", "status": "error"}), 400
+    try:
+        (payload, status, headers), replayed = idempotency_store.run(
+            key, idempotency.fingerprint(text, *filter(None, [analyzer.name])),
+            lambda: predict_result(text, g.get("deadline"), analyzer))
+    except idempotency.KeyReused:
+        return jsonify({"error": "Idempotency-Key was already used for a different review", "status": "error"}), 422
+    except idempotency.InProgress:
+        return jsonify({"error": "A request with this Idempotency-Key is still in progress",
+                        "status": "error"}), 409, {"Retry-After": "1"}
+    if replayed:
+        headers = {"Idempotent-Replayed": "true"}
+    return jsonify(payload), status, headers
+
+MODE_ERROR = "mode must be 'full' or 'fast'"
+
+def select_analyzer(overlay, api_key, mode="full"):
+    """The active analyzer for a requested overlay name, else the API key's tenant overlay, else the base
+
+    mode="fast" picks that analyzer's approximate lexicon-sum scorer. Raises
+    model.UnknownOverlay for a name the analyzer config does not define.
+    """
+    return model.active().select(overlay if isinstance(overlay, str) else None, api_key, mode)
+
+def predict_result(text, deadline=None, analyzer=None):
+    """Score and store one review; returns (payload, status, headers)
+
+    Scored by analyzer when given (an overlay), otherwise by the active analyzer.
+    """
+    try:
+        # Micro-batches share one analyzer, so overlay requests are scored on their own
+        if predict_batcher is not None and (analyzer is None or analyzer.name is None) and \
+                score_scheduler.classify(len(text)) == "interactive":
+            # Scored and stored together with other concurrent requests
+            with timing.phase("batch"):
+                sentiment, confidence, review_id, created_at = predict_batcher.submit(text).result()
+        else:
+            # Stored under the version of the analyzer that scored it, even if a reload lands in between
+            analyzer = analyzer or model.active()
+            with timing.phase("score"):
+                sentiment, confidence = score_scheduler.run(len(text), predict_sentiment, text, analyzer,
+                                                            deadline=deadline)
+            # Try to store in database
+            review_id, created_at = save_reviews([(text, sentiment, confidence)], analyzer.version)[0]
+
+        if review_id is not None:
+            return {
+                "id": review_id,
+                "text": text,
+                "sentiment": sentiment,
+                "confidence_score": confidence,
+                "created_at": created_at,
+                "database": "stored",
+                "status": "success"
+            }, 200, {}
         
         # If database is not available, return result without storage
-        return jsonify({
+        return {
             "text": text,
             "sentiment": sentiment,
             "confidence_score": confidence,
             "database": "not_available",
             "status": "success"
-        })
+        }, 200, {}
         
+    except scheduler.LaneFull:
+        return BUSY.payload(), BUSY.status, BUSY.headers()
+    except admission.DeadlineExceeded:
+        return DEADLINE_EXCEEDED.payload(), DEADLINE_EXCEEDED.status, DEADLINE_EXCEEDED.headers()
     except Exception as e:
-        return jsonify({"error": f"Prediction error: {str(e)}", "status": "error"}), 500
+        return {"error": f"Prediction error: {str(e)}", "status": "error"}, 500, {}
 
 @app.route("/batch-predict", methods=['POST'])
 def batch_predict():
@@ -280,29 +582,115 @@ def batch_predict():
     
     if not texts:
         return jsonify({"error": "No valid texts provided", "status": "error"}), 400
+    timing.note_texts(texts)
 
-    results = []
-    for text in texts:
-        try:
-            sentiment, confidence = predict_sentiment(text)
-            results.append({
-                "text": text,
-                "sentiment": sentiment,
-                "confidence_score": confidence
-            })
-        except Exception as e:
-            results.append({
-                "text": text,
-                "error": str(e),
-                "status": "failed"
-            })
+    mode = data.get('mode', 'full')
+    if mode not in model.SCORING_MODES:
+        return jsonify({"error": MODE_ERROR, "status": "error"}), 400
+    try:
+        analyzer = select_analyzer(data.get('overlay'), request.headers.get('X-API-Key'), mode)
+    except model.UnknownOverlay as e:
+        return jsonify({"error": f"Unknown lexicon overlay: {e}", "status": "error"}), 400
+
+    try:
+        with timing.phase("score"):
+            results = score_scheduler.run(scheduler.text_cost(texts), score_texts, texts, analyzer,
+                                          deadline=g.get("deadline"))
+    except scheduler.LaneFull:
+        return rejection_response(BUSY)
+    except admission.DeadlineExceeded:
+        return rejection_response(DEADLINE_EXCEEDED)
 
     return jsonify({
         "results": results,
         "total_processed": len(results),
+        "mode": mode,
         "status": "success"
     })
 
+@app.route("/jobs", methods=['POST'])
+def create_job():
+    """Queue a background scoring job from a texts array or an uploaded file"""
+    upload = request.files.get('file')
+    if upload:
+        filename = upload.filename or ''
+        fmt = request.form.get('format') or ('ndjson' if filename.endswith(('.ndjson', '.jsonl')) else 'csv')
+        store = request.form.get('store', 'false').lower() == 'true'
+        mode = request.form.get('mode', 'full')
+
+        def write_input(f):
+            for line in io.TextIOWrapper(upload.stream, encoding='utf-8', newline=''):
+                f.write(line)
+    else:
+        data = request.get_json(silent=True)
+        if not data or 'texts' not in data or not isinstance(data['texts'], list):
+            return jsonify({"error": "Provide a texts array or upload a file", "status": "error"}), 400
+        fmt = 'ndjson'
+        store = bool(data.get('store', False))
+        mode = data.get('mode', 'full')
+
+        def write_input(f):
+            for text in data['texts']:
+                f.write(json.dumps({"text": text}) + "\n")
+
+    if fmt not in bulk_import.IMPORT_FORMATS:
+        return jsonify({"error": "format must be 'csv' or 'ndjson'", "status": "error"}), 400
+    if mode not in model.SCORING_MODES:
+        return jsonify({"error": MODE_ERROR, "status": "error"}), 400
+
+    try:
+        conn = get_db_connection()
+        if conn is None:
+            return jsonify({"error": "Database not available", "status": "error"}), 503
+
+        job_id = jobs.create_job(conn, DB_TYPE, fmt, write_input, store_results=store, mode=mode)
+        job = jobs.get_job(conn, DB_TYPE, job_id)
+        conn.close()
+        job_runner.ensure_started()
+
+        return jsonify({**jobs.describe(job), "status": "success"}), 202
+
+    except (ValueError, KeyError) as e:
+        return jsonify({"error": f"Invalid input file: {str(e)}", "status": "error"}), 400
+    except Exception as e:
+        return jsonify({"error": f"Job error: {str(e)}", "status": "error"}), 500
+
+@app.route("/jobs/<job_id>", methods=['GET'])
+def get_job(job_id):
+    """Get progress, throughput and ETA of a background job"""
+    try:
+        conn = get_db_connection()
+        if conn is None:
+            return jsonify({"error": "Database not available", "status": "error"}), 503
+
+        job = jobs.get_job(conn, DB_TYPE, job_id)
+        conn.close()
+        if not job:
+            return jsonify({"error": "Job not found", "status": "error"}), 404
+
+        if job['status'] in ('queued', 'running'):
+            job_runner.ensure_started()
+        return jsonify({**jobs.describe(job), "status": "success"})
+
+    except Exception as e:
+        return jsonify({"error": f"Database error: {str(e)}", "status": "error"}), 500
+
+@app.route("/jobs/<job_id>/results", methods=['GET'])
+def get_job_results(job_id):
+    """Stream the results scored so far as NDJSON"""
+    conn = get_db_connection()
+    if conn is None:
+        return jsonify({"error": "Database not available", "status": "error"}), 503
+
+    job = jobs.get_job(conn, DB_TYPE, job_id)
+    conn.close()
+    if not job:
+        return jsonify({"error": "Job not found", "status": "error"}), 404
+
+    response = Response(stream_with_context(jobs.iter_results(job)), mimetype='application/x-ndjson')
+    response.headers['X-Job-Status'] = job['status']
+    return response
+
 @app.route("/reviews", methods=['GET'])
 def get_reviews():
     """Get all reviews with pagination"""
@@ -364,6 +752,66 @@ def get_reviews():
     except Exception as e:
         return jsonify({"error": f"Database error: {str(e)}", "status": "error"}), 500
 
+@app.route("/reviews/export", methods=['GET'])
+def export_reviews():
+    """Stream every review as NDJSON or CSV, resumable with after_id"""
+    fmt = request.args.get('format', 'ndjson')
+    if fmt not in export.EXPORT_FORMATS:
+        return jsonify({"error": "format must be 'ndjson' or 'csv'", "status": "error"}), 400
+
+    try:
+        after_id = int(request.args.get('after_id', 0))
+    except ValueError:
+        return jsonify({"error": "after_id must be an integer", "status": "error"}), 400
+
+    conn = get_db_connection()
+    if conn is None:
+        return jsonify({"error": "Database not available", "status": "error"}), 503
+
+    response = Response(
+        stream_with_context(export.stream(conn, DB_TYPE, fmt, after_id)),
+        mimetype=export.EXPORT_FORMATS[fmt]
+    )
+    response.headers['Content-Disposition'] = f'attachment; filename=reviews.{fmt}'
+    return response
+
+@app.route("/reviews/import", methods=['POST'])
+def import_reviews():
+    """Score and store an uploaded CSV or NDJSON file of reviews"""
+    upload = request.files.get('file')
+    filename = upload.filename if upload else ''
+    fmt = request.args.get('format') or ('ndjson' if filename.endswith(('.ndjson', '.jsonl')) else 'csv')
+    if fmt not in bulk_import.IMPORT_FORMATS:
+        return jsonify({"error": "format must be 'csv' or 'ndjson'", "status": "error"}), 400
+
+    import_id = request.args.get('import_id')
+    if not import_id:
+        return jsonify({"error": "import_id is required so the import can resume", "status": "error"}), 400
+
+    try:
+        conn = get_db_connection()
+        if conn is None:
+            return jsonify({"error": "Database not available", "status": "error"}), 503
+
+        source = upload.stream if upload else request.stream
+        records = bulk_import.read_records(io.TextIOWrapper(source, encoding='utf-8', newline=''), fmt)
+        # Imports share one pool of IMPORT_WORKERS processes rather than starting their own
+        workers = min(int(request.args.get('workers', bulk_import.IMPORT_WORKERS)), bulk_import.IMPORT_WORKERS)
+        result = bulk_import.run_import(
+            conn, DB_TYPE, records, import_id,
+            chunk_size=int(request.args.get('chunk_size', bulk_import.IMPORT_CHUNK_SIZE)),
+            workers=workers,
+            pool=bulk_import.shared_pool() if workers > 1 else None
+        )
+        conn.close()
+
+        return jsonify({**result, "status": "success"})
+
+    except (ValueError, KeyError) as e:
+        return jsonify({"error": f"Invalid import file: {str(e)}", "status": "error"}), 400
+    except Exception as e:
+        return jsonify({"error": f"Import error: {str(e)}", "status": "error"}), 500
+
 @app.route("/reviews/<int:review_id>", methods=['GET'])
 def get_review(review_id):
     """Get a specific review by ID"""
@@ -418,17 +866,20 @@ def delete_review(review_id):
         
         # Check if review exists
         if DB_TYPE == "sqlite":
-            cur.execute("SELECT id FROM reviews WHERE id = ?;", (review_id,))
+            cur.execute("SELECT created_at, sentiment, confidence_score FROM reviews WHERE id = ?;", (review_id,))
         else:
-            cur.execute("SELECT id FROM reviews WHERE id = %s;", (review_id,))
+            cur.execute("SELECT created_at, sentiment, confidence_score FROM reviews WHERE id = %s;", (review_id,))
             
-        if not cur.fetchone():
+        row = cur.fetchone()
+        if not row:
             return jsonify({"error": "Review not found", "status": "error"}), 404
         
         if DB_TYPE == "sqlite":
             cur.execute("DELETE FROM reviews WHERE id = ?;", (review_id,))
         else:
             cur.execute("DELETE FROM reviews WHERE id = %s;", (review_id,))
+
+        rollup.apply(cur, DB_TYPE, [tuple(row)], sign=-1)
             
         conn.commit()
         cur.close()
@@ -459,37 +910,203 @@ def get_stats():
                 "status": "success"
             })
             
-        cur = conn.cursor()
-        
-        # Get total reviews count
-        cur.execute("SELECT COUNT(*) FROM reviews;")
-        total_reviews = cur.fetchone()[0]
-        
-        # Get sentiment distribution
-        cur.execute("SELECT sentiment, COUNT(*) FROM reviews GROUP BY sentiment;")
-        sentiment_stats = {row[0]: row[1] for row in cur.fetchall()}
+        statistics = read_stats(conn)
+        conn.close()
         
-        # Get latest review
-        cur.execute("SELECT created_at FROM reviews ORDER BY created_at DESC LIMIT 1;")
-        latest_review = cur.fetchone()
-        latest_date = latest_review[0] if latest_review else "No reviews yet"
+        return jsonify({
+            "statistics": statistics,
+            "status": "success"
+        })
         
+    except Exception as e:
+        return jsonify({"error": f"Database error: {str(e)}", "status": "error"}), 500
+
+@app.route("/stats/timeseries", methods=['GET'])
+def get_stats_timeseries():
+    """Get sentiment counts per hour or day from the rollup table"""
+    granularity = request.args.get('granularity', 'hour')
+    if granularity not in rollup.GRANULARITIES:
+        return jsonify({"error": "granularity must be 'hour' or 'day'", "status": "error"}), 400
+
+    # Default window: last 24 hours of hourly buckets or last 30 days of daily ones
+    default_window = timedelta(hours=24) if granularity == 'hour' else timedelta(days=30)
+    try:
+        since = request.args.get('since')
+        until = request.args.get('until')
+        since = parse_timestamp(since) if since else utc_now() - default_window
+        until = parse_timestamp(until) if until else None
+    except ValueError:
+        return jsonify({"error": "since/until must be ISO-8601 timestamps", "status": "error"}), 400
+
+    try:
+        conn = get_db_connection()
+        if conn is None:
+            return jsonify({"error": "Database not available", "status": "error"}), 503
+
+        cur = conn.cursor()
+        buckets = rollup.timeseries(cur, DB_TYPE, granularity, since, until)
         cur.close()
         conn.close()
-        
+
         return jsonify({
-            "statistics": {
-                "total_reviews": total_reviews,
-                "sentiment_distribution": sentiment_stats,
-                "latest_review_date": latest_date,
-                "environment": "local" if DB_TYPE == "sqlite" else "docker",
-                "database_status": "connected"
-            },
+            "granularity": granularity,
+            "since": format_timestamp(since),
+            "until": format_timestamp(until),
+            "buckets": buckets,
+            "status": "success"
+        })
+
+    except Exception as e:
+        return jsonify({"error": f"Database error: {str(e)}", "status": "error"}), 500
+
+@app.route("/stats/lanes", methods=['GET'])
+def get_lane_stats():
+    """Get queue depth and queue wait time of each scoring lane"""
+    return jsonify({
+        "lanes": score_scheduler.stats(),
+        "bulk_cost_threshold": score_scheduler.bulk_cost,
+        "admission": admission_controller.stats(),
+        "status": "success"
+    })
+
+@app.route("/stats/rescore", methods=['GET'])
+def get_rescore_stats():
+    """Get review counts per analyzer version and the rescorer's progress"""
+    conn = get_db_connection()
+    if conn is None:
+        return jsonify({"error": "Database not available", "status": "error"}), 503
+    try:
+        cur = conn.cursor()
+        counts = rescore.version_counts(cur)
+        analyzer = model.active()
+        checkpoint = rescore.get_checkpoint(cur, DB_TYPE, analyzer.generation)
+        cur.close()
+        conn.close()
+        return jsonify({
+            "analyzer_version": analyzer.version,
+            "overlay_versions": {name: overlay.version for name, overlay in analyzer.overlays.items()},
+            "by_version": [{"analyzer_version": v, "count": count} for v, count in counts.items()],
+            "outdated": sum(count for v, count in counts.items() if v not in analyzer.versions()),
+            "checkpoint": checkpoint,
+            "rescorer": rescorer.stats(),
             "status": "success"
         })
-        
     except Exception as e:
         return jsonify({"error": f"Database error: {str(e)}", "status": "error"}), 500
 
+# Admin endpoints are only enabled when ADMIN_TOKEN is set
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN")
+
+def admin_error():
+    """Error response unless the request carries the admin token, else None"""
+    if not ADMIN_TOKEN:
+        return jsonify({"error": "Admin endpoints are disabled, set ADMIN_TOKEN to enable them",
+                        "status": "error"}), 403
+    supplied = request.headers.get("X-Admin-Token", "")
+    if not hmac.compare_digest(supplied.encode("utf-8"), ADMIN_TOKEN.encode("utf-8")):
+        return jsonify({"error": "Admin token required", "status": "error"}), 401
+    return None
+
+worker_profiler = profiler.Profiler()
+
+@app.route("/admin/profile", methods=['GET'])
+def profile_worker():
+    """Sample this worker's thread stacks for a few seconds and return collapsed stacks"""
+    error = admin_error()
+    if error is not None:
+        return error
+    try:
+        seconds = float(request.args.get('seconds', 5))
+        interval_ms = float(request.args.get('interval_ms', profiler.PROFILER_DEFAULT_INTERVAL_MS))
+    except ValueError:
+        return jsonify({"error": "seconds and interval_ms must be numbers", "status": "error"}), 400
+
+    try:
+        stacks, samples = worker_profiler.run(seconds, interval_ms)
+    except profiler.ProfilerBusy as e:
+        return (jsonify({"error": str(e), "status": "error"}), 429,
+                {"Retry-After": str(max(1, math.ceil(e.retry_after)))})
+
+    return Response(stacks, mimetype="text/plain", headers={
+        "X-Profile-Samples": str(samples),
+        "X-Profile-Pid": str(os.getpid()),
+    })
+
+@app.route("/admin/analyzer/reload", methods=['POST'])
+def reload_analyzer():
+    """Rebuild this worker's analyzer from its config file and swap it in once the canaries pass
+
+    Other workers pick the change up from the file within ANALYZER_WATCH_SECONDS.
+    """
+    error = admin_error()
+    if error is not None:
+        return error
+    try:
+        previous, analyzer = model.reload(model.ANALYZER_CONFIG_PATH)
+    except model.CanaryFailed as e:
+        return jsonify({"error": str(e), "failures": e.failures, "analyzer_version": model.active().version,
+                        "status": "error"}), 422
+    except (OSError, LookupError, ValueError) as e:
+        return jsonify({"error": f"Analyzer config error: {str(e)}", "analyzer_version": model.active().version,
+                        "status": "error"}), 400
+    return jsonify({
+        "analyzer": analyzer.kind,
+        "analyzer_version": analyzer.version,
+        "previous_version": previous.version,
+        "pid": os.getpid(),
+        "status": "success"
+    })
+
+# Slow queries on PostgreSQL get their EXPLAIN plan captured on a separate connection
+slowlog.slow_log.configure(get_db_connection, DB_TYPE)
+
+def client_metrics_route(endpoint):
+    """The route rule a reported endpoint path matches, else "other", so label values stay bounded"""
+    adapter = app.url_map.bind('localhost')
+    path = endpoint.split('?', 1)[0]
+    try:
+        rule, _ = adapter.match(path, return_rule=True)
+    except MethodNotAllowed as e:
+        rule, _ = adapter.match(path, sorted(e.valid_methods)[0], return_rule=True)
+    except HTTPException:
+        return "other"
+    return rule.rule
+
+@app.route("/client-metrics", methods=['POST'])
+def report_client_metrics():
+    """Record how many retries a client needed for one request"""
+    data = request.get_json(silent=True) or {}
+    endpoint = data.get('endpoint')
+    retries = data.get('retries')
+    outcome = data.get('outcome')
+
+    if (not isinstance(endpoint, str) or not isinstance(retries, int) or isinstance(retries, bool)
+            or not 0 <= retries <= 1000 or outcome not in ("success", "failed")):
+        return jsonify({"error": "Expected endpoint, retries and outcome (success or failed)", "status": "error"}), 400
+
+    metrics.observe_client_request(client_metrics_route(endpoint), outcome, retries)
+    return jsonify({"status": "success"})
+
+@app.route("/client-metrics", methods=['GET'])
+def get_client_metrics():
+    """Get client-reported retry counts per route and outcome, across worker processes"""
+    if not metrics.METRICS_ENABLED:
+        return jsonify({"error": "Metrics are disabled or prometheus_client is not installed",
+                        "status": "error"}), 503
+    client_metrics = [
+        {"endpoint": route, "outcome": outcome, **entry}
+        for (route, outcome), entry in sorted(metrics.client_totals().items())
+    ]
+    return jsonify({"client_metrics": client_metrics, "status": "success"})
+
+@app.route("/metrics", methods=['GET'])
+def get_metrics():
+    """Prometheus metrics, aggregated across worker processes"""
+    if not metrics.METRICS_ENABLED:
+        return jsonify({"error": "Metrics are disabled or prometheus_client is not installed",
+                        "status": "error"}), 503
+    body, content_type = metrics.render()
+    return Response(body, content_type=content_type)
+
 if __name__ == "__main__":
     app.run(host="0.0.0.0", port=5000, debug=True)
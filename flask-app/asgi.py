@@ -0,0 +1,535 @@
+"""ASGI entry point for the sentiment API
+
+The hot routes (/predict, /batch-predict, /health, /stats) are served natively:
+scoring runs on the interactive or bulk lane of app.score_scheduler and
+database work is offloaded to a bounded pool of DB threads that each keep one
+connection open, so a single process can hold thousands of requests in flight
+while only the pool sizes bound the work actually running. Every other route is handed to the Flask app
+on a WSGI thread, so the routes and JSON contracts are the same as app.py.
+Admission control (app.admission_controller) is applied once here, before a
+request is routed either way. /predict calls with an Idempotency-Key are also
+handed to Flask, since they may block waiting for a duplicate.
+
+Native routes read the whole body, up to ASGI_MAX_BODY_BYTES. Flask reads its
+body from wsgi.input as it goes, which pulls each chunk from the client only
+when asked, so uploads like /reviews/import are never held in memory whole.
+
+Run with:
+    uvicorn asgi:application --host 0.0.0.0 --port 5000 --workers 4
+"""
+import asyncio
+import io
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from werkzeug.datastructures import Headers
+
+import admission
+import app as wsgi
+import metrics
+import model
+import slowlog
+import structured_log
+import timing
+import traffic
+from admission import DeadlineExceeded
+from scheduler import LaneFull, text_cost
+
+ASGI_DB_THREADS = int(os.getenv("ASGI_DB_THREADS", "16"))
+ASGI_WSGI_THREADS = int(os.getenv("ASGI_WSGI_THREADS", "16"))
+ASGI_MAX_BODY_BYTES = int(os.getenv("ASGI_MAX_BODY_BYTES", str(10 * 1024 * 1024)))
+
+log = structured_log.get_logger("asgi")
+
+_db_pool = ThreadPoolExecutor(ASGI_DB_THREADS, thread_name_prefix="asgi-db")
+_wsgi_pool = ThreadPoolExecutor(ASGI_WSGI_THREADS, thread_name_prefix="asgi-wsgi")
+_local = threading.local()
+
+
+class DatabaseUnavailable(Exception):
+    pass
+
+
+class BodyTooLarge(Exception):
+    pass
+
+
+def _with_connection(fn, *args):
+    """Run fn(conn, *args) on a DB thread, reusing that thread's connection"""
+    metrics.POOL_BUSY.labels("asgi-db").inc()
+    conn = getattr(_local, "conn", None)
+    try:
+        if conn is None:
+            conn = wsgi.get_db_connection()
+            if conn is None:
+                raise DatabaseUnavailable()
+            _local.conn = conn
+        result = fn(conn, *args)
+        # Close the read transaction so the kept connection does not sit idle in one
+        conn.rollback()
+        return result
+    except DatabaseUnavailable:
+        raise
+    except Exception:
+        _local.conn = None
+        try:
+            conn.close()
+        except Exception:
+            pass
+        raise
+    finally:
+        metrics.POOL_BUSY.labels("asgi-db").dec()
+
+
+async def run_db(fn, *args):
+    return await asyncio.get_running_loop().run_in_executor(_db_pool, _with_connection, fn, *args)
+
+
+def api_key(scope):
+    for name, value in scope.get("headers", []):
+        if name == b"x-api-key":
+            return value.decode("latin-1")
+    return None
+
+
+def content_type(scope):
+    for name, value in scope.get("headers", []):
+        if name == b"content-type":
+            return value.decode("latin-1")
+    return None
+
+
+async def run_score(scope, cost, fn, *args):
+    future = wsgi.score_scheduler.submit(cost, fn, *args, deadline=scope.get("sentiment.deadline"))
+    return await asyncio.wrap_future(future)
+
+
+async def read_body(receive, limit=None):
+    """The whole request body; raises BodyTooLarge as soon as it passes limit bytes"""
+    chunks = []
+    size = 0
+    more_body = True
+    while more_body:
+        message = await receive()
+        chunk = message.get("body", b"")
+        size += len(chunk)
+        if limit is not None and size > limit:
+            raise BodyTooLarge()
+        chunks.append(chunk)
+        more_body = message.get("more_body", False)
+    return b"".join(chunks)
+
+
+class RequestBody(io.RawIOBase):
+    """wsgi.input for a WSGI thread, receiving the next body chunk only when read
+
+    Starts with buffered, the part of the body already received; more_body is
+    False when that is all of it.
+    """
+
+    def __init__(self, receive, loop, buffered=b"", more_body=True):
+        self._receive = receive
+        self._loop = loop
+        self._pending = memoryview(buffered)
+        self._more_body = more_body
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        while not self._pending and self._more_body:
+            message = asyncio.run_coroutine_threadsafe(self._receive(), self._loop).result()
+            # A client that disconnects ends the body
+            self._pending = memoryview(message.get("body", b""))
+            self._more_body = message["type"] == "http.request" and message.get("more_body", False)
+        size = min(len(buffer), len(self._pending))
+        buffer[:size] = self._pending[:size]
+        self._pending = self._pending[size:]
+        return size
+
+
+async def send_json(send, payload, status=200, headers=None):
+    # Timings are also collected for the slow request log; only SERVER_TIMING sends them
+    request_timing = timing.current() if timing.SERVER_TIMING else None
+    if timing.SERVER_TIMING_BODY and isinstance(payload, dict) and request_timing is not None:
+        payload = dict(payload, _timing=request_timing.as_dict())
+    # Same compact, sorted output as jsonify
+    body = (wsgi.app.json.dumps(payload, separators=(",", ":")) + "\n").encode("utf-8")
+    response_headers = [
+        (b"content-type", b"application/json"),
+        (b"content-length", str(len(body)).encode()),
+        (b"access-control-allow-origin", b"*"),
+        (b"access-control-expose-headers", b"Retry-After, Server-Timing"),
+    ]
+    if request_timing is not None:
+        response_headers.append((b"server-timing", request_timing.header().encode("latin-1")))
+        response_headers.append((b"timing-allow-origin", b"*"))
+    for name, value in (headers or {}).items():
+        response_headers.append((name.lower().encode("latin-1"), value.encode("latin-1")))
+    await send({"type": "http.response.start", "status": status, "headers": response_headers})
+    await send({"type": "http.response.body", "body": body})
+
+
+async def send_rejection(send, rejection):
+    await send_json(send, rejection.payload(), rejection.status, rejection.headers())
+
+
+def parse_json(body):
+    try:
+        return wsgi.app.json.loads(body) if body else None
+    except ValueError:
+        return None
+
+
+async def predict(scope, body, send):
+    with timing.phase("parse"):
+        data = parse_json(body)
+    if not isinstance(data, dict) or not isinstance(data.get("text"), str):
+        return await send_json(send, {"error": "No text provided", "status": "error"}, 400)
+
+    text = data["text"].strip()
+    if not text:
+        return await send_json(send, {"error": "Text cannot be empty", "status": "error"}, 400)
+    timing.note_texts([text])
+
+    try:
+        analyzer = wsgi.select_analyzer(data.get("overlay"), api_key(scope))
+    except model.UnknownOverlay as e:
+        return await send_json(send, {"error": f"Unknown lexicon overlay: {e}", "status": "error"}, 400)
+
+    # Micro-batches share one analyzer, so overlay requests are scored on their own
+    if (wsgi.predict_batcher is not None and analyzer.name is None
+            and wsgi.score_scheduler.classify(len(text)) == "interactive"):
+        # Scored and stored together with other concurrent requests
+        try:
+            with timing.phase("batch"):
+                sentiment, confidence, review_id, created_at = await asyncio.wrap_future(
+                    wsgi.predict_batcher.submit(text))
+        except Exception as e:
+            return await send_json(send, {"error": f"Prediction error: {str(e)}", "status": "error"}, 500)
+        if review_id is not None:
+            return await send_json(send, stored_response(text, sentiment, confidence, review_id, created_at))
+        return await send_json(send, unstored_response(text, sentiment, confidence))
+
+    try:
+        with timing.phase("score"):
+            sentiment, confidence = await run_score(scope, len(text), wsgi.predict_sentiment, text, analyzer)
+    except LaneFull:
+        return await send_rejection(send, wsgi.BUSY)
+    except DeadlineExceeded:
+        return await send_rejection(send, wsgi.DEADLINE_EXCEEDED)
+    except Exception as e:
+        return await send_json(send, {"error": f"Prediction error: {str(e)}", "status": "error"}, 500)
+
+    try:
+        # The DB thread cannot see this request's timing, so the whole round trip is one phase
+        with timing.phase("db"):
+            review_id, created_at = await run_db(wsgi.store_review, text, sentiment, confidence,
+                                                 analyzer.version)
+        return await send_json(send, stored_response(text, sentiment, confidence, review_id, created_at))
+    except DatabaseUnavailable:
+        pass
+    except Exception as db_error:
+        log.warning("db_store_failed", error=str(db_error))
+
+    await send_json(send, unstored_response(text, sentiment, confidence))
+
+
+def stored_response(text, sentiment, confidence, review_id, created_at):
+    return {
+        "id": review_id,
+        "text": text,
+        "sentiment": sentiment,
+        "confidence_score": confidence,
+        "created_at": created_at,
+        "database": "stored",
+        "status": "success"
+    }
+
+
+def unstored_response(text, sentiment, confidence):
+    return {
+        "text": text,
+        "sentiment": sentiment,
+        "confidence_score": confidence,
+        "database": "not_available",
+        "status": "success"
+    }
+
+
+async def batch_predict(scope, body, send):
+    with timing.phase("parse"):
+        data = parse_json(body)
+    if not isinstance(data, dict) or not isinstance(data.get("texts"), list):
+        return await send_json(send, {"error": "No texts array provided", "status": "error"}, 400)
+
+    texts = [text.strip() for text in data["texts"] if text.strip()]
+    if not texts:
+        return await send_json(send, {"error": "No valid texts provided", "status": "error"}, 400)
+    timing.note_texts(texts)
+
+    mode = data.get("mode", "full")
+    if mode not in model.SCORING_MODES:
+        return await send_json(send, {"error": wsgi.MODE_ERROR, "status": "error"}, 400)
+    try:
+        analyzer = wsgi.select_analyzer(data.get("overlay"), api_key(scope), mode)
+    except model.UnknownOverlay as e:
+        return await send_json(send, {"error": f"Unknown lexicon overlay: {e}", "status": "error"}, 400)
+
+    try:
+        with timing.phase("score"):
+            results = await run_score(scope, text_cost(texts), wsgi.score_texts, texts, analyzer)
+    except LaneFull:
+        return await send_rejection(send, wsgi.BUSY)
+    except DeadlineExceeded:
+        return await send_rejection(send, wsgi.DEADLINE_EXCEEDED)
+    await send_json(send, {
+        "results": results,
+        "total_processed": len(results),
+        "mode": mode,
+        "status": "success"
+    })
+
+
+def _ping(conn):
+    cur = conn.cursor()
+    cur.execute("SELECT 1;")
+    cur.close()
+
+
+async def health(scope, body, send):
+    try:
+        await run_db(_ping)
+        db_status = "connected"
+    except Exception:
+        db_status = "disconnected"
+
+    await send_json(send, {
+        "status": "healthy",
+        "database": db_status,
+        "nltk": wsgi.analyzer_status(),
+        "analyzer_version": model.active().version,
+        "environment": "local" if wsgi.DB_TYPE == "sqlite" else "docker",
+        "timestamp": wsgi.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    })
+
+
+async def stats(scope, body, send):
+    try:
+        statistics = await run_db(wsgi.read_stats)
+    except DatabaseUnavailable:
+        return await send_json(send, {
+            "statistics": {
+                "total_reviews": 0,
+                "sentiment_distribution": {},
+                "latest_review_date": "No database connection",
+                "environment": "local" if wsgi.DB_TYPE == "sqlite" else "docker",
+                "database_status": "disconnected"
+            },
+            "status": "success"
+        })
+    except Exception as e:
+        return await send_json(send, {"error": f"Database error: {str(e)}", "status": "error"}, 500)
+
+    await send_json(send, {"statistics": statistics, "status": "success"})
+
+
+ROUTES = {
+    ("POST", "/predict"): predict,
+    ("POST", "/batch-predict"): batch_predict,
+    ("GET", "/health"): health,
+    ("GET", "/stats"): stats,
+}
+
+
+def build_environ(scope, stream):
+    """Translate an ASGI HTTP scope and its body stream into a WSGI environ"""
+    server = scope.get("server") or ("localhost", 80)
+    client = scope.get("client") or ("", 0)
+    environ = {
+        "REQUEST_METHOD": scope["method"],
+        "SCRIPT_NAME": scope.get("root_path", "").encode("utf-8").decode("latin-1"),
+        "PATH_INFO": scope["path"].encode("utf-8").decode("latin-1"),
+        "QUERY_STRING": scope.get("query_string", b"").decode("latin-1"),
+        "SERVER_NAME": server[0],
+        "SERVER_PORT": str(server[1]),
+        "REMOTE_ADDR": client[0],
+        "SERVER_PROTOCOL": f"HTTP/{scope.get('http_version', '1.1')}",
+        "wsgi.version": (1, 0),
+        "wsgi.url_scheme": scope.get("scheme", "http"),
+        "wsgi.input": stream,
+        # The stream ends with the body, so Flask may read it without a Content-Length
+        "wsgi.input_terminated": True,
+        "wsgi.errors": sys.stderr,
+        "wsgi.multithread": True,
+        "wsgi.multiprocess": True,
+        "wsgi.run_once": False,
+        "sentiment.admitted": scope.get("sentiment.admitted", False),
+        "sentiment.deadline": scope.get("sentiment.deadline"),
+        "sentiment.recorded": scope.get("sentiment.recorded", False),
+    }
+    for name, value in scope.get("headers", []):
+        name = name.decode("latin-1").upper().replace("-", "_")
+        value = value.decode("latin-1")
+        if name in ("CONTENT_TYPE", "CONTENT_LENGTH"):
+            environ[name] = value
+        else:
+            key = f"HTTP_{name}"
+            environ[key] = f"{environ[key]},{value}" if key in environ else value
+    return environ
+
+
+async def call_wsgi(scope, receive, send, body=None):
+    """Serve a request with the Flask app on a WSGI thread, streaming its body and response
+
+    body is the whole request body when it was already read, else Flask
+    receives it chunk by chunk as it reads.
+    """
+    loop = asyncio.get_running_loop()
+    if body is None:
+        stream = RequestBody(receive, loop)
+    else:
+        stream = RequestBody(receive, loop, body, more_body=False)
+    environ = build_environ(scope, io.BufferedReader(stream))
+
+    def send_sync(message):
+        # Blocking on the event loop gives streamed responses natural backpressure
+        asyncio.run_coroutine_threadsafe(send(message), loop).result()
+
+    def run():
+        metrics.POOL_BUSY.labels("asgi-wsgi").inc()
+        try:
+            serve()
+        finally:
+            metrics.POOL_BUSY.labels("asgi-wsgi").dec()
+
+    def serve():
+        start = {}
+
+        def start_response(status, headers, exc_info=None):
+            start["message"] = {
+                "type": "http.response.start",
+                "status": int(status.split(" ", 1)[0]),
+                "headers": [(k.lower().encode("latin-1"), v.encode("latin-1")) for k, v in headers],
+            }
+
+        result = wsgi.app(environ, start_response)
+        try:
+            started = False
+            for chunk in result:
+                if not started:
+                    send_sync(start["message"])
+                    started = True
+                if chunk:
+                    send_sync({"type": "http.response.body", "body": chunk, "more_body": True})
+            if not started:
+                send_sync(start["message"])
+            send_sync({"type": "http.response.body", "body": b"", "more_body": False})
+        finally:
+            if hasattr(result, "close"):
+                result.close()
+
+    await loop.run_in_executor(_wsgi_pool, run)
+
+
+async def lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message["type"] == "lifespan.startup":
+            await send({"type": "lifespan.startup.complete"})
+        elif message["type"] == "lifespan.shutdown":
+            for pool in (_db_pool, _wsgi_pool):
+                pool.shutdown(wait=False)
+            await send({"type": "lifespan.shutdown.complete"})
+            return
+
+
+async def application(scope, receive, send):
+    if scope["type"] == "lifespan":
+        return await lifespan(receive, send)
+    if scope["type"] != "http":
+        return
+
+    started = time.perf_counter()
+    status = []
+
+    async def timed_send(message):
+        if message["type"] == "http.response.start":
+            status.append(message["status"])
+        await send(message)
+
+    served_by_flask = False
+    route = scope["path"] if (scope["method"], scope["path"]) in ROUTES else "unmatched"
+    token = timing.start() if timing.SERVER_TIMING or slowlog.SLOW_LOG_ENABLED else None
+    if token is not None:
+        timing.note("route", route)
+    try:
+        served_by_flask = await admit_and_route(scope, receive, timed_send)
+    finally:
+        # Flask times and slow-logs the requests it serves; everything else is handled here
+        if status and not served_by_flask:
+            metrics.observe_request(route, scope["method"], status[0], time.perf_counter() - started)
+            if token is not None:
+                slowlog.check_request(timing.current(), route, scope["method"], status[0])
+        if token is not None:
+            timing.finish(token)
+
+
+async def admit_and_route(scope, receive, send):
+    """Apply admission control and serve the request; True when Flask served it"""
+    admitted = False
+    if (admission.ADMISSION_CONTROL and scope["method"] != "OPTIONS"
+            and scope["path"] not in wsgi.ADMISSION_EXEMPT_PATHS):
+        headers = Headers([(k.decode("latin-1"), v.decode("latin-1")) for k, v in scope.get("headers", [])])
+        client = scope.get("client") or ("", 0)
+        rejection = wsgi.admission_controller.admit(admission.client_key(headers, client[0]))
+        if rejection is not None:
+            await send_rejection(send, rejection)
+            return False
+        scope = dict(scope, **{
+            "sentiment.admitted": True,
+            "sentiment.deadline": admission.request_deadline(headers),
+        })
+        admitted = True
+
+    try:
+        handler = ROUTES.get((scope["method"], scope["path"]))
+        if handler is predict and any(name == b"idempotency-key" for name, _ in scope.get("headers", [])):
+            # Keyed submissions may wait on a duplicate, so they take the blocking Flask path
+            handler = None
+        if handler is None:
+            body = None
+            if traffic.recorder is not None and traffic.records_body(scope["path"], content_type(scope)):
+                body = await read_body(receive)
+            await call_wsgi(record_traffic(scope, body), receive, send, body)
+            return True
+
+        try:
+            body = await read_body(receive, ASGI_MAX_BODY_BYTES)
+        except BodyTooLarge:
+            record_traffic(scope, None)
+            await send_json(send, {"error": "Request body too large", "status": "error"}, 413)
+            return False
+        await handler(record_traffic(scope, body), body, send)
+        return False
+    finally:
+        if admitted:
+            wsgi.admission_controller.release()
+
+
+def record_traffic(scope, body):
+    """Log the request to the traffic recorder, if on; the scope to serve it with
+
+    body is None for a body that was not read, which is logged by its length.
+    """
+    if traffic.recorder is None:
+        return scope
+    headers = Headers([(k.decode("latin-1"), v.decode("latin-1")) for k, v in scope.get("headers", [])])
+    if not traffic.records_body(scope["path"], headers.get("Content-Type")):
+        body = None
+    traffic.record(scope["method"], scope["path"], scope.get("query_string", b"").decode("latin-1"),
+                   headers, (scope.get("client") or ("", 0))[0], body)
+    return dict(scope, **{"sentiment.recorded": True})
@@ -0,0 +1,105 @@
+"""Adaptive micro-batching of concurrent requests
+
+Callers submit single items and get a Future back. One background thread
+collects items that arrive close together and hands them to process_batch as a
+list, then resolves each Future with its own result.
+
+The collection window adapts to the arrival rate: the batcher keeps an
+exponentially weighted average of the gap between arrivals and only waits when
+another item is expected within max_wait. At low load a lone request is
+processed straight away, so its latency is unchanged; at high load batches
+fill up to max_items within at most max_wait.
+"""
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+PREDICT_BATCH_MAX_ITEMS = int(os.getenv("PREDICT_BATCH_MAX_ITEMS", "64"))
+PREDICT_BATCH_MAX_WAIT_MS = float(os.getenv("PREDICT_BATCH_MAX_WAIT_MS", "5"))
+
+
+class MicroBatcher:
+    """Groups concurrently submitted items into batches for process_batch"""
+
+    def __init__(self, process_batch, max_items=PREDICT_BATCH_MAX_ITEMS,
+                 max_wait=PREDICT_BATCH_MAX_WAIT_MS / 1000, smoothing=0.2):
+        self.process_batch = process_batch
+        self.max_items = max_items
+        self.max_wait = max_wait
+        self.smoothing = smoothing
+        self.avg_gap = None
+        self.last_arrival = None
+        self.batches = 0
+        self.items = 0
+        self._queue = queue.SimpleQueue()
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def submit(self, item):
+        """Queue one item; the Future resolves to process_batch's result for it"""
+        future = Future()
+        now = time.monotonic()
+        with self._lock:
+            if self.last_arrival is not None:
+                gap = now - self.last_arrival
+                self.avg_gap = gap if self.avg_gap is None else (
+                    self.smoothing * gap + (1 - self.smoothing) * self.avg_gap)
+            self.last_arrival = now
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="micro-batcher", daemon=True)
+                self._thread.start()
+        self._queue.put((item, future))
+        return future
+
+    def window(self, batch_size):
+        """How long to keep collecting given the current arrival rate"""
+        if self.avg_gap is None or self.avg_gap >= self.max_wait:
+            return 0.0
+        # Enough time for the rest of the batch to arrive, never more than max_wait
+        return min(self.max_wait, self.avg_gap * (self.max_items - batch_size))
+
+    def _collect(self):
+        batch = [self._queue.get()]
+        # Take whatever is already waiting without blocking
+        while len(batch) < self.max_items:
+            try:
+                batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+
+        deadline = time.monotonic() + self.window(len(batch))
+        while len(batch) < self.max_items:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            items = [item for item, _ in batch]
+            try:
+                results = self.process_batch(items)
+            except Exception as e:
+                for _, future in batch:
+                    future.set_exception(e)
+                continue
+            for (_, future), result in zip(batch, results):
+                future.set_result(result)
+            self.batches += 1
+            self.items += len(batch)
+
+    def stats(self):
+        return {
+            "batches": self.batches,
+            "items": self.items,
+            "avg_batch_size": round(self.items / self.batches, 2) if self.batches else None,
+            "avg_gap_ms": round(self.avg_gap * 1000, 3) if self.avg_gap is not None else None,
+            "window_ms": round(self.window(1) * 1000, 3),
+        }
@@ -0,0 +1,113 @@
+"""Benchmark the fast scoring mode: label agreement with full VADER and speedup
+
+Scores the same reviews with an analyzer and its FastAnalyzer (mode "fast":
+lexicon sums with simple negation) and reports, per corpus, how often the
+two give the same label, where they disagree, and reviews/sec for each. The
+corpora are corpus.py's synthetic reviews and, with --imdb, the IMDb reviews
+in a CSV or NDJSON file (as bulk_import.py reads them, e.g. "IMDB
+Dataset.csv") or an aclImdb directory of one-review .txt files.
+
+The full side is VADER. Where the vader_lexicon is not installed, NLTK's VADER
+engine is loaded with corpus.py's stand-in lexicon instead, so every rule
+still runs, and the output says "engine": "vader-stand-in"; agreement on the
+real lexicon should be measured where it is installed.
+
+Usage:
+    python benchmarks/bench_fast.py [--count 20000] [--seed 42]
+                                    [--imdb "IMDB Dataset.csv"] [--limit 50000]
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+from collections import Counter
+from itertools import islice
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import bulk_import  # noqa: E402
+import corpus  # noqa: E402
+import model  # noqa: E402
+
+
+def full_analyzer():
+    """(engine name, full VADER analyzer)"""
+    from nltk.sentiment import SentimentIntensityAnalyzer
+    try:
+        return "vader", model.compile_analyzer("vader", {})
+    except LookupError:
+        pass
+    with tempfile.NamedTemporaryFile("w", suffix=".txt", delete=False) as f:
+        # VADER's tab-separated format; no trailing newline, which its reader would choke on
+        f.write("\n".join(f"{word}\t{valence}\t0.0\t[]" for word, valence in corpus.load_lexicon().items()))
+    try:
+        sia = SentimentIntensityAnalyzer(lexicon_file=f"file:{f.name}")
+    finally:
+        os.remove(f.name)
+    return "vader-stand-in", model.Analyzer("vader", sia)
+
+
+def imdb_texts(path, limit):
+    """Review texts from a CSV/NDJSON file or an aclImdb directory tree"""
+    if os.path.isdir(path):
+        def read():
+            for root, _, files in sorted(os.walk(path)):
+                for name in sorted(files):
+                    if name.endswith(".txt") and os.path.basename(root) in ("pos", "neg"):
+                        with open(os.path.join(root, name), encoding="utf-8") as f:
+                            yield f.read().replace("<br />", " ").strip()
+        texts = read()
+    else:
+        fmt = "ndjson" if path.endswith((".ndjson", ".jsonl")) else "csv"
+        f = open(path, newline="", encoding="utf-8")
+        texts = (text for text, _ in bulk_import.read_records(f, fmt))
+    return [text for text in islice(texts, limit) if text]
+
+
+def timed(score, texts):
+    started = time.perf_counter()
+    labels = [score(text)[0] for text in texts]
+    return labels, len(texts) / (time.perf_counter() - started)
+
+
+def compare(name, analyzer, texts):
+    # Warm both up, so neither pays for first-call costs in its timing
+    for text in texts[:100]:
+        analyzer.score(text)
+        analyzer.fast.score(text)
+    full, full_rate = timed(analyzer.score, texts)
+    fast, fast_rate = timed(analyzer.fast.score, texts)
+    pairs = Counter(zip(full, fast))
+    agree = sum(count for (a, b), count in pairs.items() if a == b)
+    return {
+        "corpus": name,
+        "reviews": len(texts),
+        "agreement": round(agree / len(texts), 4),
+        "disagreements": {f"{a}->{b}": count for (a, b), count in pairs.most_common() if a != b},
+        "full_reviews_per_sec": round(full_rate, 1),
+        "fast_reviews_per_sec": round(fast_rate, 1),
+        "speedup": round(fast_rate / full_rate, 2),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--count", type=int, default=20_000, help="synthetic reviews to score")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--imdb", help="IMDb reviews: CSV/NDJSON file or aclImdb directory")
+    parser.add_argument("--limit", type=int, default=50_000, help="most IMDb reviews to score")
+    args = parser.parse_args()
+
+    engine, analyzer = full_analyzer()
+    corpora = {"synthetic": [text for batch in corpus.batches(args.count, seed=args.seed) for text, _, _ in batch]}
+    if args.imdb:
+        corpora["imdb"] = imdb_texts(args.imdb, args.limit)
+    for name, texts in corpora.items():
+        print(json.dumps({"engine": engine, "version": analyzer.version, **compare(name, analyzer, texts)}))
+        sys.stdout.flush()
+
+
+if __name__ == "__main__":
+    main()
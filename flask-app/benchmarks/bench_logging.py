@@ -0,0 +1,108 @@
+"""Per-request overhead of the structured logger
+
+Serves the same POST /predict requests through the Flask test client (no
+network, SQLite on tmpfs) in fresh processes with request-path logging off
+(LOG_LEVEL=INFO, the default), on (LOG_LEVEL=DEBUG: a db_connected event per
+request) and on but sampled at 1%, and reports the mean time per request and
+the difference from the default. Log output goes to a file, as it would to a
+container log. Also times a single logging call in each mode against the
+synchronous print() it replaced.
+
+Usage:
+    python benchmarks/bench_logging.py [--requests 5000] [--rounds 3]
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+MODES = {
+    "off": {"LOG_LEVEL": "INFO"},
+    "on": {"LOG_LEVEL": "DEBUG"},
+    "sampled": {"LOG_LEVEL": "DEBUG", "LOG_SAMPLE_RATES": "db_connected=0.01"},
+}
+
+
+def measure(requests):
+    """Runs inside a child process configured through the environment"""
+    sys.path.insert(0, APP_DIR)
+    import app as wsgi
+    import structured_log
+
+    wsgi.init_db()
+    client = wsgi.app.test_client()
+    body = {"text": "This movie was absolutely fantastic! Great acting and storyline."}
+    for _ in range(200):
+        client.post("/predict", json=body)
+
+    start = time.perf_counter()
+    for _ in range(requests):
+        client.post("/predict", json=body)
+    per_request = (time.perf_counter() - start) / requests
+
+    # Fewer calls than LOG_QUEUE_SIZE, so nothing is dropped while timing
+    n = 5000
+    structured_log.flush()
+    log = structured_log.get_logger("bench")
+    start = time.perf_counter()
+    for i in range(n):
+        log.debug("db_connected", db_type="sqlite", method=i)
+    event_us = (time.perf_counter() - start) / n * 1e6
+    structured_log.flush()
+    start = time.perf_counter()
+    for i in range(n):
+        print(f"✅ Database connected using {i}", file=sys.stderr, flush=True)
+    print_us = (time.perf_counter() - start) / n * 1e6
+    structured_log.flush()
+    return {"per_request_us": round(per_request * 1e6, 1), "log_call_us": round(event_us, 3),
+            "print_call_us": round(print_us, 3), "dropped": structured_log.dropped()}
+
+
+def run_child(mode, requests):
+    # tmpfs when available, so fsync does not dominate the timings
+    tmp = tempfile.mkdtemp(dir="/dev/shm" if os.path.isdir("/dev/shm") else None)
+    env = dict(os.environ, DB_TYPE="sqlite", SQLITE_PATH=os.path.join(tmp, "bench.db"),
+               METRICS_ENABLED="0", ADMISSION_CONTROL="0")
+    env.pop("LOG_SAMPLE_RATES", None)
+    env.update(MODES[mode])
+    with open(os.path.join(tmp, "stderr.log"), "w") as stderr:
+        output = subprocess.run([sys.executable, __file__, "--child", "--requests", str(requests)],
+                                env=env, cwd=APP_DIR, check=True, stdout=subprocess.PIPE,
+                                stderr=stderr, text=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=5000)
+    parser.add_argument("--rounds", type=int, default=3)
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        print(json.dumps(measure(args.requests)))
+        return
+
+    best = {}
+    for _ in range(args.rounds):
+        for mode in MODES:
+            result = run_child(mode, args.requests)
+            if mode not in best or result["per_request_us"] < best[mode]["per_request_us"]:
+                best[mode] = result
+
+    baseline = best["off"]["per_request_us"]
+    for mode in MODES:
+        result = best[mode]
+        result["overhead_us"] = round(result["per_request_us"] - baseline, 1)
+        result["overhead_pct"] = round((result["per_request_us"] / baseline - 1) * 100, 2)
+        print(json.dumps({"mode": mode, "requests": args.requests, "rounds": args.rounds, **result}))
+        sys.stdout.flush()
+
+
+if __name__ == "__main__":
+    main()
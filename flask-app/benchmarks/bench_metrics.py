@@ -0,0 +1,105 @@
+"""Overhead of the /metrics instrumentation
+
+Serves the same POST /predict requests through the Flask test client (no
+network, SQLite in a temp file) in fresh processes with metrics disabled,
+enabled in single-process mode and enabled in multiprocess (mmap) mode, and
+reports the mean time per request and the difference. Each request commits to
+SQLite, so the modes are run in interleaved rounds and the best round of each
+is kept to keep disk noise out of the comparison. Also times the individual
+metric operations in each mode.
+
+Usage:
+    python benchmarks/bench_metrics.py [--requests 5000] [--rounds 3]
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def measure(requests):
+    """Runs inside a child process configured through the environment"""
+    sys.path.insert(0, APP_DIR)
+    import app as wsgi
+    import metrics
+
+    wsgi.init_db()
+    client = wsgi.app.test_client()
+    body = {"text": "This movie was absolutely fantastic! Great acting and storyline."}
+    for _ in range(200):
+        client.post("/predict", json=body)
+
+    start = time.perf_counter()
+    for _ in range(requests):
+        client.post("/predict", json=body)
+    per_request = (time.perf_counter() - start) / requests
+
+    ops = {}
+    if metrics.METRICS_ENABLED:
+        n = 100000
+        start = time.perf_counter()
+        for _ in range(n):
+            metrics.REQUESTS.labels("/predict", "POST", "200").inc()
+        ops["counter_inc_us"] = round((time.perf_counter() - start) / n * 1e6, 3)
+        start = time.perf_counter()
+        for _ in range(n):
+            metrics.REQUEST_LATENCY.labels("/predict", "POST", "200").observe(0.003)
+        ops["histogram_observe_us"] = round((time.perf_counter() - start) / n * 1e6, 3)
+        start = time.perf_counter()
+        for _ in range(100):
+            metrics.render()
+        ops["render_ms"] = round((time.perf_counter() - start) / 100 * 1000, 3)
+    return {"per_request_us": round(per_request * 1e6, 1), **ops}
+
+
+def run_child(mode, requests):
+    # tmpfs when available, so fsync does not dominate the timings
+    tmp = tempfile.mkdtemp(dir="/dev/shm" if os.path.isdir("/dev/shm") else None)
+    env = dict(os.environ, DB_TYPE="sqlite", SQLITE_PATH=os.path.join(tmp, "bench.db"),
+               METRICS_ENABLED="0" if mode == "disabled" else "1", ADMISSION_CONTROL="0")
+    env.pop("PROMETHEUS_MULTIPROC_DIR", None)
+    if mode == "multiprocess":
+        env["PROMETHEUS_MULTIPROC_DIR"] = os.path.join(tmp, "metrics")
+        os.makedirs(env["PROMETHEUS_MULTIPROC_DIR"])
+    output = subprocess.run([sys.executable, __file__, "--child", "--requests", str(requests)],
+                            env=env, cwd=APP_DIR, check=True, capture_output=True, text=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=5000)
+    parser.add_argument("--rounds", type=int, default=3)
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        print(json.dumps(measure(args.requests)))
+        return
+
+    modes = ("disabled", "single-process", "multiprocess")
+    best = {}
+    for _ in range(args.rounds):
+        for mode in modes:
+            result = run_child(mode, args.requests)
+            if mode not in best or result["per_request_us"] < best[mode]["per_request_us"]:
+                best[mode] = result
+
+    baseline = None
+    for mode in modes:
+        result = best[mode]
+        if baseline is None:
+            baseline = result["per_request_us"]
+        result["overhead_us"] = round(result["per_request_us"] - baseline, 1)
+        result["overhead_pct"] = round((result["per_request_us"] / baseline - 1) * 100, 2)
+        print(json.dumps({"mode": mode, "requests": args.requests, "rounds": args.rounds, **result}))
+        sys.stdout.flush()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,125 @@
+"""Goodput and tail latency under overload, with and without load shedding
+
+Drives a scoring lane (scheduler.Lane) with open-loop arrivals at a multiple of
+its capacity (2x by default) for a fixed time. Each request is served in
+service-ms on one of the lane's workers, and its client gives up after
+timeout-ms. Goodput counts only the responses that arrived before the client
+timed out.
+
+Two configurations are compared:
+
+* no shedding: an effectively unbounded queue and no deadlines, which is how
+  the API behaved before admission control. The queue grows for the whole
+  run, so latency climbs until almost every response comes after its client
+  has already given up.
+* shedding: the admission controller's concurrency limit rejects work at once
+  when the server is full, and queued work whose deadline has passed is
+  dropped rather than run.
+
+Usage:
+    python benchmarks/bench_overload.py [--workers 4] [--service-ms 10]
+                                        [--overload 2] [--duration 10] [--timeout-ms 1000]
+"""
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import admission  # noqa: E402
+import scheduler  # noqa: E402
+
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return None
+    return sorted_values[min(len(sorted_values) - 1, int(fraction * len(sorted_values)))]
+
+
+def run(args, shedding):
+    queue = args.workers * 4 if shedding else 10 ** 9
+    lane = scheduler.Lane("interactive", args.workers, queue)
+    controller = admission.AdmissionController(max_concurrency=args.workers + queue, rate=1e9, burst=1e9)
+    service = args.service_ms / 1000
+    timeout = args.timeout_ms / 1000
+    rate = args.workers / service * args.overload
+
+    lock = threading.Lock()
+    latencies, outcomes, pending = [], {"ok": 0, "late": 0, "rejected": 0, "shed": 0}, []
+
+    def finished(arrived, future):
+        controller.release()
+        elapsed = time.perf_counter() - arrived
+        with lock:
+            if future.cancelled():
+                outcomes["late"] += 1
+            elif isinstance(future.exception(), admission.DeadlineExceeded):
+                outcomes["shed"] += 1
+            elif elapsed > timeout:
+                outcomes["late"] += 1
+            else:
+                outcomes["ok"] += 1
+                latencies.append(elapsed)
+
+    started = time.perf_counter()
+    sent = 0
+    while True:
+        now = time.perf_counter()
+        if now - started >= args.duration:
+            break
+        # Submit every arrival that is due by now, then sleep until the next one
+        while sent < (now - started) * rate:
+            sent += 1
+            arrived = time.perf_counter()
+            if controller.admit("bench") is not None:
+                with lock:
+                    outcomes["rejected"] += 1
+                continue
+            deadline = time.monotonic() + timeout if shedding else None
+            future = lane.submit(time.sleep, service, deadline=deadline)
+            future.add_done_callback(lambda f, arrived=arrived: finished(arrived, f))
+            pending.append(future)
+        time.sleep(max(0.0, started + sent / rate - time.perf_counter()))
+
+    # Whatever has not finished one timeout after the run ends is late anyway
+    time.sleep(timeout)
+    for future in pending:
+        future.cancel()
+    for future in pending:
+        try:
+            future.result()
+        except Exception:
+            pass
+
+    latencies.sort()
+    return {
+        "shedding": shedding,
+        "offered_rps": round(rate, 1),
+        "capacity_rps": round(args.workers / service, 1),
+        "requests": sent,
+        "goodput_rps": round(outcomes["ok"] / args.duration, 1),
+        "p50_ms": round(percentile(latencies, 0.50) * 1000, 2) if latencies else None,
+        "p99_ms": round(percentile(latencies, 0.99) * 1000, 2) if latencies else None,
+        **outcomes,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--service-ms", type=float, default=10)
+    parser.add_argument("--overload", type=float, default=2, help="offered load as a multiple of capacity")
+    parser.add_argument("--duration", type=float, default=10)
+    parser.add_argument("--timeout-ms", type=float, default=1000, help="how long a client waits")
+    args = parser.parse_args()
+
+    for shedding in (False, True):
+        print(json.dumps(run(args, shedding)))
+        sys.stdout.flush()
+
+
+if __name__ == "__main__":
+    main()
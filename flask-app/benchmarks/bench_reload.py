@@ -0,0 +1,80 @@
+"""Benchmark analyzer hot reload: /predict latency while the analyzer is swapped
+
+Starts the WSGI app with ANALYZER_CONFIG_PATH watched every --watch seconds
+and drives closed-loop POST /predict load twice: once with the config left
+alone, once while the lexicon in it is rewritten every --interval seconds, so
+each worker builds, validates and swaps in a new analyzer under load. Prints
+one JSON object per round; the reload round should match the steady one.
+
+Usage:
+    python benchmarks/bench_reload.py [--workers 1] [--concurrency 16]
+                                      [--duration 10] [--interval 0.5]
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+
+from bench_serving import drive, start_server, wait_ready
+
+PORT = 5121
+
+
+def write_config(path, valence):
+    tmp = path + ".tmp"
+    with open(tmp, "w") as f:
+        json.dump({"lexicon": {"meh": valence, "watchable": -valence}}, f)
+    os.replace(tmp, path)
+
+
+def rewrite(path, interval, stop, counter):
+    """Flip the lexicon every interval seconds until stop is set"""
+    while not stop.wait(interval):
+        counter[0] += 1
+        write_config(path, 2 if counter[0] % 2 else -2)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--threads", type=int, default=8, help="gunicorn threads per worker")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--duration", type=float, default=10)
+    parser.add_argument("--interval", type=float, default=0.5, help="seconds between config rewrites")
+    parser.add_argument("--watch", type=float, default=0.1, help="ANALYZER_WATCH_SECONDS for the server")
+    args = parser.parse_args()
+
+    tmp = tempfile.mkdtemp(dir="/dev/shm" if os.path.isdir("/dev/shm") else None)
+    config_path = os.path.join(tmp, "analyzer.json")
+    write_config(config_path, -2)
+    # All load comes from one client, which per-client admission would throttle
+    os.environ.update(ANALYZER_CONFIG_PATH=config_path, ANALYZER_WATCH_SECONDS=str(args.watch),
+                      ADMISSION_CONTROL="0", LOG_LEVEL="ERROR")
+    server = start_server("wsgi", PORT, argparse.Namespace(workers=args.workers, threads=args.threads,
+                                                           microbatch=False), os.path.join(tmp, "reload.db"))
+    try:
+        asyncio.run(wait_ready(PORT))
+        time.sleep(1)
+        for reloading in (False, True):
+            stop, counter = threading.Event(), [0]
+            writer = threading.Thread(target=rewrite, args=(config_path, args.interval, stop, counter))
+            if reloading:
+                writer.start()
+            result = asyncio.run(drive("127.0.0.1", PORT, args.concurrency, args.duration))
+            stop.set()
+            if reloading:
+                writer.join()
+            print(json.dumps({"reloading": reloading, "config_rewrites": counter[0], "workers": args.workers,
+                              "concurrency": args.concurrency, **result}))
+            sys.stdout.flush()
+    finally:
+        server.terminate()
+        server.wait()
+
+
+if __name__ == "__main__":
+    main()
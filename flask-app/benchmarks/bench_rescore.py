@@ -0,0 +1,105 @@
+"""Benchmark background rescoring: rows/sec and its cost to foreground latency
+
+Starts the WSGI app on a throwaway SQLite database seeded with corpus.py
+reviews marked as scored by an older analyzer, measures POST /predict
+latency with no rescorer running, then again while `rescore.py run --once`
+works through the backlog at each --duty limit. Versions are reset between
+rounds so every round starts with the full backlog. One JSON object per round.
+
+Usage:
+    python benchmarks/bench_rescore.py [--rows 200000] [--duty 0.1 0.2 0.5 1.0]
+                                       [--batch-size 500] [--concurrency 16] [--duration 10]
+"""
+import argparse
+import asyncio
+import json
+import os
+import signal
+import sqlite3
+import subprocess
+import sys
+import tempfile
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import corpus  # noqa: E402
+import rollup  # noqa: E402
+from bench_serving import APP_DIR, drive, start_server, wait_ready  # noqa: E402
+
+PORT = 5111
+OLD_VERSION = "bench-old"
+
+
+def seed(path, rows):
+    """Create the app's schema and add rows corpus reviews, labelled with their intended sentiment"""
+    env = dict(os.environ, DB_TYPE="sqlite", SQLITE_PATH=path, LOG_LEVEL="ERROR")
+    subprocess.run([sys.executable, "-c", "import app"], cwd=APP_DIR, env=env, check=True)
+    conn = sqlite3.connect(path)
+    cur = conn.cursor()
+    for batch in corpus.batches(rows, seed=7):
+        values = [(text, label, 0.5, created_at.replace("T", " ").rstrip("Z"), OLD_VERSION)
+                  for text, label, created_at in batch]
+        cur.executemany("INSERT INTO reviews (text, sentiment, confidence_score, created_at, analyzer_version) "
+                        "VALUES (?, ?, ?, ?, ?);", values)
+        rollup.apply(cur, "sqlite", [(row[3], row[1], row[2]) for row in values])
+    conn.commit()
+    conn.close()
+
+
+def reset(path):
+    conn = sqlite3.connect(path)
+    conn.execute("UPDATE reviews SET analyzer_version = ?;", (OLD_VERSION,))
+    conn.execute("DELETE FROM rescore_checkpoints;")
+    conn.commit()
+    conn.close()
+
+
+def start_rescorer(path, duty, batch_size):
+    env = dict(os.environ, DB_TYPE="sqlite", SQLITE_PATH=path, LOG_LEVEL="ERROR")
+    return subprocess.Popen([sys.executable, "rescore.py", "run", "--once", "--max-duty", str(duty),
+                             "--batch-size", str(batch_size)],
+                            cwd=APP_DIR, env=env, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=200_000)
+    parser.add_argument("--duty", type=float, nargs="+", default=[0.1, 0.2, 0.5, 1.0])
+    parser.add_argument("--batch-size", type=int, default=500, help="rows per rescoring batch")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--duration", type=float, default=10)
+    parser.add_argument("--threads", type=int, default=8, help="gunicorn threads")
+    args = parser.parse_args()
+
+    path = os.path.join(tempfile.mkdtemp(dir="/dev/shm" if os.path.isdir("/dev/shm") else None), "rescore.db")
+    seed(path, args.rows)
+    # All load comes from one client, which per-client admission would throttle
+    os.environ["ADMISSION_CONTROL"] = "0"
+    server = start_server("wsgi", PORT, argparse.Namespace(workers=1, threads=args.threads, microbatch=False), path)
+    try:
+        asyncio.run(wait_ready(PORT))
+
+        result = asyncio.run(drive("127.0.0.1", PORT, args.concurrency, args.duration))
+        print(json.dumps({"rescorer": None, "rows": args.rows, **result}))
+        sys.stdout.flush()
+
+        for duty in args.duty:
+            reset(path)
+            rescorer = start_rescorer(path, duty, args.batch_size)
+            result = asyncio.run(drive("127.0.0.1", PORT, args.concurrency, args.duration))
+            if rescorer.poll() is None:
+                rescorer.send_signal(signal.SIGINT)
+            stats = json.loads(rescorer.communicate()[0].strip().splitlines()[-1])
+            print(json.dumps({"rescorer": {"max_duty": duty, "batch_size": args.batch_size,
+                                           "rows_rescored": stats["rows_rescored"],
+                                           "rows_per_sec": stats["rows_per_sec"],
+                                           "pass_complete": stats["pass_complete"]},
+                              "rows": args.rows, **result}))
+            sys.stdout.flush()
+    finally:
+        server.terminate()
+        server.wait()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,175 @@
+"""Micro-benchmarks for the scoring engine
+
+Times model.predict_sentiment (whichever analyzer the app picked), the same
+analyzer with a word-only and a phrase lexicon overlay compiled in, the VADER
+SentimentIntensityAnalyzer (skipped when the vader_lexicon is not installed)
+and the SimpleSentimentAnalyzer fallback on generated texts of 10, 100, 1k and
+10k tokens, and on 100-token emoticon-heavy, ALL-CAPS, idiom-heavy and
+negation-heavy texts. No network or database is involved.
+
+For every scorer and input it records calls per second, p50/p99 latency per
+call and the peak bytes allocated by one call (tracemalloc, measured on a
+separate pass so tracing does not slow the timed calls), and writes them to a
+JSON file. With --baseline it compares against an earlier file, flags every
+case whose ops/sec fell or p50 rose by more than --threshold, and exits 1 if
+any did.
+
+Usage:
+    python benchmarks/bench_scoring.py [--output scoring.json] [--min-time 0.5]
+    python benchmarks/bench_scoring.py --baseline scoring.json --threshold 0.1
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import model  # noqa: E402
+
+WORDS = ("the movie plot was acting story scenes director film cast characters script ending music "
+         "good great boring bad loved hated really very slow fun dark long").split()
+EMOTICONS = (":)", ":(", ":D", ";)", ":-)", ":'(", "<3", ":P", "xD", ":/")
+IDIOMS = ("the bomb", "kiss of death", "yeah right", "cut the mustard", "hand to mouth",
+          "bad ass", "the shit", "break a leg", "beating a dead horse")
+NEGATIONS = ("not good", "isn't bad", "never boring", "don't like", "wasn't great", "without fun",
+             "not terrible", "can't recommend", "hardly enjoyable", "nothing special")
+
+
+def words(rng, count):
+    return [rng.choice(WORDS) for _ in range(count)]
+
+
+def mixed(rng, extras, count):
+    """About one token in three drawn from extras, the rest ordinary review words"""
+    tokens = []
+    while len(tokens) < count:
+        tokens.extend(rng.choice(extras).split() if rng.random() < 0.35 else [rng.choice(WORDS)])
+    return " ".join(tokens[:count])
+
+
+def inputs(seed=42):
+    rng = random.Random(seed)
+    cases = {f"tokens_{n}": " ".join(words(rng, n)) for n in (10, 100, 1000, 10000)}
+    cases["emoticons"] = mixed(rng, EMOTICONS, 100)
+    cases["all_caps"] = " ".join(words(rng, 100)).upper() + "!!!"
+    cases["idioms"] = mixed(rng, IDIOMS, 100)
+    cases["negations"] = mixed(rng, NEGATIONS, 100)
+    return cases
+
+
+# A domain overlay of single words, and one that also has multi-word entries
+OVERLAY_WORDS = {"gripping": 2.0, "cheesy": -1.5, "campy": -0.8, "riveting": 2.2, "formulaic": -1.4,
+                 "overacted": -1.6, "heartfelt": 1.9, "bloated": -1.3}
+OVERLAY_PHRASES = {**OVERLAY_WORDS, "plot hole": -1.8, "jump scare": -0.6, "edge of my seat": 2.1,
+                   "fell flat": -1.9, "tour de force": 2.8}
+
+
+def scorers():
+    base = model.active()
+    found = {"predict_sentiment": model.predict_sentiment,
+             "fallback": model.SimpleSentimentAnalyzer().polarity_scores,
+             "overlay_words": model.compile_analyzer(base.kind, OVERLAY_WORDS, "words", base.version,
+                                                     OVERLAY_WORDS).score,
+             "overlay_phrases": model.compile_analyzer(base.kind, OVERLAY_PHRASES, "phrases", base.version,
+                                                       OVERLAY_PHRASES).score}
+    try:
+        from nltk.sentiment import SentimentIntensityAnalyzer
+        found["vader"] = SentimentIntensityAnalyzer().polarity_scores
+    except LookupError:
+        pass
+    return found
+
+
+def percentile(sorted_values, fraction):
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * fraction))]
+
+
+def bench(fn, text, min_time, min_calls=20):
+    fn(text)
+    timings = []
+    deadline = time.perf_counter() + min_time
+    while len(timings) < min_calls or time.perf_counter() < deadline:
+        start = time.perf_counter_ns()
+        fn(text)
+        timings.append(time.perf_counter_ns() - start)
+    timings.sort()
+
+    peaks = []
+    tracemalloc.start()
+    for _ in range(5):
+        tracemalloc.reset_peak()
+        base = tracemalloc.get_traced_memory()[0]
+        fn(text)
+        peaks.append(tracemalloc.get_traced_memory()[1] - base)
+    tracemalloc.stop()
+
+    return {
+        "calls": len(timings),
+        "ops_per_sec": round(1e9 * len(timings) / sum(timings), 1),
+        "p50_us": round(percentile(timings, 0.50) / 1000, 3),
+        "p99_us": round(percentile(timings, 0.99) / 1000, 3),
+        "alloc_peak_bytes": sorted(peaks)[len(peaks) // 2],
+    }
+
+
+def compare(results, baseline, threshold):
+    """Cases that got slower than baseline by more than threshold"""
+    regressions = []
+    for key, result in results.items():
+        before = baseline.get(key)
+        if before is None:
+            continue
+        ops_change = result["ops_per_sec"] / before["ops_per_sec"] - 1
+        p50_change = result["p50_us"] / before["p50_us"] - 1
+        # p99 over a fraction of a second is mostly scheduler noise, so it is reported, not judged
+        if ops_change < -threshold or p50_change > threshold:
+            regressions.append({"case": key, "ops_change_pct": round(ops_change * 100, 1),
+                                "p50_change_pct": round(p50_change * 100, 1),
+                                "p99_change_pct": round((result["p99_us"] / before["p99_us"] - 1) * 100, 1)})
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--output", default="scoring.json", help="where to write the results")
+    parser.add_argument("--baseline", help="earlier results file to compare against")
+    parser.add_argument("--threshold", type=float, default=0.10, help="allowed slowdown, as a fraction")
+    parser.add_argument("--min-time", type=float, default=0.5, help="seconds to time each case for")
+    args = parser.parse_args()
+
+    results = {}
+    cases = inputs()
+    for scorer, fn in scorers().items():
+        for case, text in cases.items():
+            result = bench(fn, text, args.min_time)
+            results[f"{scorer}/{case}"] = result
+            print(json.dumps({"scorer": scorer, "case": case, **result}))
+            sys.stdout.flush()
+
+    report = {
+        "python": platform.python_version(),
+        "analyzer": type(model.active().sia).__name__,
+        "created": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "results": results,
+    }
+    regressions = None
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f)["results"], args.threshold)
+        report["regressions"] = regressions
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+
+    if regressions:
+        for regression in regressions:
+            print(json.dumps({"regression": regression}))
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,136 @@
+"""Load-test the WSGI (gunicorn) and ASGI (uvicorn) apps side by side
+
+Both servers are started on the same machine with the same number of worker
+processes and their own throwaway SQLite database, then driven with the same
+closed-loop POST /predict load at each concurrency level. Results are printed
+as one JSON object per server and concurrency level.
+
+Usage:
+    python benchmarks/bench_serving.py [--workers 1] [--threads 8]
+                                       [--concurrency 16 256 1024] [--duration 10]
+                                       [--microbatch]
+"""
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BODY = json.dumps({"text": "This movie was absolutely fantastic! Great acting and storyline."}).encode()
+
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return None
+    return sorted_values[min(len(sorted_values) - 1, int(fraction * len(sorted_values)))]
+
+
+async def _request(reader, writer, host):
+    writer.write(
+        b"POST /predict HTTP/1.1\r\nHost: " + host.encode() +
+        b"\r\nContent-Type: application/json\r\nContent-Length: " + str(len(BODY)).encode() +
+        b"\r\n\r\n" + BODY
+    )
+    await writer.drain()
+    status_line = await reader.readline()
+    length = 0
+    while True:
+        line = await reader.readline()
+        if line in (b"\r\n", b""):
+            break
+        name, _, value = line.partition(b":")
+        if name.strip().lower() == b"content-length":
+            length = int(value.strip())
+    await reader.readexactly(length)
+    return int(status_line.split()[1])
+
+
+async def _client(host, port, deadline, latencies, errors):
+    reader = writer = None
+    while time.perf_counter() < deadline:
+        started = time.perf_counter()
+        try:
+            if writer is None:
+                reader, writer = await asyncio.open_connection(host, port)
+            status = await _request(reader, writer, host)
+            if status != 200:
+                errors.append(status)
+            else:
+                latencies.append(time.perf_counter() - started)
+        except (OSError, asyncio.IncompleteReadError, ValueError, IndexError):
+            errors.append("connection")
+            writer = None
+            await asyncio.sleep(0.01)
+    if writer is not None:
+        writer.close()
+
+
+async def drive(host, port, concurrency, duration):
+    latencies, errors = [], []
+    deadline = time.perf_counter() + duration
+    await asyncio.gather(*(_client(host, port, deadline, latencies, errors) for _ in range(concurrency)))
+    latencies.sort()
+    return {
+        "requests": len(latencies),
+        "errors": len(errors),
+        "rps": round(len(latencies) / duration, 1),
+        "p50_ms": round(percentile(latencies, 0.50) * 1000, 2) if latencies else None,
+        "p99_ms": round(percentile(latencies, 0.99) * 1000, 2) if latencies else None,
+    }
+
+
+def start_server(kind, port, args, db_path):
+    env = dict(os.environ, DB_TYPE="sqlite", SQLITE_PATH=db_path)
+    if args.microbatch:
+        env["PREDICT_MICROBATCH"] = "1"
+    if kind == "wsgi":
+        cmd = ["gunicorn", "-w", str(args.workers), "--threads", str(args.threads),
+               "-b", f"127.0.0.1:{port}", "--backlog", "4096", "app:app"]
+    else:
+        cmd = ["uvicorn", "asgi:application", "--workers", str(args.workers),
+               "--host", "127.0.0.1", "--port", str(port), "--backlog", "4096", "--log-level", "warning"]
+    return subprocess.Popen(cmd, cwd=APP_DIR, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+
+async def wait_ready(port, timeout=30):
+    deadline = time.perf_counter() + timeout
+    while time.perf_counter() < deadline:
+        try:
+            _, writer = await asyncio.open_connection("127.0.0.1", port)
+            writer.close()
+            return
+        except OSError:
+            await asyncio.sleep(0.2)
+    raise RuntimeError(f"server on port {port} did not start")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--threads", type=int, default=8, help="gunicorn threads per worker")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[16, 256, 1024])
+    parser.add_argument("--duration", type=float, default=10)
+    parser.add_argument("--microbatch", action="store_true", help="enable /predict micro-batching")
+    args = parser.parse_args()
+
+    tmp = tempfile.mkdtemp()
+    for port, kind in ((5101, "wsgi"), (5102, "asgi")):
+        server = start_server(kind, port, args, os.path.join(tmp, f"{kind}.db"))
+        try:
+            asyncio.run(wait_ready(port))
+            for concurrency in args.concurrency:
+                result = asyncio.run(drive("127.0.0.1", port, concurrency, args.duration))
+                print(json.dumps({"server": kind, "workers": args.workers, "microbatch": args.microbatch,
+                                  "concurrency": concurrency, **result}))
+                sys.stdout.flush()
+        finally:
+            server.terminate()
+            server.wait()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,349 @@
+"""Record-and-replay HTTP load tests
+
+Traffic logs are JSON lines in the format traffic.py records: run the API with
+TRAFFIC_RECORD_PATH=traffic.jsonl to capture real traffic, or generate a
+production-shaped log offline:
+
+    python benchmarks/loadtest.py synthesize traffic.jsonl [--rate 200] [--duration 60]
+
+then replay it against a running server (--target) or against one started
+here on a throwaway SQLite database (--start wsgi|asgi), so nothing outside
+this machine is needed:
+
+    python benchmarks/loadtest.py replay traffic.jsonl --start asgi --mode open
+    python benchmarks/loadtest.py replay traffic.jsonl --target http://localhost:5000 \\
+        --mode closed --concurrency 64
+
+* open loop sends every request at its own time whether or not earlier ones
+  have finished: at the recorded arrival times (sped up by --speed) or, with
+  --rate, at a fixed rate. Latency is counted from when the request was due,
+  so a server that falls behind shows it.
+* closed loop keeps --concurrency requests in flight and sends the next one
+  as soon as one finishes, measuring maximum throughput.
+
+Prints one JSON report: throughput, latency percentiles, errors by status and
+the same per route ("METHOD /path"), plus the mean Server-Timing phases per
+route when the server sends them (SERVER_TIMING=1, set for --start).
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+import types
+from urllib.parse import urlsplit
+
+import bench_serving
+from bench_serving import percentile
+
+WORDS = ("the movie plot was acting story scenes director film cast characters script ending music "
+         "good great boring bad loved hated really very slow fun dark long amazing terrible not").split()
+
+# (share of requests, method, path, query) for synthesized traffic
+ROUTE_MIX = (
+    (0.70, "POST", "/predict", ""),
+    (0.05, "POST", "/batch-predict", ""),
+    (0.10, "GET", "/reviews", "limit=20"),
+    (0.08, "GET", "/stats", ""),
+    (0.05, "GET", "/health", ""),
+    (0.02, "GET", "/stats/timeseries", "bucket=hour"),
+)
+
+
+def review(rng, tokens=None):
+    # Review lengths are long-tailed: most are a sentence or two, a few run to pages
+    tokens = tokens or max(3, int(rng.lognormvariate(3.2, 0.9)))
+    return " ".join(rng.choice(WORDS) for _ in range(tokens))
+
+
+def synthesize(path, rate, duration, clients, seed):
+    rng = random.Random(seed)
+    weights = [share for share, *_ in ROUTE_MIX]
+    client_weights = [1 / (rank + 1) for rank in range(clients)]
+    t = time.time()
+    end = t + duration
+    count = 0
+    with open(path, "w") as f:
+        while True:
+            # Poisson arrivals
+            t += rng.expovariate(rate)
+            if t >= end:
+                break
+            _, method, route, query = rng.choices(ROUTE_MIX, weights)[0]
+            entry = {"t": round(t, 6), "method": method, "path": route, "query": query, "headers": {},
+                     "client": f"client{rng.choices(range(clients), client_weights)[0]:03d}"}
+            if route == "/predict":
+                entry["body"] = json.dumps({"text": review(rng)})
+            elif route == "/batch-predict":
+                entry["body"] = json.dumps({"texts": [review(rng) for _ in range(rng.randint(2, 50))]})
+            if "body" in entry:
+                entry["headers"]["Content-Type"] = "application/json"
+            f.write(json.dumps(entry) + "\n")
+            count += 1
+    return count
+
+
+def load(path):
+    with open(path) as f:
+        entries = [json.loads(line) for line in f if line.strip()]
+    if not entries:
+        raise SystemExit(f"{path} has no requests")
+    entries.sort(key=lambda entry: entry["t"])
+    return entries
+
+
+def build_request(entry, host, rng):
+    target = entry["path"] + (f"?{entry['query']}" if entry.get("query") else "")
+    if "body" in entry:
+        body = entry["body"].encode("utf-8")
+    elif entry.get("body_length"):
+        # Recorded without bodies: a generated review of about the same size
+        text = review(rng, max(1, entry["body_length"] // 6))
+        body = json.dumps({"text": text}).encode("utf-8")
+    else:
+        body = b""
+    headers = dict(entry.get("headers", {}))
+    if entry.get("client"):
+        headers["X-API-Key"] = f"replay-{entry['client']}"
+    lines = [f"{entry['method']} {target} HTTP/1.1", f"Host: {host}", f"Content-Length: {len(body)}"]
+    lines += [f"{name}: {value}" for name, value in headers.items()]
+    return ("\r\n".join(lines) + "\r\n\r\n").encode("latin-1") + body
+
+
+async def read_response(reader):
+    """Status, headers (lower-case names) and body length of one response"""
+    status_line = await reader.readline()
+    if not status_line:
+        raise ConnectionResetError("connection closed")
+    headers = {}
+    while True:
+        line = await reader.readline()
+        if line in (b"\r\n", b""):
+            break
+        name, _, value = line.decode("latin-1").partition(":")
+        headers[name.strip().lower()] = value.strip()
+    size = 0
+    if headers.get("transfer-encoding", "").lower() == "chunked":
+        while True:
+            chunk = int((await reader.readline()).split(b";")[0], 16)
+            await reader.readexactly(chunk + 2)
+            size += chunk
+            if chunk == 0:
+                break
+    else:
+        size = int(headers.get("content-length", 0))
+        await reader.readexactly(size)
+    return int(status_line.split()[1]), headers, size
+
+
+def parse_server_timing(value):
+    phases = {}
+    for part in value.split(","):
+        name, _, params = part.strip().partition(";")
+        if params.startswith("dur="):
+            phases[name] = float(params[4:])
+    return phases
+
+
+class Connections:
+    """Keep-alive connections to the server, reused between requests"""
+
+    def __init__(self, host, port):
+        self.host = host
+        self.port = port
+        self.idle = []
+
+    async def send(self, raw, fresh=False):
+        reused = bool(self.idle) and not fresh
+        reader, writer = self.idle.pop() if reused else await asyncio.open_connection(self.host, self.port)
+        try:
+            writer.write(raw)
+            await writer.drain()
+            status, headers, _ = await read_response(reader)
+        except (ConnectionError, asyncio.IncompleteReadError):
+            writer.close()
+            if not reused:
+                raise
+            # The server timed out the idle keep-alive connection; retry once on a new one
+            return await self.send(raw, fresh=True)
+        except BaseException:
+            writer.close()
+            raise
+        if headers.get("connection", "").lower() == "close":
+            writer.close()
+        else:
+            self.idle.append((reader, writer))
+        return status, headers
+
+    def close(self):
+        for _, writer in self.idle:
+            writer.close()
+
+
+class Results:
+    def __init__(self):
+        self.samples = []
+
+    def add(self, entry, status, latency, headers):
+        route = f"{entry['method']} {entry['path']}"
+        phases = parse_server_timing(headers.get("server-timing", "")) if headers else {}
+        self.samples.append((route, status, latency, phases))
+
+    def report(self, elapsed):
+        routes = {}
+        for route, *sample in self.samples:
+            routes.setdefault(route, []).append(sample)
+        overall = summarize([sample[1:] for sample in self.samples], elapsed)
+        # Phases only mean something per route
+        overall.pop("server_timing_mean_ms", None)
+        return {
+            **overall,
+            "routes": {route: summarize(samples, elapsed) for route, samples in sorted(routes.items())},
+        }
+
+
+def summarize(samples, elapsed):
+    latencies = sorted(latency for _, latency, _ in samples)
+    errors = {}
+    for status, _, _ in samples:
+        if status != 200:
+            errors[str(status)] = errors.get(str(status), 0) + 1
+    summary = {
+        "requests": len(samples),
+        "rps": round(len(samples) / elapsed, 1),
+        "error_rate": round(sum(errors.values()) / len(samples), 4) if samples else 0.0,
+        "errors": errors,
+    }
+    for name, fraction in (("p50", 0.50), ("p90", 0.90), ("p99", 0.99), ("p999", 0.999)):
+        summary[f"{name}_ms"] = round(percentile(latencies, fraction) * 1000, 2) if latencies else None
+    phases = {}
+    for _, _, sample_phases in samples:
+        for name, ms in sample_phases.items():
+            phases[name] = phases.get(name, 0.0) + ms
+    if phases:
+        summary["server_timing_mean_ms"] = {name: round(total / len(samples), 3) for name, total in phases.items()}
+    return summary
+
+
+async def issue(connections, entry, raw, due, results):
+    try:
+        status, headers = await connections.send(raw)
+    except (OSError, asyncio.IncompleteReadError, ValueError, IndexError):
+        status, headers = "connection", None
+    results.add(entry, status, time.perf_counter() - due, headers)
+
+
+async def open_loop(connections, entries, args, results, rng):
+    start = time.perf_counter()
+    first = entries[0]["t"]
+    tasks = []
+    for i, entry in enumerate(itertools.islice(itertools.cycle(entries), args.requests)):
+        if args.rate:
+            offset = i / args.rate
+        else:
+            cycle, position = divmod(i, len(entries))
+            span = entries[-1]["t"] - first + 1 / len(entries)
+            offset = (cycle * span + entries[position]["t"] - first) / args.speed
+        if args.duration and offset >= args.duration:
+            break
+        due = start + offset
+        delay = due - time.perf_counter()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        tasks.append(asyncio.create_task(issue(connections, entry, build_request(entry, args.host, rng), due, results)))
+    await asyncio.gather(*tasks)
+    return time.perf_counter() - start
+
+
+async def closed_loop(connections, entries, args, results, rng):
+    start = time.perf_counter()
+    deadline = start + args.duration if args.duration else None
+    pending = iter(itertools.islice(itertools.cycle(entries), args.requests))
+
+    async def worker():
+        for entry in pending:
+            if deadline is not None and time.perf_counter() >= deadline:
+                return
+            raw = build_request(entry, args.host, rng)
+            await issue(connections, entry, raw, time.perf_counter(), results)
+
+    await asyncio.gather(*(worker() for _ in range(args.concurrency)))
+    return time.perf_counter() - start
+
+
+async def replay(entries, host, port, args):
+    connections = Connections(host, port)
+    results = Results()
+    rng = random.Random(args.seed)
+    run = open_loop if args.mode == "open" else closed_loop
+    try:
+        elapsed = await run(connections, entries, args, results, rng)
+    finally:
+        connections.close()
+    return results.report(elapsed)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    synth = sub.add_parser("synthesize", help="write a production-shaped traffic log")
+    synth.add_argument("path")
+    synth.add_argument("--rate", type=float, default=200, help="mean requests per second")
+    synth.add_argument("--duration", type=float, default=60, help="seconds of traffic")
+    synth.add_argument("--clients", type=int, default=50)
+    synth.add_argument("--seed", type=int, default=42)
+
+    rep = sub.add_parser("replay", help="replay a traffic log against a server")
+    rep.add_argument("path")
+    target = rep.add_mutually_exclusive_group(required=True)
+    target.add_argument("--target", help="base URL of a running server")
+    target.add_argument("--start", choices=("wsgi", "asgi"), help="start a local server on SQLite")
+    rep.add_argument("--mode", choices=("open", "closed"), default="open")
+    rep.add_argument("--rate", type=float, help="open loop: fixed requests per second instead of recorded times")
+    rep.add_argument("--speed", type=float, default=1.0, help="open loop: replay recorded times this much faster")
+    rep.add_argument("--concurrency", type=int, default=32, help="closed loop: requests in flight")
+    rep.add_argument("--requests", type=int, help="stop after this many requests (the log repeats)")
+    rep.add_argument("--duration", type=float, help="stop sending after this many seconds")
+    rep.add_argument("--workers", type=int, default=1, help="--start: worker processes")
+    rep.add_argument("--threads", type=int, default=8, help="--start wsgi: threads per worker")
+    rep.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    if args.command == "synthesize":
+        count = synthesize(args.path, args.rate, args.duration, args.clients, args.seed)
+        print(json.dumps({"path": args.path, "requests": count}))
+        return
+
+    entries = load(args.path)
+    if args.requests is None:
+        args.requests = None if args.duration else len(entries)
+    server = None
+    if args.start:
+        port = 5103
+        os.environ["SERVER_TIMING"] = "1"
+        db_path = os.path.join(tempfile.mkdtemp(), "loadtest.db")
+        options = types.SimpleNamespace(workers=args.workers, threads=args.threads, microbatch=False)
+        server = bench_serving.start_server(args.start, port, options, db_path)
+        host = "127.0.0.1"
+        asyncio.run(bench_serving.wait_ready(port))
+    else:
+        url = urlsplit(args.target)
+        host, port = url.hostname, url.port or 80
+    args.host = f"{host}:{port}"
+    try:
+        report = asyncio.run(replay(entries, host, port, args))
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait()
+    print(json.dumps({"mode": args.mode, "server": args.start or args.target, **report}, indent=2))
+    sys.stdout.flush()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,254 @@
+"""Bulk import of reviews from CSV or NDJSON
+
+Records are read as a stream, scored in parallel chunks and loaded with
+COPY FROM STDIN on PostgreSQL or executemany on SQLite, one transaction per
+chunk. The number of input records consumed is stored in import_checkpoints in
+the same transaction, so an interrupted import started again with the same
+import id skips what is already loaded and carries on.
+
+Usage:
+    python bulk_import.py reviews.csv [--format csv|ndjson] [--import-id ID]
+                                      [--chunk-size 5000] [--workers 4] [--mode full|fast]
+"""
+import argparse
+import csv
+import io
+import json
+import os
+import sys
+import threading
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+
+import rollup
+from db_utils import TIMESTAMP_FORMAT, format_timestamp, parse_timestamp, sql
+import model
+
+IMPORT_FORMATS = ("csv", "ndjson")
+IMPORT_CHUNK_SIZE = int(os.getenv("IMPORT_CHUNK_SIZE", "5000"))
+IMPORT_WORKERS = int(os.getenv("IMPORT_WORKERS", str(os.cpu_count() or 1)))
+TEXT_FIELDS = ("text", "review", "review_text")
+
+
+def create_table(cur, db_type):
+    """Create the table that records how far each import has got"""
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS import_checkpoints (
+            import_id TEXT PRIMARY KEY,
+            rows_done INTEGER NOT NULL DEFAULT 0,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        );
+    """)
+
+
+def read_records(text_stream, fmt):
+    """Yield (text, created_at) pairs from a CSV or NDJSON text stream"""
+    if fmt == "csv":
+        records = csv.DictReader(text_stream)
+    else:
+        records = (json.loads(line) for line in text_stream if line.strip())
+
+    for record in records:
+        text = next((record[field] for field in TEXT_FIELDS if record.get(field)), "")
+        yield text.strip(), normalize_created_at(record.get("created_at"))
+
+
+def normalize_created_at(value):
+    """A created_at from an input file as UTC in CURRENT_TIMESTAMP's format, or None
+
+    Raises ValueError for a value that is not an ISO-8601 date or timestamp,
+    so it is rejected before its chunk is loaded.
+    """
+    if value is None or value == "":
+        return None
+    try:
+        return parse_timestamp(str(value)).strftime(TIMESTAMP_FORMAT)
+    except ValueError:
+        raise ValueError(f"created_at {value!r} is not an ISO-8601 timestamp") from None
+
+
+def score_chunk(texts, mode="full"):
+    """Score a list of texts; runs inside the worker processes
+
+    Returns (analyzer version, scores), after picking up any change to the
+    analyzer config file.
+    """
+    model.refresh()
+    analyzer = model.active().select(mode=mode)
+    return analyzer.version, analyzer.score_many(texts)
+
+
+def get_checkpoint(cur, db_type, import_id):
+    cur.execute(sql("SELECT rows_done FROM import_checkpoints WHERE import_id = ?;", db_type), (import_id,))
+    row = cur.fetchone()
+    return row[0] if row else 0
+
+
+def save_checkpoint(cur, db_type, import_id, rows_done):
+    cur.execute(sql("""
+        INSERT INTO import_checkpoints (import_id, rows_done, updated_at)
+        VALUES (?, ?, CURRENT_TIMESTAMP)
+        ON CONFLICT (import_id) DO UPDATE SET
+            rows_done = excluded.rows_done,
+            updated_at = excluded.updated_at;
+    """, db_type), (import_id, rows_done))
+
+
+def load_rows(cur, db_type, rows, version):
+    """Insert (text, sentiment, confidence_score, created_at) rows scored by
+    analyzer version in one round trip"""
+    versioned = [(*row, version) for row in rows]
+    if db_type == "sqlite":
+        cur.executemany(
+            "INSERT INTO reviews (text, sentiment, confidence_score, created_at, analyzer_version) "
+            "VALUES (?, ?, ?, ?, ?);",
+            versioned
+        )
+    else:
+        buffer = io.StringIO()
+        csv.writer(buffer).writerows(versioned)
+        buffer.seek(0)
+        cur.copy_expert(
+            "COPY reviews (text, sentiment, confidence_score, created_at, analyzer_version) "
+            "FROM STDIN WITH (FORMAT csv)",
+            buffer
+        )
+    rollup.apply(cur, db_type, [(row[3], row[1], row[2]) for row in rows])
+
+
+def chunked(records, size):
+    """Split an iterator of records into lists of at most size"""
+    while True:
+        chunk = list(islice(records, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def scored_chunks(chunks, pool=None, depth=2, mode="full"):
+    """Yield (chunk, (analyzer version, scores)) in input order
+
+    With a process pool, up to depth chunks are scored concurrently while the
+    caller loads earlier ones, and no more than that are held in memory.
+    """
+    if pool is None:
+        for chunk in chunks:
+            yield chunk, score_chunk([text for text, _ in chunk], mode)
+        return
+
+    pending = deque()
+    for chunk in chunks:
+        pending.append((chunk, pool.submit(score_chunk, [text for text, _ in chunk], mode)))
+        if len(pending) >= depth:
+            done_chunk, future = pending.popleft()
+            yield done_chunk, future.result()
+    while pending:
+        done_chunk, future = pending.popleft()
+        yield done_chunk, future.result()
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def shared_pool():
+    """One process pool of IMPORT_WORKERS shared by every import this process serves"""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(max_workers=IMPORT_WORKERS)
+        return _pool
+
+
+def run_import(conn, db_type, records, import_id, chunk_size=IMPORT_CHUNK_SIZE,
+               workers=IMPORT_WORKERS, progress=None, mode="full", pool=None):
+    """Score and load records, resuming after the checkpoint for import_id
+
+    Scored on pool when given, else on a pool of workers processes started for
+    this import.
+    """
+    cur = conn.cursor()
+    rows_done = get_checkpoint(cur, db_type, import_id)
+    cur.execute("SELECT CURRENT_TIMESTAMP;")
+    imported_at = format_timestamp(cur.fetchone()[0])
+    conn.commit()
+
+    records = islice(records, rows_done, None)
+    chunks = chunked(records, chunk_size)
+    loaded = 0
+    started = time.perf_counter()
+
+    def load(chunk, scored):
+        nonlocal rows_done, loaded
+        version, scores = scored
+        rows = [
+            (text, sentiment, confidence, created_at or imported_at)
+            for (text, created_at), (sentiment, confidence) in zip(chunk, scores)
+            if text
+        ]
+        if rows:
+            load_rows(cur, db_type, rows, version)
+        rows_done += len(chunk)
+        save_checkpoint(cur, db_type, import_id, rows_done)
+        conn.commit()
+        loaded += len(rows)
+        if progress:
+            progress(rows_done, loaded, time.perf_counter() - started)
+
+    if pool is not None:
+        for chunk, scored in scored_chunks(chunks, pool, depth=workers * 2, mode=mode):
+            load(chunk, scored)
+    elif workers <= 1:
+        for chunk, scored in scored_chunks(chunks, mode=mode):
+            load(chunk, scored)
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            for chunk, scored in scored_chunks(chunks, pool, depth=workers * 2, mode=mode):
+                load(chunk, scored)
+
+    cur.close()
+    elapsed = time.perf_counter() - started
+    return {
+        "import_id": import_id,
+        "rows_done": rows_done,
+        "rows_imported": loaded,
+        "seconds": round(elapsed, 3),
+        "rows_per_sec": round(loaded / elapsed, 1) if elapsed else None,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Bulk import movie reviews")
+    parser.add_argument("path")
+    parser.add_argument("--format", choices=IMPORT_FORMATS)
+    parser.add_argument("--import-id", help="resume key, defaults to the file path and size")
+    parser.add_argument("--chunk-size", type=int, default=IMPORT_CHUNK_SIZE)
+    parser.add_argument("--workers", type=int, default=IMPORT_WORKERS)
+    parser.add_argument("--mode", choices=model.SCORING_MODES, default="full",
+                        help="fast: approximate lexicon-sum scoring, rescored in full later by rescore.py")
+    args = parser.parse_args(argv)
+
+    from app import DB_TYPE, get_db_connection
+
+    fmt = args.format or ("ndjson" if args.path.endswith((".ndjson", ".jsonl")) else "csv")
+    import_id = args.import_id or f"{os.path.abspath(args.path)}:{os.path.getsize(args.path)}"
+
+    conn = get_db_connection()
+    if conn is None:
+        return 1
+
+    def progress(rows_done, loaded, elapsed):
+        print(f"  {rows_done} records read, {loaded} imported, {loaded / elapsed:.0f} rows/sec", file=sys.stderr)
+
+    with open(args.path, newline="", encoding="utf-8") as f:
+        result = run_import(conn, DB_TYPE, read_records(f, fmt), import_id,
+                            args.chunk_size, args.workers, progress, args.mode)
+    conn.close()
+    print(json.dumps(result))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,266 @@
+"""Synthetic movie-review corpus for scaling tests and benchmarks
+
+Builds reviews from the words VADER scores: its lexicon (or the fallback
+analyzer's word lists when the lexicon is not installed), booster words,
+negations and idioms, mixed with neutral movie vocabulary. The same seed and
+options always give the same reviews. Length, sentiment mix, ALL-CAPS,
+exclamation and emoticon rates are tunable, and reviews are streamed as
+NDJSON or CSV in the shape bulk_import.py reads ("text", "created_at") plus
+the intended "label".
+
+Each label's tokens are laid out in a 65536-slot table in proportion to
+their weights, and a whole batch of tokens is drawn with one randbytes call
+indexing into it, which keeps generation above 100k reviews/sec. created_at
+is spread over the --days before --end (today by default), so the same seed,
+options and --end always give the same file.
+
+Usage:
+    python corpus.py [OUTPUT|-] [--count 100000] [--seed 42] [--format ndjson|csv]
+                     [--mean-tokens 40] [--mix 0.5,0.35,0.15] [--caps 0.05]
+                     [--exclaim 0.2] [--emoticons 0.1] [--negation 0.05]
+                     [--days 365] [--end 2026-01-01]
+"""
+import argparse
+import bisect
+import io
+import itertools
+import json
+import math
+import random
+import sys
+import time
+from array import array
+from datetime import datetime, timezone
+
+from nltk.sentiment.vader import VaderConstants
+
+import model
+
+CORPUS_FORMATS = ("ndjson", "csv")
+LABELS = ("positive", "negative", "neutral")
+BATCH_SIZE = 1000
+TABLE_SIZE = 1 << 16
+
+FILLER = ("the movie film plot story acting cast director script scene scenes characters ending "
+          "soundtrack cinematography dialogue sequel performance runtime camera audience theater "
+          "it was is this that and but with a an of in to for on as really just also so then "
+          "first second third act hour minutes lead actor actress villain hero twist effects").split()
+
+# Used when the lexicon is not installed, which has no emoticons of its own
+FALLBACK_EMOTICONS = {":)": 2.0, ":D": 2.3, "<3": 1.9, ";)": 0.9, ":(": -1.9, ":'(": -2.2, ":/": -1.4}
+
+# Share of each token kind in a review of each label: own-polarity words,
+# opposite-polarity words, boosters and everything else filler
+LABEL_SHAPES = {
+    "positive": (0.16, 0.03, 0.04),
+    "negative": (0.16, 0.04, 0.04),
+    "neutral": (0.03, 0.03, 0.01),
+}
+
+
+def load_lexicon():
+    """Word -> valence from VADER, or the fallback analyzer's word sets"""
+    try:
+        from nltk.sentiment import SentimentIntensityAnalyzer
+        return SentimentIntensityAnalyzer().lexicon
+    except LookupError:
+        fallback = model.SimpleSentimentAnalyzer()
+        lexicon = {word: 2.0 for word in fallback.positive_words}
+        lexicon.update({word: -2.0 for word in fallback.negative_words})
+        lexicon.update(FALLBACK_EMOTICONS)
+        return lexicon
+
+
+class Vocabulary:
+    """Token pools built once from the lexicon and VADER's tables"""
+
+    def __init__(self, lexicon=None):
+        lexicon = lexicon if lexicon is not None else load_lexicon()
+        words = {word: valence for word, valence in lexicon.items() if word.isalpha()}
+        self.positive = sorted(word for word, valence in words.items() if valence >= 1.0)
+        self.negative = sorted(word for word, valence in words.items() if valence <= -1.0)
+        emoticons = {word: valence for word, valence in lexicon.items()
+                     if not word.isalnum() and len(word) <= 4 and abs(valence) >= 1.0}
+        self.positive_emoticons = sorted(word for word, valence in emoticons.items() if valence > 0)
+        self.negative_emoticons = sorted(word for word, valence in emoticons.items() if valence < 0)
+        self.boosters = sorted(word for word in VaderConstants.BOOSTER_DICT if " " not in word)
+        self.negations = sorted(word for word in VaderConstants.NEGATE if word.isalpha())
+        self.idioms = sorted(VaderConstants.SPECIAL_CASE_IDIOMS)
+        self.positive_idioms = [idiom for idiom in self.idioms if VaderConstants.SPECIAL_CASE_IDIOMS[idiom] > 0]
+        self.negative_idioms = [idiom for idiom in self.idioms if VaderConstants.SPECIAL_CASE_IDIOMS[idiom] < 0]
+
+
+def pool(vocab, label, negation, idioms):
+    """Lookup table for one label's reviews, each token filling a share of its slots"""
+    own, opposite, boost = LABEL_SHAPES[label]
+    positive = label != "negative"
+    good, bad = (vocab.positive, vocab.negative) if positive else (vocab.negative, vocab.positive)
+    good_idioms = vocab.positive_idioms if positive else vocab.negative_idioms
+    # A negated opposite word ("not bad") leans the same way as the label
+    negated = [f"{negation_word} {word}" for negation_word, word in zip(
+        itertools.cycle(vocab.negations), bad[:200])]
+    groups = [
+        (FILLER, 1.0 - own - opposite - boost - negation - idioms),
+        (good, own),
+        (bad, opposite),
+        (vocab.boosters, boost),
+        (negated, negation),
+        (good_idioms or vocab.idioms, idioms),
+    ]
+    tokens, weights = [], []
+    for group, share in groups:
+        if group and share > 0:
+            tokens.extend(group)
+            weights.extend([share / len(group)] * len(group))
+    cum_weights = list(itertools.accumulate(weights))
+    total = cum_weights[-1]
+    return [tokens[min(bisect.bisect(cum_weights, (slot + 0.5) / TABLE_SIZE * total), len(tokens) - 1)]
+            for slot in range(TABLE_SIZE)]
+
+
+def draw(rng, table, count):
+    """count tokens from a lookup table, drawn in one go"""
+    slots = array("H", rng.randbytes(2 * count))
+    if sys.byteorder == "big":
+        slots.byteswap()
+    return list(map(table.__getitem__, slots))
+
+
+def parse_mix(value):
+    shares = [float(part) for part in value.split(",")]
+    if len(shares) != 3 or min(shares) < 0 or not sum(shares):
+        raise argparse.ArgumentTypeError("mix is three non-negative shares: positive,negative,neutral")
+    return shares
+
+
+def date_arg(value):
+    return datetime.strptime(value, "%Y-%m-%d").replace(tzinfo=timezone.utc)
+
+
+def batches(count, seed=42, mean_tokens=40, sigma=0.8, mix=(0.5, 0.35, 0.15), caps=0.05,
+            exclaim=0.2, emoticons=0.1, negation=0.05, idioms=0.01, days=365, end=None, vocab=None):
+    """Yield lists of up to BATCH_SIZE (text, label, created_at) tuples; end is a UTC datetime"""
+    rng = random.Random(seed)
+    vocab = vocab or Vocabulary()
+    pools = {label: pool(vocab, label, negation, idioms) for label in LABELS}
+    smileys = {"positive": vocab.positive_emoticons, "negative": vocab.negative_emoticons,
+               "neutral": vocab.positive_emoticons + vocab.negative_emoticons}
+    # Lognormal lengths with the requested mean
+    mu = math.log(mean_tokens) - sigma * sigma / 2
+    end = end or datetime.now(timezone.utc).replace(hour=0, minute=0, second=0, microsecond=0)
+    end_ts = int(end.timestamp())
+    span = max(1, int(days * 86400))
+    dates = {}
+    produced = 0
+    while produced < count:
+        size = min(BATCH_SIZE, count - produced)
+        labels = rng.choices(LABELS, mix, k=size)
+        lengths = [max(1, int(rng.lognormvariate(mu, sigma))) for _ in range(size)]
+        texts = [None] * size
+        for label in LABELS:
+            indexes = [i for i in range(size) if labels[i] == label]
+            if not indexes:
+                continue
+            drawn = draw(rng, pools[label], sum(lengths[i] for i in indexes))
+            start = 0
+            for i in indexes:
+                words = drawn[start:start + lengths[i]]
+                start += lengths[i]
+                roll = rng.random()
+                if roll < caps:
+                    # Shouting one word is common, a whole review less so
+                    if roll < caps / 4:
+                        words = [word.upper() for word in words]
+                    else:
+                        position = rng.randrange(len(words))
+                        words[position] = words[position].upper()
+                text = " ".join(words)
+                text = text[0].upper() + text[1:]
+                if rng.random() < exclaim:
+                    text += "!" * rng.randint(1, 3)
+                else:
+                    text += "."
+                if smileys[label] and rng.random() < emoticons:
+                    text += " " + rng.choice(smileys[label])
+                texts[i] = text
+        batch = []
+        for text, label in zip(texts, labels):
+            day, second = divmod(end_ts - 1 - int(rng.random() * span), 86400)
+            date = dates.get(day)
+            if date is None:
+                date = dates[day] = datetime.fromtimestamp(day * 86400, timezone.utc).strftime("%Y-%m-%d")
+            hour, second = divmod(second, 3600)
+            batch.append((text, label, f"{date}T{hour:02d}:{second // 60:02d}:{second % 60:02d}Z"))
+        yield batch
+        produced += size
+
+
+def generate(count, **options):
+    """Yield count reviews as dicts with text, label and created_at"""
+    for batch in batches(count, **options):
+        for text, label, created_at in batch:
+            yield {"text": text, "label": label, "created_at": created_at}
+
+
+def csv_field(text):
+    if "," in text or '"' in text or "\n" in text or "\r" in text:
+        return '"' + text.replace('"', '""') + '"'
+    return text
+
+
+def write(review_batches, out, fmt):
+    """Stream batches from batches() to a text file object; returns how many reviews were written"""
+    written = 0
+    if fmt == "csv":
+        # Quoted by hand (only when needed, as csv.QUOTE_MINIMAL would), twice as fast as csv.writer
+        out.write("text,label,created_at\r\n")
+        for batch in review_batches:
+            out.write("".join(f"{csv_field(text)},{label},{created_at}\r\n" for text, label, created_at in batch))
+            written += len(batch)
+    else:
+        # Labels and timestamps never need escaping, so only the text goes through the encoder
+        quote = json.encoder.encode_basestring_ascii
+        for batch in review_batches:
+            out.write("".join(
+                f'{{"text": {quote(text)}, "label": "{label}", "created_at": "{created_at}"}}\n'
+                for text, label, created_at in batch))
+            written += len(batch)
+    return written
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Generate a synthetic movie-review corpus")
+    parser.add_argument("output", nargs="?", default="-", help="file to write, or - for stdout")
+    parser.add_argument("--count", type=int, default=100000)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--format", choices=CORPUS_FORMATS, default="ndjson")
+    parser.add_argument("--mean-tokens", type=float, default=40)
+    parser.add_argument("--sigma", type=float, default=0.8, help="spread of the lognormal length")
+    parser.add_argument("--mix", type=parse_mix, default=[0.5, 0.35, 0.15],
+                        help="positive,negative,neutral shares")
+    parser.add_argument("--caps", type=float, default=0.05, help="share of reviews with ALL-CAPS")
+    parser.add_argument("--exclaim", type=float, default=0.2, help="share ending in exclamation marks")
+    parser.add_argument("--emoticons", type=float, default=0.1, help="share ending in an emoticon")
+    parser.add_argument("--negation", type=float, default=0.05, help="share of tokens that are negated phrases")
+    parser.add_argument("--idioms", type=float, default=0.01, help="share of tokens that are idioms")
+    parser.add_argument("--days", type=float, default=365, help="spread created_at over this many days")
+    parser.add_argument("--end", type=date_arg, help="latest created_at date, YYYY-MM-DD (default today)")
+    args = parser.parse_args(argv)
+
+    review_batches = batches(args.count, seed=args.seed, mean_tokens=args.mean_tokens, sigma=args.sigma,
+                             mix=args.mix, caps=args.caps, exclaim=args.exclaim, emoticons=args.emoticons,
+                             negation=args.negation, idioms=args.idioms, days=args.days, end=args.end)
+    started = time.perf_counter()
+    if args.output == "-":
+        written = write(review_batches, sys.stdout, args.format)
+    else:
+        with open(args.output, "w", newline="", encoding="utf-8", buffering=io.DEFAULT_BUFFER_SIZE * 16) as out:
+            written = write(review_batches, out, args.format)
+    elapsed = time.perf_counter() - started
+    print(json.dumps({"reviews": written, "seconds": round(elapsed, 3),
+                      "reviews_per_sec": round(written / elapsed, 1) if elapsed else None}), file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,45 @@
+"""Small helpers shared by the modules that talk to SQLite and PostgreSQL"""
+from datetime import datetime, timezone
+
+TIMESTAMP_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+
+def sql(query, db_type):
+    """Adapt a query written with SQLite '?' placeholders to the driver in use"""
+    if db_type == "sqlite":
+        return query
+    return query.replace("?", "%s")
+
+
+def to_datetime(value):
+    """Parse a created_at value from either driver into a naive datetime"""
+    if isinstance(value, datetime):
+        return value.replace(tzinfo=None)
+    return datetime.strptime(str(value)[:19].replace("T", " "), TIMESTAMP_FORMAT)
+
+
+def parse_timestamp(value):
+    """Parse an ISO-8601 timestamp into naive UTC, converting any offset
+
+    Values without an offset are taken to be UTC already. Raises ValueError
+    for anything that is not ISO-8601.
+    """
+    moment = datetime.fromisoformat(value.strip().replace("Z", "+00:00"))
+    if moment.tzinfo is not None:
+        moment = moment.astimezone(timezone.utc).replace(tzinfo=None)
+    return moment
+
+
+def format_timestamp(value):
+    """Render a timestamp the same way for SQLite strings and PostgreSQL datetimes"""
+    if value is None:
+        return None
+    if isinstance(value, str):
+        # SQLite already stores CURRENT_TIMESTAMP in this format
+        return value[:19].replace("T", " ")
+    return to_datetime(value).strftime(TIMESTAMP_FORMAT)
+
+
+def utc_now():
+    """Naive UTC now, matching CURRENT_TIMESTAMP on both databases"""
+    return datetime.now(timezone.utc).replace(tzinfo=None)
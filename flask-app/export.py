@@ -0,0 +1,88 @@
+"""Streaming export of the reviews table
+
+Rows are read in id order with a PostgreSQL named (server-side) cursor or an
+SQLite cursor drained with fetchmany, and rendered batch by batch, so memory
+stays constant no matter how many reviews are exported. Because the order is by
+id, an interrupted export resumes with after_id set to the last id received.
+"""
+import csv
+import io
+import json
+
+from db_utils import format_timestamp, sql
+
+EXPORT_FORMATS = {
+    "ndjson": "application/x-ndjson",
+    "csv": "text/csv",
+}
+EXPORT_COLUMNS = ("id", "text", "sentiment", "confidence_score", "created_at")
+EXPORT_BATCH_SIZE = 2000
+
+
+def iter_batches(conn, db_type, after_id=0, batch_size=EXPORT_BATCH_SIZE):
+    """Yield lists of review rows with id > after_id, in id order"""
+    if db_type == "sqlite":
+        cur = conn.cursor()
+    else:
+        cur = conn.cursor(name="reviews_export")
+        cur.itersize = batch_size
+    try:
+        cur.execute(sql("""
+            SELECT id, text, sentiment, confidence_score, created_at
+            FROM reviews
+            WHERE id > ?
+            ORDER BY id;
+        """, db_type), (after_id,))
+        while True:
+            rows = cur.fetchmany(batch_size)
+            if not rows:
+                break
+            yield rows
+    finally:
+        cur.close()
+
+
+def _record(row):
+    return {
+        "id": row[0],
+        "text": row[1],
+        "sentiment": row[2],
+        "confidence_score": float(row[3]) if row[3] is not None else None,
+        "created_at": format_timestamp(row[4]),
+    }
+
+
+def render_ndjson(batches):
+    """One JSON object per line, one chunk per batch"""
+    for rows in batches:
+        yield "".join(json.dumps(_record(row), ensure_ascii=False) + "\n" for row in rows)
+
+
+def render_csv(batches):
+    """CSV with a header row, one chunk per batch"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(EXPORT_COLUMNS)
+    for rows in batches:
+        for row in rows:
+            record = _record(row)
+            writer.writerow([record[column] for column in EXPORT_COLUMNS])
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue()
+
+
+RENDERERS = {
+    "ndjson": render_ndjson,
+    "csv": render_csv,
+}
+
+
+def stream(conn, db_type, fmt="ndjson", after_id=0, batch_size=EXPORT_BATCH_SIZE):
+    """Render the export and close the connection once the client is done"""
+    try:
+        yield from RENDERERS[fmt](iter_batches(conn, db_type, after_id, batch_size))
+    finally:
+        conn.close()
@@ -0,0 +1,29 @@
+"""gunicorn settings for the sentiment API
+
+    PROMETHEUS_MULTIPROC_DIR=/tmp/sentiment-metrics gunicorn app:app
+
+gunicorn reads this file from the working directory by default; command line
+flags still win. With PROMETHEUS_MULTIPROC_DIR set, the directory is emptied
+at startup and each exiting worker is marked dead so its live gauges stop
+counting towards /metrics.
+"""
+import os
+import shutil
+
+bind = os.getenv("GUNICORN_BIND", "0.0.0.0:5000")
+workers = int(os.getenv("GUNICORN_WORKERS", "2"))
+threads = int(os.getenv("GUNICORN_THREADS", "8"))
+
+
+def on_starting(server):
+    path = os.getenv("PROMETHEUS_MULTIPROC_DIR")
+    if path:
+        # Samples left over from a previous run would be counted again
+        shutil.rmtree(path, ignore_errors=True)
+        os.makedirs(path, exist_ok=True)
+
+
+def child_exit(server, worker):
+    if os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        from prometheus_client import multiprocess
+        multiprocess.mark_process_dead(worker.pid)
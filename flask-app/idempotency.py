@@ -0,0 +1,262 @@
+"""Idempotency keys for POST /predict
+
+A client that retries a submission sends the same Idempotency-Key each time.
+The first request with a key claims it in the idempotency_keys table, runs,
+and stores its response there; repeats get that stored response (same id,
+nothing rescored or reinserted) until the key expires after
+IDEMPOTENCY_TTL_SECONDS. Recent keys are also kept in an in-memory LRU so most
+repeats never touch the database.
+
+Concurrent duplicates wait for the first request instead of racing it: in the
+same process they wait on its Future, and across processes the unique key in
+the table decides the owner while the others poll for its response. A claim
+whose owner died is taken over after IDEMPOTENCY_PENDING_STALE_SECONDS.
+"""
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future, TimeoutError
+
+import metrics
+from db_utils import sql
+
+IDEMPOTENCY_TTL_SECONDS = float(os.getenv("IDEMPOTENCY_TTL_SECONDS", "86400"))
+IDEMPOTENCY_CACHE_SIZE = int(os.getenv("IDEMPOTENCY_CACHE_SIZE", "10000"))
+IDEMPOTENCY_WAIT_SECONDS = float(os.getenv("IDEMPOTENCY_WAIT_SECONDS", "30"))
+IDEMPOTENCY_PENDING_STALE_SECONDS = float(os.getenv("IDEMPOTENCY_PENDING_STALE_SECONDS", "60"))
+IDEMPOTENCY_KEY_MAX_LENGTH = 255
+
+# Expired rows are purged on every Nth claim
+PURGE_EVERY = 1000
+POLL_SECONDS = 0.05
+
+
+class KeyReused(Exception):
+    """Raised when a key is sent again with a different request body"""
+
+
+class InProgress(Exception):
+    """Raised when the request holding a key does not finish in time"""
+
+
+def create_table(cur, db_type):
+    """Create the table of claimed keys and their stored responses"""
+    real = "REAL" if db_type == "sqlite" else "DOUBLE PRECISION"
+    cur.execute(f"""
+        CREATE TABLE IF NOT EXISTS idempotency_keys (
+            key TEXT PRIMARY KEY,
+            request_hash TEXT NOT NULL,
+            status_code INTEGER,
+            response TEXT,
+            created_ts {real} NOT NULL,
+            completed_ts {real}
+        );
+    """)
+
+
+def fingerprint(*parts):
+    """Hash of the request fields a key must always be sent with"""
+    return hashlib.sha256("\0".join(parts).encode("utf-8")).hexdigest()
+
+
+class IdempotencyStore:
+    """Runs each keyed request once and replays its response to repeats
+
+    Stored responses are serialized with dumps; pass the app's JSON encoder so
+    values like PostgreSQL datetimes are stored as the response rendered them.
+    """
+
+    def __init__(self, connect, db_type, ttl=IDEMPOTENCY_TTL_SECONDS,
+                 cache_size=IDEMPOTENCY_CACHE_SIZE, wait=IDEMPOTENCY_WAIT_SECONDS, dumps=json.dumps):
+        self.connect = connect
+        self.db_type = db_type
+        self.dumps = dumps
+        self.ttl = ttl
+        self.cache_size = cache_size
+        self.wait = wait
+        self.hits = 0
+        self.misses = 0
+        self._cache = OrderedDict()
+        self._inflight = {}
+        self._claims = 0
+        self._lock = threading.Lock()
+
+    def run(self, key, request_hash, fn):
+        """Return (fn's (payload, status, headers), replayed) for this key
+
+        Only 200 responses are remembered or replayed; anything else releases
+        the key, so the client's next retry, or a duplicate that was waiting
+        on this one, runs for real.
+        """
+        while True:
+            cached = self._cache_get(key)
+            metrics.cache_lookup("idempotency", cached is not None)
+            if cached is not None:
+                return self._replay(cached, request_hash)
+
+            with self._lock:
+                future = self._inflight.get(key)
+                owner = future is None
+                if owner:
+                    future = self._inflight[key] = Future()
+            if owner:
+                break
+
+            try:
+                request_hash_seen, result = future.result(timeout=self.wait)
+            except TimeoutError:
+                raise InProgress()
+            if result[1] == 200:
+                return self._replay((request_hash_seen, result), request_hash)
+            # The first request failed and released the key: run this one for real
+
+        try:
+            outcome = self._run_once(key, request_hash, fn)
+        except BaseException as e:
+            self._finish(key, future, exception=e)
+            raise
+        self._finish(key, future, result=(request_hash, outcome[0]))
+        return outcome
+
+    def _finish(self, key, future, result=None, exception=None):
+        # Unregistered before waking the waiters, so a waiter that has to run
+        # the request itself never finds this finished future again
+        with self._lock:
+            self._inflight.pop(key, None)
+        if exception is not None:
+            future.set_exception(exception)
+        else:
+            future.set_result(result)
+
+    def _replay(self, entry, request_hash):
+        stored_hash, (payload, status, headers) = entry
+        if stored_hash != request_hash:
+            raise KeyReused()
+        with self._lock:
+            self.hits += 1
+        return (payload, status, {}), True
+
+    def _run_once(self, key, request_hash, fn):
+        conn = self.connect()
+        if conn is None:
+            # No database: the in-memory cache is all there is
+            with self._lock:
+                self.misses += 1
+            result = fn()
+            self._remember(key, request_hash, result)
+            return result, False
+
+        try:
+            deadline = time.monotonic() + self.wait
+            while True:
+                if self._claim(conn, key, request_hash):
+                    with self._lock:
+                        self.misses += 1
+                    try:
+                        result = fn()
+                    except Exception:
+                        self._release(conn, key)
+                        raise
+                    if result[1] == 200:
+                        self._complete(conn, key, result)
+                        self._remember(key, request_hash, result)
+                    else:
+                        self._release(conn, key)
+                    return result, False
+
+                # Another process owns the key: wait for its response
+                row = self._load(conn, key)
+                if row is not None and row[1] is not None:
+                    stored = (row[0], (json.loads(row[2]), row[1], {}))
+                    self._cache_put(key, stored)
+                    return self._replay(stored, request_hash)
+                if time.monotonic() > deadline:
+                    raise InProgress()
+                if row is not None:
+                    time.sleep(POLL_SECONDS)
+        finally:
+            conn.close()
+
+    def _claim(self, conn, key, request_hash):
+        now = time.time()
+        cur = conn.cursor()
+        # Expired responses and abandoned claims no longer hold the key
+        cur.execute(sql("""
+            DELETE FROM idempotency_keys
+            WHERE key = ? AND (created_ts < ? OR (completed_ts IS NULL AND created_ts < ?));
+        """, self.db_type), (key, now - self.ttl, now - IDEMPOTENCY_PENDING_STALE_SECONDS))
+        cur.execute(sql("""
+            INSERT INTO idempotency_keys (key, request_hash, created_ts)
+            VALUES (?, ?, ?)
+            ON CONFLICT (key) DO NOTHING;
+        """, self.db_type), (key, request_hash, now))
+        claimed = cur.rowcount == 1
+
+        with self._lock:
+            self._claims += 1
+            purge = self._claims % PURGE_EVERY == 0
+        if purge:
+            cur.execute(sql("DELETE FROM idempotency_keys WHERE created_ts < ?;", self.db_type),
+                        (now - self.ttl,))
+        conn.commit()
+        cur.close()
+        return claimed
+
+    def _load(self, conn, key):
+        cur = conn.cursor()
+        cur.execute(sql("SELECT request_hash, status_code, response FROM idempotency_keys WHERE key = ?;",
+                        self.db_type), (key,))
+        row = cur.fetchone()
+        conn.commit()
+        cur.close()
+        return row
+
+    def _complete(self, conn, key, result):
+        payload, status, _ = result
+        cur = conn.cursor()
+        cur.execute(sql("UPDATE idempotency_keys SET status_code = ?, response = ?, completed_ts = ? WHERE key = ?;",
+                        self.db_type), (status, self.dumps(payload), time.time(), key))
+        conn.commit()
+        cur.close()
+
+    def _release(self, conn, key):
+        conn.rollback()
+        cur = conn.cursor()
+        cur.execute(sql("DELETE FROM idempotency_keys WHERE key = ? AND completed_ts IS NULL;", self.db_type), (key,))
+        conn.commit()
+        cur.close()
+
+    def _remember(self, key, request_hash, result):
+        if result[1] == 200:
+            self._cache_put(key, (request_hash, result))
+
+    def _cache_put(self, key, entry):
+        with self._lock:
+            self._cache[key] = (time.monotonic() + self.ttl, entry)
+            self._cache.move_to_end(key)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+
+    def _cache_get(self, key):
+        with self._lock:
+            item = self._cache.get(key)
+            if item is None:
+                return None
+            expires, entry = item
+            if expires < time.monotonic():
+                del self._cache[key]
+                return None
+            self._cache.move_to_end(key)
+            return entry
+
+    def stats(self):
+        with self._lock:
+            return {
+                "cached_keys": len(self._cache),
+                "in_flight": len(self._inflight),
+                "replayed": self.hits,
+                "executed": self.misses,
+            }
@@ -0,0 +1,384 @@
+"""Background scoring jobs for batches too large for /batch-predict
+
+A job's input is spooled to JOBS_DIR and a row is added to the jobs table. A
+JobRunner thread claims queued jobs, scores them in chunks on a local process
+pool and appends one NDJSON line per input record to the job's result file
+(optionally also storing the reviews). Jobs created with mode "fast" are
+scored by the analyzer's approximate lexicon-sum scorer (model.FastAnalyzer).
+After every chunk the processed count is committed, and the runner holding a
+job renews its heartbeat every JOB_HEARTBEAT_SECONDS while it works, so when a
+worker dies, a job whose heartbeat has gone stale is claimed again and resumes
+from its last committed chunk. Every update is conditional on the runner still
+owning the job; a runner that finds it has been taken over stops working on it.
+
+Usage (standalone worker, no web server):
+    python jobs.py worker [--workers 4]
+"""
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+
+import bulk_import
+import structured_log
+from db_utils import format_timestamp, sql
+
+JOBS_DIR = os.getenv("JOBS_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "jobs_data"))
+JOB_CHUNK_SIZE = int(os.getenv("JOB_CHUNK_SIZE", "1000"))
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", str(os.cpu_count() or 1)))
+JOB_POLL_SECONDS = float(os.getenv("JOB_POLL_SECONDS", "1.0"))
+JOB_STALE_SECONDS = float(os.getenv("JOB_STALE_SECONDS", "60"))
+JOB_HEARTBEAT_SECONDS = float(os.getenv("JOB_HEARTBEAT_SECONDS", str(JOB_STALE_SECONDS / 4)))
+
+log = structured_log.get_logger("jobs")
+
+JOB_COLUMNS = ("id", "status", "input_format", "total", "processed", "store_results", "mode",
+               "error", "owner", "created_at", "started_ts", "heartbeat_ts", "finished_ts")
+
+
+class LeaseLost(Exception):
+    """Another runner claimed a job after this one's heartbeat went stale"""
+
+
+def create_table(cur, db_type):
+    """Create the jobs table that lets job state survive restarts"""
+    real = "REAL" if db_type == "sqlite" else "DOUBLE PRECISION"
+    cur.execute(f"""
+        CREATE TABLE IF NOT EXISTS jobs (
+            id TEXT PRIMARY KEY,
+            status TEXT NOT NULL DEFAULT 'queued',
+            input_format TEXT NOT NULL,
+            total INTEGER NOT NULL DEFAULT 0,
+            processed INTEGER NOT NULL DEFAULT 0,
+            store_results INTEGER NOT NULL DEFAULT 0,
+            mode TEXT NOT NULL DEFAULT 'full',
+            error TEXT,
+            owner TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            started_ts {real},
+            heartbeat_ts {real},
+            finished_ts {real}
+        );
+    """)
+    # Added after the first release
+    added = {"mode": "TEXT NOT NULL DEFAULT 'full'", "owner": "TEXT"}
+    if db_type == "sqlite":
+        cur.execute("PRAGMA table_info(jobs);")
+        existing = [row[1] for row in cur.fetchall()]
+        for column, definition in added.items():
+            if column not in existing:
+                cur.execute(f"ALTER TABLE jobs ADD COLUMN {column} {definition};")
+    else:
+        for column, definition in added.items():
+            cur.execute(f"ALTER TABLE jobs ADD COLUMN IF NOT EXISTS {column} {definition};")
+
+
+def input_path(job_id, fmt):
+    return os.path.join(JOBS_DIR, f"{job_id}.input.{fmt}")
+
+
+def result_path(job_id):
+    return os.path.join(JOBS_DIR, f"{job_id}.results.ndjson")
+
+
+def create_job(conn, db_type, fmt, write_input, store_results=False, mode="full"):
+    """Spool the input with write_input(file) and queue a job scoring it in mode"""
+    os.makedirs(JOBS_DIR, exist_ok=True)
+    job_id = uuid.uuid4().hex
+    path = input_path(job_id, fmt)
+    with open(path, "w", encoding="utf-8", newline="") as f:
+        write_input(f)
+    try:
+        with open(path, encoding="utf-8", newline="") as f:
+            total = sum(1 for _ in bulk_import.read_records(f, fmt))
+    except (ValueError, KeyError):
+        os.remove(path)
+        raise
+
+    cur = conn.cursor()
+    cur.execute(sql("""
+        INSERT INTO jobs (id, status, input_format, total, store_results, mode)
+        VALUES (?, 'queued', ?, ?, ?, ?);
+    """, db_type), (job_id, fmt, total, int(store_results), mode))
+    conn.commit()
+    cur.close()
+    return job_id
+
+
+def get_job(conn, db_type, job_id):
+    cur = conn.cursor()
+    cur.execute(sql(f"SELECT {', '.join(JOB_COLUMNS)} FROM jobs WHERE id = ?;", db_type), (job_id,))
+    row = cur.fetchone()
+    cur.close()
+    return dict(zip(JOB_COLUMNS, row)) if row else None
+
+
+def describe(job, now=None):
+    """Job status with progress, throughput and ETA for the API"""
+    now = now or time.time()
+    total, processed = job["total"], job["processed"]
+    elapsed = None
+    if job["started_ts"]:
+        elapsed = (job["finished_ts"] or now) - job["started_ts"]
+    throughput = processed / elapsed if elapsed else None
+    eta = None
+    if job["status"] in ("queued", "running") and throughput:
+        eta = round((total - processed) / throughput, 1)
+
+    return {
+        "id": job["id"],
+        "job_status": job["status"],
+        "total": total,
+        "processed": processed,
+        "progress": round(processed / total, 4) if total else 1.0,
+        "mode": job["mode"],
+        "elapsed_seconds": round(elapsed, 3) if elapsed is not None else None,
+        "throughput_per_sec": round(throughput, 1) if throughput else None,
+        "eta_seconds": eta,
+        "error": job["error"],
+        "created_at": format_timestamp(job["created_at"]),
+    }
+
+
+def iter_results(job):
+    """Yield committed result lines; lines past the processed count are not final yet"""
+    path = result_path(job["id"])
+    if not os.path.exists(path):
+        return
+    remaining = job["processed"]
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            if remaining <= 0:
+                break
+            remaining -= 1
+            yield line
+
+
+def _truncate_lines(path, keep):
+    """Cut a result file back to its first keep lines after a crash mid-chunk"""
+    if not os.path.exists(path):
+        open(path, "w").close()
+        return
+    with open(path, "rb+") as f:
+        for _ in range(keep):
+            if not f.readline():
+                break
+        f.truncate()
+
+
+class JobRunner:
+    """Claims and executes jobs on a local process pool"""
+
+    def __init__(self, connect, db_type, workers=JOB_WORKERS, chunk_size=JOB_CHUNK_SIZE):
+        self.connect = connect
+        self.db_type = db_type
+        self.workers = workers
+        self.chunk_size = chunk_size
+        self.owner = f"{os.getpid()}-{uuid.uuid4().hex[:8]}"
+        self._thread = None
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stop = threading.Event()
+
+    def ensure_started(self):
+        """Start the runner thread once per process and nudge it to poll now"""
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self.run_forever, name="job-runner", daemon=True)
+                self._thread.start()
+        self._wakeup.set()
+
+    def stop(self):
+        self._stop.set()
+        self._wakeup.set()
+
+    def run_forever(self):
+        pool = ProcessPoolExecutor(max_workers=self.workers) if self.workers > 1 else None
+        try:
+            while not self._stop.is_set():
+                try:
+                    busy = self.run_next(pool)
+                except Exception as e:
+                    log.error("job_runner_error", error=str(e))
+                    busy = False
+                if not busy:
+                    self._wakeup.wait(JOB_POLL_SECONDS)
+                    self._wakeup.clear()
+        finally:
+            if pool:
+                pool.shutdown(cancel_futures=True)
+
+    def claim(self, conn):
+        """Atomically take a queued job or one whose owner stopped heartbeating"""
+        now = time.time()
+        cur = conn.cursor()
+        cur.execute(sql("""
+            SELECT id FROM jobs
+            WHERE status = 'queued' OR (status = 'running' AND heartbeat_ts < ?)
+            ORDER BY created_at
+            LIMIT 1;
+        """, self.db_type), (now - JOB_STALE_SECONDS,))
+        row = cur.fetchone()
+        if row is None:
+            cur.close()
+            return None
+
+        cur.execute(sql("""
+            UPDATE jobs
+            SET status = 'running', owner = ?, heartbeat_ts = ?, started_ts = COALESCE(started_ts, ?)
+            WHERE id = ? AND (status = 'queued' OR (status = 'running' AND heartbeat_ts < ?));
+        """, self.db_type), (self.owner, now, now, row[0], now - JOB_STALE_SECONDS))
+        claimed = cur.rowcount == 1
+        conn.commit()
+        cur.close()
+        return get_job(conn, self.db_type, row[0]) if claimed else None
+
+    def run_next(self, pool=None):
+        """Run one job to completion; returns False when there was nothing to do"""
+        conn = self.connect()
+        if conn is None:
+            return False
+        try:
+            job = self.claim(conn)
+            if job is None:
+                return False
+            done = threading.Event()
+            heartbeat = threading.Thread(target=self.heartbeat, args=(job["id"], done),
+                                         name="job-heartbeat", daemon=True)
+            heartbeat.start()
+            try:
+                self.execute(conn, job, pool)
+            except LeaseLost:
+                conn.rollback()
+                log.warning("job_lease_lost", job_id=job["id"], owner=self.owner)
+            except Exception as e:
+                conn.rollback()
+                cur = conn.cursor()
+                cur.execute(sql("""
+                    UPDATE jobs SET status = 'failed', error = ?, finished_ts = ? WHERE id = ? AND owner = ?;
+                """, self.db_type), (str(e), time.time(), job["id"], self.owner))
+                conn.commit()
+                cur.close()
+                log.error("job_failed", job_id=job["id"], error=str(e))
+            finally:
+                done.set()
+                heartbeat.join()
+            return True
+        finally:
+            conn.close()
+
+    def heartbeat(self, job_id, done):
+        """Renew the job's heartbeat until done is set or the job is taken over
+
+        Runs on its own connection, so a chunk that takes longer than
+        JOB_STALE_SECONDS to score does not let another runner claim the job.
+        """
+        conn = self.connect()
+        if conn is None:
+            return
+        try:
+            while not done.wait(JOB_HEARTBEAT_SECONDS):
+                try:
+                    if not self.renew(conn, job_id):
+                        return
+                except Exception as e:
+                    conn.rollback()
+                    log.error("job_heartbeat_error", job_id=job_id, error=str(e))
+        finally:
+            conn.close()
+
+    def renew(self, conn, job_id):
+        """Move the heartbeat forward if this runner still owns the job"""
+        cur = conn.cursor()
+        cur.execute(sql("UPDATE jobs SET heartbeat_ts = ? WHERE id = ? AND owner = ? AND status = 'running';",
+                        self.db_type), (time.time(), job_id, self.owner))
+        owned = cur.rowcount == 1
+        conn.commit()
+        cur.close()
+        return owned
+
+    def execute(self, conn, job, pool=None):
+        out_path = result_path(job["id"])
+        _truncate_lines(out_path, job["processed"])
+        processed = job["processed"]
+        cur = conn.cursor()
+
+        with open(input_path(job["id"], job["input_format"]), encoding="utf-8", newline="") as source, \
+                open(out_path, "a", encoding="utf-8") as out:
+            records = bulk_import.read_records(source, job["input_format"])
+            for _ in range(processed):
+                next(records, None)
+
+            chunks = bulk_import.chunked(records, self.chunk_size)
+            for chunk, (version, scores) in bulk_import.scored_chunks(chunks, pool, depth=self.workers * 2,
+                                                                         mode=job["mode"]):
+                # Locks the job row until the chunk is committed, so nobody can
+                # claim the job while this runner appends to its result file
+                cur.execute(sql("UPDATE jobs SET heartbeat_ts = ? WHERE id = ? AND owner = ?;", self.db_type),
+                            (time.time(), job["id"], self.owner))
+                if cur.rowcount != 1:
+                    raise LeaseLost(job["id"])
+
+                texts = [text for text, _ in chunk]
+                out.write("".join(
+                    json.dumps({"index": processed + i, "text": text,
+                                "sentiment": sentiment, "confidence_score": confidence}) + "\n"
+                    for i, (text, (sentiment, confidence)) in enumerate(zip(texts, scores))
+                ))
+                out.flush()
+                os.fsync(out.fileno())
+
+                if job["store_results"]:
+                    rows = [(text, sentiment, confidence, created_at)
+                            for (text, created_at), (sentiment, confidence) in zip(chunk, scores)
+                            if text]
+                    self._store(cur, rows, version)
+
+                processed += len(chunk)
+                cur.execute(sql("UPDATE jobs SET processed = ? WHERE id = ? AND owner = ?;", self.db_type),
+                            (processed, job["id"], self.owner))
+                conn.commit()
+
+        cur.execute(sql("""
+            UPDATE jobs SET status = 'done', finished_ts = ?, heartbeat_ts = ? WHERE id = ? AND owner = ?;
+        """, self.db_type), (time.time(), time.time(), job["id"], self.owner))
+        if cur.rowcount != 1:
+            raise LeaseLost(job["id"])
+        conn.commit()
+        cur.close()
+
+    def _store(self, cur, rows, version):
+        if not rows:
+            return
+        if any(created_at is None for *_, created_at in rows):
+            cur.execute("SELECT CURRENT_TIMESTAMP;")
+            now = format_timestamp(cur.fetchone()[0])
+            rows = [(text, sentiment, confidence, created_at or now)
+                    for text, sentiment, confidence, created_at in rows]
+        bulk_import.load_rows(cur, self.db_type, rows, version)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run the background job worker")
+    sub = parser.add_subparsers(dest="command", required=True)
+    worker = sub.add_parser("worker", help="claim and run jobs until interrupted")
+    worker.add_argument("--workers", type=int, default=JOB_WORKERS)
+    args = parser.parse_args(argv)
+
+    from app import DB_TYPE, get_db_connection
+
+    runner = JobRunner(get_db_connection, DB_TYPE, workers=args.workers)
+    log.info("job_worker_started", owner=runner.owner, workers=args.workers)
+    try:
+        runner.run_forever()
+    except KeyboardInterrupt:
+        runner.stop()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
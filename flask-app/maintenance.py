@@ -0,0 +1,80 @@
+"""Database maintenance commands
+
+Usage:
+    python maintenance.py partitions [--months-ahead 3] [--from 2024-01]
+    python maintenance.py purge --older-than-days 365 [--batch-size 5000]
+    python maintenance.py purge --before 2025-01-01
+"""
+import argparse
+import sys
+from datetime import datetime, timedelta
+
+import retention
+from app import DB_TYPE, get_db_connection
+from db_utils import parse_timestamp, utc_now
+
+
+def cmd_partitions(args):
+    """Create monthly partitions ahead of time (PostgreSQL with REVIEWS_PARTITIONING=monthly)"""
+    if DB_TYPE == "sqlite":
+        print("⚠️  Partitioning is only available on PostgreSQL")
+        return 1
+
+    conn = get_db_connection()
+    if conn is None:
+        return 1
+    cur = conn.cursor()
+    if not retention.is_partitioned(cur):
+        print("⚠️  reviews is not partitioned, set REVIEWS_PARTITIONING=monthly on a fresh database")
+        conn.close()
+        return 1
+
+    start = datetime.strptime(args.start, "%Y-%m") if args.start else None
+    created = retention.ensure_partitions(cur, args.months_ahead, start)
+    conn.commit()
+    cur.close()
+    conn.close()
+    print(f"✅ Created {len(created)} partition(s): {', '.join(created) or '-'}")
+    return 0
+
+
+def cmd_purge(args):
+    """Delete reviews older than the cutoff, partition by partition where possible"""
+    if args.before:
+        cutoff = parse_timestamp(args.before)
+    else:
+        cutoff = utc_now() - timedelta(days=args.older_than_days)
+
+    conn = get_db_connection()
+    if conn is None:
+        return 1
+    result = retention.purge_before(conn, DB_TYPE, cutoff, args.batch_size)
+    conn.close()
+    print(f"✅ Purged reviews before {cutoff:%Y-%m-%d %H:%M:%S}: "
+          f"{len(result['dropped_partitions'])} partition(s) dropped, "
+          f"{result['deleted_rows']} row(s) deleted")
+    return 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Movie sentiment database maintenance")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    partitions = sub.add_parser("partitions", help="create upcoming monthly partitions")
+    partitions.add_argument("--months-ahead", type=int, default=retention.PARTITION_MONTHS_AHEAD)
+    partitions.add_argument("--from", dest="start", help="first month to create, as YYYY-MM")
+    partitions.set_defaults(func=cmd_partitions)
+
+    purge = sub.add_parser("purge", help="delete reviews older than a cutoff")
+    cutoff = purge.add_mutually_exclusive_group(required=True)
+    cutoff.add_argument("--older-than-days", type=int)
+    cutoff.add_argument("--before", help="ISO date or timestamp")
+    purge.add_argument("--batch-size", type=int, default=retention.PURGE_BATCH_SIZE)
+    purge.set_defaults(func=cmd_purge)
+
+    args = parser.parse_args(argv)
+    return args.func(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,230 @@
+"""Prometheus metrics for the sentiment API, served at GET /metrics
+
+Covers request counts and latency per route and status, scoring time by text
+length, DB connect/query/commit time, cache hits and misses (hit ratio is
+rate(hit) / rate(hit + miss)), requests and retries reported by clients to
+POST /client-metrics and gauges for lane queues, admission and thread pools.
+
+With several gunicorn workers, point PROMETHEUS_MULTIPROC_DIR at an empty
+directory before starting (gunicorn.conf.py clears it and marks exited
+workers dead). Every worker then records its samples in mmap files there and
+/metrics aggregates all of them, whichever worker serves the scrape. When
+prometheus_client is not installed, or METRICS_ENABLED=0, every metric is a
+no-op and /metrics answers 503.
+"""
+import functools
+import os
+import sqlite3
+import time
+
+import psycopg2.extensions
+
+import slowlog
+import timing
+
+try:
+    import prometheus_client
+    from prometheus_client import CollectorRegistry, Counter, Gauge, Histogram, multiprocess
+except ImportError:
+    prometheus_client = None
+
+METRICS_ENABLED = prometheus_client is not None and os.getenv("METRICS_ENABLED", "1") == "1"
+MULTIPROCESS = bool(os.getenv("PROMETHEUS_MULTIPROC_DIR"))
+
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+DB_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1)
+TEXT_LENGTH_BUCKETS = ((100, "0-100"), (500, "100-500"), (2000, "500-2000"), (10000, "2000-10000"))
+
+
+class _NoOp:
+    """Stands in for every metric when metrics are disabled"""
+
+    def labels(self, *args, **kwargs):
+        return self
+
+    def inc(self, amount=1):
+        pass
+
+    def dec(self, amount=1):
+        pass
+
+    def observe(self, amount):
+        pass
+
+
+if METRICS_ENABLED:
+    REQUESTS = Counter("sentiment_http_requests_total", "HTTP requests served",
+                       ["route", "method", "status"])
+    REQUEST_LATENCY = Histogram("sentiment_http_request_duration_seconds", "Time to produce a response",
+                                ["route", "method", "status"], buckets=LATENCY_BUCKETS)
+    SCORING_LATENCY = Histogram("sentiment_scoring_duration_seconds", "Time to score one text",
+                                ["text_length"], buckets=LATENCY_BUCKETS)
+    DB_LATENCY = Histogram("sentiment_db_operation_duration_seconds", "Time spent in the database",
+                           ["operation"], buckets=DB_BUCKETS)
+    CACHE_REQUESTS = Counter("sentiment_cache_requests_total", "Cache lookups", ["cache", "result"])
+    LANE_QUEUED = Gauge("sentiment_lane_queued", "Scoring work waiting for a lane worker",
+                        ["lane"], multiprocess_mode="livesum")
+    LANE_RUNNING = Gauge("sentiment_lane_running", "Scoring work running on a lane",
+                         ["lane"], multiprocess_mode="livesum")
+    ADMISSION_IN_FLIGHT = Gauge("sentiment_admission_in_flight", "Admitted requests not yet finished",
+                                multiprocess_mode="livesum")
+    POOL_BUSY = Gauge("sentiment_pool_busy_threads", "Busy threads per thread pool",
+                      ["pool"], multiprocess_mode="livesum")
+    CLIENT_REQUESTS = Counter("sentiment_client_requests_total", "Requests reported by clients",
+                              ["route", "outcome"])
+    CLIENT_RETRIES = Counter("sentiment_client_retries_total", "Retries clients needed, as they reported them",
+                             ["route", "outcome"])
+else:
+    REQUESTS = REQUEST_LATENCY = SCORING_LATENCY = DB_LATENCY = CACHE_REQUESTS = _NoOp()
+    CLIENT_REQUESTS = CLIENT_RETRIES = _NoOp()
+    LANE_QUEUED = LANE_RUNNING = ADMISSION_IN_FLIGHT = POOL_BUSY = _NoOp()
+
+
+def text_length_label(length):
+    for limit, label in TEXT_LENGTH_BUCKETS:
+        if length < limit:
+            return label
+    return f"{TEXT_LENGTH_BUCKETS[-1][0]}+"
+
+
+def observe_request(route, method, status, seconds):
+    status = str(status)
+    REQUESTS.labels(route, method, status).inc()
+    REQUEST_LATENCY.labels(route, method, status).observe(seconds)
+
+
+def observe_client_request(route, outcome, retries):
+    CLIENT_REQUESTS.labels(route, outcome).inc()
+    CLIENT_RETRIES.labels(route, outcome).inc(retries)
+
+
+def client_totals():
+    """{(route, outcome): {"requests": n, "retries": n}} reported by clients, across worker processes"""
+    totals = {}
+    fields = {"sentiment_client_requests_total": "requests", "sentiment_client_retries_total": "retries"}
+    for metric in registry().collect():
+        for sample in metric.samples:
+            if sample.name in fields:
+                key = (sample.labels["route"], sample.labels["outcome"])
+                entry = totals.setdefault(key, {"requests": 0, "retries": 0})
+                entry[fields[sample.name]] += int(sample.value)
+    return totals
+
+
+def timed_scoring(fn):
+    """Wrap a fn(text) scorer so each call is recorded by text length"""
+    if not METRICS_ENABLED:
+        return fn
+
+    @functools.wraps(fn)
+    def wrapper(text, *args):
+        start = time.perf_counter()
+        try:
+            return fn(text, *args)
+        finally:
+            SCORING_LATENCY.labels(text_length_label(len(text))).observe(time.perf_counter() - start)
+    return wrapper
+
+
+def observe_db(operation, start, statement=None, params=None):
+    """Record a DB operation that began at perf_counter() value start"""
+    seconds = time.perf_counter() - start
+    DB_LATENCY.labels(operation).observe(seconds)
+    timing.record(f"db_{operation}", seconds)
+    if statement is not None:
+        timing.record_statement(statement, seconds)
+        slowlog.check_query(statement, params, seconds)
+
+
+def cache_lookup(cache, hit):
+    result = "hit" if hit else "miss"
+    CACHE_REQUESTS.labels(cache, result).inc()
+    timing.note(f"cache_{cache}", result)
+
+
+class _TimedSqliteCursor(sqlite3.Cursor):
+    def execute(self, statement, params=()):
+        start = time.perf_counter()
+        try:
+            return super().execute(statement, params)
+        finally:
+            observe_db("query", start, statement, params)
+
+    def executemany(self, statement, params_seq):
+        start = time.perf_counter()
+        try:
+            return super().executemany(statement, params_seq)
+        finally:
+            observe_db("query", start, statement, [])
+
+
+class TimedSqliteConnection(sqlite3.Connection):
+    """sqlite3 connection whose cursors and commits are timed"""
+
+    def cursor(self, factory=_TimedSqliteCursor):
+        return super().cursor(factory)
+
+    def commit(self):
+        start = time.perf_counter()
+        try:
+            return super().commit()
+        finally:
+            observe_db("commit", start)
+
+
+class _TimedPgCursor(psycopg2.extensions.cursor):
+    def execute(self, query, vars=None):
+        start = time.perf_counter()
+        try:
+            return super().execute(query, vars)
+        finally:
+            observe_db("query", start, query, vars)
+
+    def executemany(self, query, vars_list):
+        start = time.perf_counter()
+        try:
+            return super().executemany(query, vars_list)
+        finally:
+            observe_db("query", start, query, [])
+
+    def copy_expert(self, sql, file, size=8192):
+        start = time.perf_counter()
+        try:
+            return super().copy_expert(sql, file, size)
+        finally:
+            observe_db("query", start, sql, [])
+
+
+class TimedPgConnection(psycopg2.extensions.connection):
+    """psycopg2 connection whose cursors and commits are timed"""
+
+    def cursor(self, *args, **kwargs):
+        kwargs.setdefault("cursor_factory", _TimedPgCursor)
+        return super().cursor(*args, **kwargs)
+
+    def commit(self):
+        start = time.perf_counter()
+        try:
+            return super().commit()
+        finally:
+            observe_db("commit", start)
+
+
+# Connection classes for get_db_connection; plain ones when nothing reads the timings
+TIMED_DB = METRICS_ENABLED or timing.SERVER_TIMING or slowlog.SLOW_LOG_ENABLED
+SQLITE_CONNECTION = TimedSqliteConnection if TIMED_DB else sqlite3.Connection
+PG_CONNECTION = TimedPgConnection if TIMED_DB else psycopg2.extensions.connection
+
+
+def registry():
+    """The registry holding every worker's samples"""
+    if MULTIPROCESS:
+        collected = CollectorRegistry()
+        multiprocess.MultiProcessCollector(collected)
+        return collected
+    return prometheus_client.REGISTRY
+
+
+def render():
+    """Current metrics in the Prometheus text format, with their content type"""
+    return prometheus_client.generate_latest(registry()), prometheus_client.CONTENT_TYPE_LATEST
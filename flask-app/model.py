@@ -1,108 +1,204 @@
+import hashlib
+import itertools
+import json
+import math
 import nltk
 import os
+import re
+import string
+import threading
+import time
 
-# DEBUG: Print all paths
-print("=== NLTK DEBUG ===")
-print("NLTK_DATA env:", os.getenv('NLTK_DATA'))
-print("Current NLTK paths:", nltk.data.path)
+from nltk.sentiment.vader import VaderConstants
+
+import structured_log
+
+log = structured_log.get_logger("model")
 
 # Set NLTK data path - FORCE the Docker path
 docker_path = '/usr/local/nltk_data'
 nltk.data.path.append(docker_path)
-print(f"Force added Docker path: {docker_path}")
-
-# Check if the path exists and what's in it
-if os.path.exists(docker_path):
-    print(f"Docker path exists: {docker_path}")
-    sentiment_dir = os.path.join(docker_path, 'sentiment')
-    if os.path.exists(sentiment_dir):
-        print("Files in sentiment directory:", os.listdir(sentiment_dir))
-else:
-    print(f"Docker path does NOT exist: {docker_path}")
+log.debug("nltk_paths", nltk_data=os.getenv('NLTK_DATA'), paths=nltk.data.path,
+          docker_path_exists=os.path.exists(docker_path))
 
-try:
-    # Try to use VADER sentiment analyzer
-    nltk.data.find('sentiment/vader_lexicon')
-    from nltk.sentiment import SentimentIntensityAnalyzer
-    sia = SentimentIntensityAnalyzer()
-    print("✅ Using VADER sentiment analyzer")
-except LookupError as e:
-    print(f"❌ VADER not found: {e}")
-    # Fallback to simple rule-based analyzer
-    print("NLTK vader_lexicon not found, using fallback sentiment analysis")
+
+class SimpleSentimentAnalyzer:
+    """Word-list scorer used when the VADER lexicon is not installed"""
+
+    def __init__(self):
+        self.positive_words = {
+            'good', 'great', 'awesome', 'excellent', 'amazing', 'love', 'best', 
+            'fantastic', 'wonderful', 'brilliant', 'outstanding', 'superb', 'perfect',
+            'enjoyed', 'liked', 'beautiful', 'masterpiece', 'impressive', 'incredible',
+            'favorite', 'recommend', 'enjoyable', 'pleasantly', 'surprised', 'love',
+            'fantastic', 'amazing', 'brilliant', 'outstanding'
+        }
+        self.negative_words = {
+            'bad', 'terrible', 'awful', 'poor', 'hate', 'worst', 'boring',
+            'horrible', 'disappointing', 'waste', 'rubbish', 'stupid', 'dull',
+            'annoying', 'hated', 'dislike', 'unfortunately', 'weak', 'mess',
+            'confusing', 'predictable', 'cliche', 'pointless', 'hate', 'terrible',
+            'awful', 'horrible', 'disappointing'
+        }
+        self.intensifiers = {
+            'absolutely', 'extremely', 'incredibly', 'totally', 'completely',
+            'utterly', 'especially', 'particularly', 'very', 'really', 'so'
+        }
     
-    class SimpleSentimentAnalyzer:
-        def __init__(self):
-            self.positive_words = {
-                'good', 'great', 'awesome', 'excellent', 'amazing', 'love', 'best', 
-                'fantastic', 'wonderful', 'brilliant', 'outstanding', 'superb', 'perfect',
-                'enjoyed', 'liked', 'beautiful', 'masterpiece', 'impressive', 'incredible',
-                'favorite', 'recommend', 'enjoyable', 'pleasantly', 'surprised', 'love',
-                'fantastic', 'amazing', 'brilliant', 'outstanding'
-            }
-            self.negative_words = {
-                'bad', 'terrible', 'awful', 'poor', 'hate', 'worst', 'boring',
-                'horrible', 'disappointing', 'waste', 'rubbish', 'stupid', 'dull',
-                'annoying', 'hated', 'dislike', 'unfortunately', 'weak', 'mess',
-                'confusing', 'predictable', 'cliche', 'pointless', 'hate', 'terrible',
-                'awful', 'horrible', 'disappointing'
-            }
-            self.intensifiers = {
-                'absolutely', 'extremely', 'incredibly', 'totally', 'completely',
-                'utterly', 'especially', 'particularly', 'very', 'really', 'so'
-            }
+    def polarity_scores(self, text):
+        text_lower = text.lower()
+        words = text_lower.split()
         
-        def polarity_scores(self, text):
-            text_lower = text.lower()
-            words = text_lower.split()
-            
-            positive_score = 0
-            negative_score = 0
-            total_words = len(words)
-            
-            for i, word in enumerate(words):
-                # Check for positive words
-                if word in self.positive_words:
-                    positive_score += 1
-                    # Check for intensifiers before the word
-                    if i > 0 and words[i-1] in self.intensifiers:
-                        positive_score += 0.5
-                
-                # Check for negative words
-                if word in self.negative_words:
-                    negative_score += 1
-                    # Check for intensifiers before the word
-                    if i > 0 and words[i-1] in self.intensifiers:
-                        negative_score += 0.5
-            
-            # Calculate compound score
-            if total_words == 0:
-                compound = 0
-            else:
-                # Normalize scores and create compound
-                pos_norm = positive_score / total_words
-                neg_norm = negative_score / total_words
-                compound = pos_norm - neg_norm
+        positive_score = 0
+        negative_score = 0
+        total_words = len(words)
+        
+        for i, word in enumerate(words):
+            # Check for positive words
+            if word in self.positive_words:
+                positive_score += 1
+                # Check for intensifiers before the word
+                if i > 0 and words[i-1] in self.intensifiers:
+                    positive_score += 0.5
             
-            return {
-                'neg': min(negative_score / max(total_words, 1), 1.0),
-                'neu': max(1 - (positive_score + negative_score) / max(total_words, 1), 0),
-                'pos': min(positive_score / max(total_words, 1), 1.0),
-                'compound': compound
-            }
-    
-    sia = SimpleSentimentAnalyzer()
+            # Check for negative words
+            if word in self.negative_words:
+                negative_score += 1
+                # Check for intensifiers before the word
+                if i > 0 and words[i-1] in self.intensifiers:
+                    negative_score += 0.5
+        
+        # Calculate compound score
+        if total_words == 0:
+            compound = 0
+        else:
+            # Normalize scores and create compound
+            pos_norm = positive_score / total_words
+            neg_norm = negative_score / total_words
+            compound = pos_norm - neg_norm
+        
+        return {
+            'neg': min(negative_score / max(total_words, 1), 1.0),
+            'neu': max(1 - (positive_score + negative_score) / max(total_words, 1), 0),
+            'pos': min(positive_score / max(total_words, 1), 1.0),
+            'compound': compound
+        }
+
 
-def predict_sentiment(text):
+# JSON file with the analyzer to run, lexicon overrides, overlays and canary texts:
+#   {"analyzer": "auto" | "vader" | "fallback",
+#    "lexicon": {"word": valence, "multi word phrase": valence, ...},
+#    "overlays": {"horror": {"gory": -1.5, ...}, "imdb": "imdb.tsv"},
+#    "tenants": {"<X-API-Key>": "horror"},
+#    "canaries": [{"text": "...", "sentiment": "positive"}, ...]}
+# An overlay is inline or a file next to this one (JSON, or VADER's tab-separated
+# lexicon format); requests pick one with "overlay" in the body, else their API
+# key's tenant overlay applies.
+# Reloaded without a restart when it changes (polled every ANALYZER_WATCH_SECONDS)
+# or on POST /admin/analyzer/reload
+ANALYZER_CONFIG_PATH = os.getenv("ANALYZER_CONFIG_PATH")
+ANALYZER_WATCH_SECONDS = float(os.getenv("ANALYZER_WATCH_SECONDS", "5"))
+ANALYZER_KINDS = ("auto", "vader", "fallback")
+SENTIMENTS = ("positive", "negative", "neutral")
+# "fast" trades VADER's rules for lexicon sums with simple negation (see FastAnalyzer)
+SCORING_MODES = ("full", "fast")
+
+# Every analyzer must score these as labelled before it is swapped in
+CANARIES = [
+    ("This movie was absolutely fantastic, great acting and storyline.", "positive"),
+    ("Terrible pacing and a boring, predictable plot.", "negative"),
+    ("The film runs two hours and was released in March.", "neutral"),
+]
+
+
+class CanaryFailed(Exception):
+    """A newly built analyzer scored canary texts differently from their labels"""
+
+    def __init__(self, failures):
+        super().__init__(f"{len(failures)} canary text(s) scored differently from their label")
+        self.failures = failures
+
+
+class UnknownOverlay(Exception):
+    """A request or tenant asked for a lexicon overlay the config does not define"""
+
+
+def analyzer_version(analyzer):
+    """Name plus a digest of the words and weights the analyzer scores with
+
+    Stored with every review, so rows scored by a different analyzer or
+    lexicon can be found and rescored.
     """
-    Analyze sentiment using VADER or fallback method
-    Returns sentiment and confidence score
+    if isinstance(analyzer, SimpleSentimentAnalyzer):
+        name = "simple"
+        content = [sorted(analyzer.positive_words), sorted(analyzer.negative_words), sorted(analyzer.intensifiers)]
+    else:
+        name = "vader"
+        content = sorted(analyzer.lexicon.items())
+    return f"{name}-{hashlib.sha256(repr(content).encode('utf-8')).hexdigest()[:12]}"
+
+
+# Joins the words of a multi-word entry into one token. Not ASCII punctuation,
+# which VADER strips from the whole of any token with punctuation at its edge
+# ("plot_hole." would no longer match "plot_hole"), and not whitespace
+PHRASE_JOINER = "\u2060"
+
+
+def phrase_key(entry):
+    """Lexicon key a (possibly multi-word) entry is stored under"""
+    return PHRASE_JOINER.join(entry.lower().split())
+
+
+def join_phrase(match):
+    return PHRASE_JOINER.join(match.group(0).split())
+
+
+def is_word_char(char):
+    return char.isalnum() or char == "_"
+
+
+class PhraseJoiner:
+    """Rewrites every multi-word lexicon entry in a text into its joined token
+
+    Matches are searched in the lowercased text with a plain alternation,
+    which the regex engine scans about three times faster than one with
+    word-boundary lookarounds or IGNORECASE; the rare candidate is then
+    checked for word boundaries by hand.
     """
-    scores = sia.polarity_scores(text)
-    
-    # Determine sentiment based on compound score
-    compound = scores['compound']
-    
+
+    def __init__(self, phrases):
+        # Longest first, so "not a plot hole" wins over "plot hole"
+        patterns = sorted((r"\s+".join(map(re.escape, phrase.lower().split())) for phrase in phrases),
+                          key=len, reverse=True)
+        self.pattern = re.compile("|".join(patterns))
+        self.exact = re.compile(r"(?<!\w)(?:" + "|".join(patterns) + r")(?!\w)", re.IGNORECASE)
+
+    def __call__(self, text):
+        lowered = text.lower()
+        if len(lowered) != len(text):
+            # Lowercasing moved offsets (a few non-ASCII letters do), so match the original
+            return self.exact.sub(join_phrase, text)
+        pieces, last = [], 0
+        for match in self.pattern.finditer(lowered):
+            start, end = match.span()
+            if (start and is_word_char(lowered[start - 1])) or (end < len(lowered) and is_word_char(lowered[end])):
+                continue
+            pieces.append(text[last:start])
+            pieces.append(PHRASE_JOINER.join(text[start:end].split()))
+            last = end
+        if not pieces:
+            return text
+        pieces.append(text[last:])
+        return "".join(pieces)
+
+
+def compile_phrases(phrases):
+    """PhraseJoiner for the multi-word entries, or None without any"""
+    return PhraseJoiner(phrases) if phrases else None
+
+
+def label(compound):
+    """(sentiment, confidence) for a compound score"""
     if compound >= 0.05:
         sentiment = "positive"
         confidence = min(compound, 1.0)
@@ -112,5 +208,352 @@ def predict_sentiment(text):
     else:
         sentiment = "neutral"
         confidence = 1 - abs(compound)
-    
-    return sentiment, round(confidence, 4)
\ No newline at end of file
+
+    return sentiment, round(confidence, 4)
+
+
+# Edge punctuation VADER strips from words; apostrophes stay for "isn't" and friends,
+# underscores as VADER keeps them in words without edge punctuation
+WORD_SEPARATORS = str.maketrans({char: " " for char in string.punctuation if char not in "'_"})
+# VADER's scale for a word negated within the three before it, and its compound normalization
+NEGATION_SCALAR = -0.74
+NORMALIZE_ALPHA = 15
+
+
+class FastAnalyzer:
+    """Approximate scorer for bulk analytics: a lexicon sum with simple negation
+
+    Uses the same lexicon, overlay and phrases as its full analyzer but none of
+    VADER's other rules (boosters, ALL-CAPS, "but", punctuation emphasis,
+    idioms), so a text is a split or two and some dict lookups. Results are stored
+    under the full version plus ":fast", which the rescorer later replaces
+    with a full score. benchmarks/bench_fast.py reports how often the labels
+    agree with the full analyzer and how much faster it is.
+    """
+
+    def __init__(self, analyzer):
+        self.kind = analyzer.kind
+        self.name = analyzer.name
+        self.phrases = analyzer.phrases
+        self.version = f"{analyzer.version}:fast"
+        lexicon = analyzer.sia.lexicon
+        # Entries the word split would break up (emoticons) are matched as whole tokens
+        self.emoticons = {entry: valence for entry, valence in lexicon.items()
+                          if entry.translate(WORD_SEPARATORS).split() != [entry]}
+        self.words = {entry: valence for entry, valence in lexicon.items() if entry not in self.emoticons}
+        self.negations = frozenset(VaderConstants.NEGATE)
+
+    def score(self, text):
+        """(sentiment, confidence) for one text"""
+        if self.phrases is not None:
+            text = self.phrases(text)
+        lowered = text.lower()
+        words = lowered.translate(WORD_SEPARATORS).split()
+        valences = list(map(self.words.get, words))
+        if self.negations.isdisjoint(words):
+            total = sum(filter(None, valences))
+        else:
+            total = 0.0
+            for i in itertools.compress(range(len(valences)), valences):
+                valence = valences[i]
+                if not self.negations.isdisjoint(words[max(i - 3, 0):i]):
+                    valence *= NEGATION_SCALAR
+                total += valence
+        if self.emoticons:
+            tokens = lowered.split()
+            total += sum(map(self.emoticons.__getitem__, filter(self.emoticons.__contains__, tokens)))
+        return label(round(total / math.sqrt(total * total + NORMALIZE_ALPHA), 4))
+
+    def score_many(self, texts):
+        """score for each text"""
+        return list(map(self.score, texts))
+
+
+class Analyzer:
+    """A built analyzer and the version its results are stored under
+
+    Never changed once built: a reload builds a new one and swaps it in, so a
+    request holding the old one finishes with it. The base analyzer carries
+    one prebuilt analyzer per lexicon overlay, so choosing an overlay is a
+    dict lookup and scoring with it costs the same as without.
+    """
+
+    def __init__(self, kind, sia, phrases=None, version=None, name=None, overlays=None, tenants=None,
+                 sources=()):
+        self.kind = kind
+        self.sia = sia
+        self.phrases = phrases
+        self.version = version or analyzer_version(sia)
+        self.name = name
+        self.overlays = overlays or {}
+        self.tenants = tenants or {}
+        self.sources = sources
+        # The fallback scorer already is a word-list sum, so it serves both modes
+        self.fast = self if isinstance(sia, SimpleSentimentAnalyzer) else FastAnalyzer(self)
+
+    def score(self, text):
+        """(sentiment, confidence) for one text"""
+        if self.phrases is not None:
+            text = self.phrases(text)
+        return label(self.sia.polarity_scores(text)['compound'])
+
+    def score_many(self, texts):
+        """score for each text"""
+        if self.phrases is not None:
+            texts = list(map(self.phrases, texts))
+        return [label(self.sia.polarity_scores(text)['compound']) for text in texts]
+
+    def select(self, overlay=None, api_key=None, mode="full"):
+        """The analyzer for a request's overlay, else its tenant's, else this one
+
+        mode="fast" gives that analyzer's FastAnalyzer instead.
+        """
+        name = overlay or self.tenants.get(api_key)
+        analyzer = self
+        if name:
+            try:
+                analyzer = self.overlays[name]
+            except KeyError:
+                raise UnknownOverlay(name) from None
+        return analyzer.fast if mode == "fast" else analyzer
+
+    def versions(self):
+        """Every version this analyzer and its overlays store rows under"""
+        return [self.version] + [overlay.version for overlay in self.overlays.values()]
+
+    def for_version(self, version):
+        """The current analyzer for rows stored under version: same overlay, else the base
+
+        Always a full one, so rows stored by a fast scorer are rescored in full.
+        """
+        if version and "+" in version:
+            name = version.split("+", 1)[1].rsplit("-", 1)[0]
+            return self.overlays.get(name, self)
+        return self
+
+    @property
+    def generation(self):
+        """Changes whenever the base lexicon or any overlay does"""
+        if not self.overlays:
+            return self.version
+        digest = hashlib.sha256(" ".join(sorted(self.versions())).encode("utf-8")).hexdigest()[:8]
+        return f"{self.version}+{digest}"
+
+
+def read_lexicon_file(path):
+    """{entry: valence} from a JSON object, or VADER's tab-separated format (entry, mean, ...)"""
+    with open(path, encoding="utf-8") as f:
+        if path.endswith(".json"):
+            return json.load(f)
+        lexicon = {}
+        for line in f:
+            if line.strip() and not line.startswith("#"):
+                entry, valence = line.rstrip("\n").split("\t")[:2]
+                lexicon[entry.strip()] = float(valence)
+        return lexicon
+
+
+def check_lexicon(lexicon, what):
+    if not isinstance(lexicon, dict) or not all(
+            isinstance(k, str) and k.strip() and isinstance(v, (int, float)) for k, v in lexicon.items()):
+        raise ValueError(f"{what} must map words or phrases to numeric valences")
+    return lexicon
+
+
+def read_config(path):
+    """Settings from the analyzer config file, {} without one
+
+    Overlays given as file names are read here, relative to the config file.
+    """
+    if not path:
+        return {}
+    with open(path, encoding="utf-8") as f:
+        config = json.load(f)
+    if not isinstance(config, dict):
+        raise ValueError(f"{path} must hold a JSON object")
+    kind = config.get("analyzer", "auto")
+    if kind not in ANALYZER_KINDS:
+        raise ValueError(f"analyzer must be one of {', '.join(ANALYZER_KINDS)}")
+    check_lexicon(config.get("lexicon", {}), "lexicon")
+    canaries = config.get("canaries", [])
+    if not isinstance(canaries, list) or not all(
+            isinstance(c, dict) and isinstance(c.get("text"), str) and c.get("sentiment") in SENTIMENTS
+            for c in canaries):
+        raise ValueError("canaries must be a list of {\"text\", \"sentiment\"} objects")
+
+    overlays, sources = {}, [path]
+    for name, overlay in config.get("overlays", {}).items():
+        if "+" in name or "-" in name:
+            raise ValueError(f"overlay name {name!r} cannot contain '+' or '-'")
+        if isinstance(overlay, str):
+            overlay_path = os.path.join(os.path.dirname(os.path.abspath(path)), overlay)
+            sources.append(overlay_path)
+            overlay = read_lexicon_file(overlay_path)
+        overlays[name] = check_lexicon(overlay, f"overlay {name!r}")
+    tenants = config.get("tenants", {})
+    if not isinstance(tenants, dict) or not all(name in overlays for name in tenants.values()):
+        raise ValueError("tenants must map API keys to overlay names")
+    return {**config, "overlays": overlays, "tenants": tenants, "sources": tuple(sources)}
+
+
+def build_sia(kind, lexicon):
+    """("vader" or "fallback", polarity scorer) with lexicon overrides applied
+
+    Multi-word entries are stored under their words joined with PHRASE_JOINER,
+    which Analyzer.score rewrites them to before scoring.
+    """
+    lexicon = {phrase_key(entry): float(valence) for entry, valence in lexicon.items()}
+    if kind != "fallback":
+        try:
+            # Try to use VADER sentiment analyzer
+            nltk.data.find('sentiment/vader_lexicon')
+            from nltk.sentiment import SentimentIntensityAnalyzer
+            sia = SentimentIntensityAnalyzer()
+            sia.lexicon.update(lexicon)
+            return "vader", sia
+        except LookupError:
+            if kind == "vader":
+                raise
+    # Fallback to simple rule-based analyzer; overrides only decide which list a word is in
+    sia = SimpleSentimentAnalyzer()
+    for word, valence in lexicon.items():
+        sia.positive_words.discard(word)
+        sia.negative_words.discard(word)
+        if valence > 0:
+            sia.positive_words.add(word)
+        elif valence < 0:
+            sia.negative_words.add(word)
+    return "fallback", sia
+
+
+def compile_analyzer(kind, lexicon, name=None, base_version=None, overlay=None):
+    """Analyzer for the base lexicon merged with lexicon overrides, phrases included
+
+    Overlay analyzers are versioned as base version + name + a digest of the overlay.
+    """
+    kind, sia = build_sia(kind, lexicon)
+    phrases = compile_phrases([entry for entry in lexicon if len(entry.split()) > 1])
+    version = None
+    if name is not None:
+        digest = hashlib.sha256(repr(sorted(overlay.items())).encode("utf-8")).hexdigest()[:8]
+        version = f"{base_version}+{name}-{digest}"
+    return Analyzer(kind, sia, phrases, version=version, name=name)
+
+
+def build(config_path=ANALYZER_CONFIG_PATH):
+    """Build an analyzer and its overlays from the config file and check them against the canaries"""
+    config = read_config(config_path)
+    kind = config.get("analyzer", "auto")
+    lexicon = config.get("lexicon", {})
+    base = compile_analyzer(kind, lexicon)
+    overlays = {name: compile_analyzer(base.kind, {**lexicon, **overlay}, name, base.version, overlay)
+                for name, overlay in config.get("overlays", {}).items()}
+    analyzer = Analyzer(base.kind, base.sia, base.phrases, overlays=overlays, tenants=config.get("tenants"),
+                        sources=config.get("sources", ()))
+
+    canaries = CANARIES + [(c["text"], c["sentiment"]) for c in config.get("canaries", [])]
+    failures = []
+    for candidate in [analyzer, *overlays.values()]:
+        for text, expected in canaries:
+            sentiment, confidence = candidate.score(text)
+            if sentiment != expected:
+                failures.append({"overlay": candidate.name, "text": text, "expected": expected,
+                                 "sentiment": sentiment, "confidence_score": confidence})
+    if failures:
+        raise CanaryFailed(failures)
+    return analyzer
+
+
+def config_signature(paths):
+    """What a change of the config file or its overlay files is detected by"""
+    signature = []
+    for path in paths:
+        try:
+            stat = os.stat(path)
+            signature.append((path, stat.st_mtime_ns, stat.st_size))
+        except (OSError, TypeError):
+            signature.append((path, None))
+    return tuple(signature)
+
+
+try:
+    _active = build()
+except Exception as e:
+    log.error("analyzer_config_invalid", path=ANALYZER_CONFIG_PATH, error=str(e))
+    _active = build(None)
+# Files the watcher stats, and what they looked like when last (re)built
+_watched = _active.sources or (ANALYZER_CONFIG_PATH,)
+_source = config_signature(_watched)
+_reload_lock = threading.Lock()
+_watcher = None
+if _active.kind == "vader":
+    log.info("analyzer_selected", analyzer="vader", version=_active.version)
+else:
+    log.warning("analyzer_selected", analyzer="fallback", version=_active.version,
+                reason="vader_lexicon not found")
+
+
+def active():
+    """The analyzer new requests score with"""
+    return _active
+
+
+def reload(config_path=ANALYZER_CONFIG_PATH):
+    """Build and validate an analyzer from the config file, then swap it in
+
+    Returns (previous, new). Scoring never waits: the new analyzer is built on
+    the calling thread and published with one assignment. A build error or a
+    failed canary is raised and the current analyzer stays active.
+    """
+    global _active, _source, _watched
+    with _reload_lock:
+        started = time.perf_counter()
+        try:
+            analyzer = build(config_path)
+        except Exception as e:
+            # Not retried by the watcher until the file changes again
+            _watched = (config_path,) + tuple(path for path in _watched if path != config_path)
+            _source = config_signature(_watched)
+            log.error("analyzer_reload_failed", error=str(e), version=_active.version)
+            raise
+        _watched = analyzer.sources or (config_path,)
+        previous, _active, _source = _active, analyzer, config_signature(_watched)
+    log.info("analyzer_reloaded", analyzer=analyzer.kind, version=analyzer.version,
+             overlays=sorted(analyzer.overlays), previous_version=previous.version, build_ms=round((time.perf_counter() - started) * 1000, 1))
+    return previous, analyzer
+
+
+def refresh(config_path=ANALYZER_CONFIG_PATH):
+    """Reload if the config or an overlay file changed since the active analyzer was built
+
+    A stat() per file otherwise, so worker processes call it before every chunk.
+    """
+    if config_path and config_signature(_watched) != _source:
+        try:
+            reload(config_path)
+        except Exception:
+            pass
+
+
+def watch(interval=ANALYZER_WATCH_SECONDS):
+    """Poll the config file on a daemon thread and reload when it changes"""
+    global _watcher
+    if not ANALYZER_CONFIG_PATH or interval <= 0 or _watcher is not None:
+        return
+
+    def run():
+        while True:
+            time.sleep(interval)
+            refresh()
+
+    _watcher = threading.Thread(target=run, name="analyzer-watch", daemon=True)
+    _watcher.start()
+
+
+def predict_sentiment(text, analyzer=None):
+    """
+    Analyze sentiment using VADER or fallback method
+    Returns sentiment and confidence score; analyzer pins the one a request
+    started with, the active one otherwise
+    """
+    return (analyzer or _active).score(text)
@@ -0,0 +1,89 @@
+"""On-demand sampling profiler for a running worker
+
+GET /admin/profile samples the stack of every thread in the worker through
+sys._current_frames at a fixed interval for a few seconds. It returns the
+samples as collapsed stacks (one "root;...;leaf count" line per distinct
+stack), which flamegraph.pl, speedscope and similar tools read directly.
+
+Nothing is installed between runs: no thread, signal handler or trace hook
+exists until a profile is requested, and the sampling loop runs on the
+requesting thread. Only one profile runs at a time, and a new one can start
+at most once per PROFILER_MIN_INTERVAL_SECONDS.
+"""
+import os
+import sys
+import threading
+import time
+from collections import Counter
+
+PROFILER_MAX_SECONDS = float(os.getenv("PROFILER_MAX_SECONDS", "30"))
+PROFILER_MIN_INTERVAL_SECONDS = float(os.getenv("PROFILER_MIN_INTERVAL_SECONDS", "60"))
+PROFILER_DEFAULT_INTERVAL_MS = float(os.getenv("PROFILER_DEFAULT_INTERVAL_MS", "10"))
+
+
+class ProfilerBusy(Exception):
+    """Raised when a profile is running or one ran too recently"""
+
+    def __init__(self, retry_after):
+        super().__init__(f"profiler is busy, retry in {retry_after:.0f}s")
+        self.retry_after = retry_after
+
+
+def frame_label(code):
+    # Function plus where it is defined, so every sample of one function merges
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+def collapse(frame, thread_name):
+    stack = []
+    while frame is not None:
+        stack.append(frame_label(frame.f_code))
+        frame = frame.f_back
+    stack.append(thread_name)
+    return ";".join(reversed(stack))
+
+
+def sample(seconds, interval):
+    """Sample every other thread's stack; returns a Counter of collapsed stacks"""
+    me = threading.get_ident()
+    stacks = Counter()
+    deadline = time.monotonic() + seconds
+    next_sample = time.monotonic()
+    while next_sample < deadline:
+        names = {thread.ident: thread.name for thread in threading.enumerate()}
+        for ident, frame in sys._current_frames().items():
+            if ident != me:
+                stacks[collapse(frame, names.get(ident, f"thread-{ident}"))] += 1
+        next_sample += interval
+        time.sleep(max(0.0, next_sample - time.monotonic()))
+    return stacks
+
+
+def render(stacks):
+    return "".join(f"{stack} {count}\n" for stack, count in stacks.most_common())
+
+
+class Profiler:
+    """Runs at most one sampling profile at a time, with a cooldown between runs"""
+
+    def __init__(self, min_interval=PROFILER_MIN_INTERVAL_SECONDS, max_seconds=PROFILER_MAX_SECONDS):
+        self.min_interval = min_interval
+        self.max_seconds = max_seconds
+        self.last_started = None
+        self._lock = threading.Lock()
+
+    def run(self, seconds, interval_ms=PROFILER_DEFAULT_INTERVAL_MS):
+        """Profile this process for seconds; returns (collapsed stacks text, sample count)"""
+        seconds = min(max(seconds, 0.1), self.max_seconds)
+        interval = max(interval_ms, 1.0) / 1000
+        if not self._lock.acquire(blocking=False):
+            raise ProfilerBusy(seconds)
+        try:
+            now = time.monotonic()
+            if self.last_started is not None and now - self.last_started < self.min_interval:
+                raise ProfilerBusy(self.min_interval - (now - self.last_started))
+            self.last_started = now
+            stacks = sample(seconds, interval)
+        finally:
+            self._lock.release()
+        return render(stacks), sum(stacks.values())
@@ -0,0 +1,290 @@
+"""Background rescoring of reviews stored by another analyzer version
+
+Every review records the analyzer_version that scored it (model.py's
+analyzer name plus a digest of its lexicon). The rescorer walks reviews in id
+order in batches of RESCORE_BATCH_SIZE, rescores those whose version differs
+from the running analyzer, updates them and moves the rollup counts of any row
+whose sentiment changed, one transaction per batch. The highest id handled is
+checkpointed per analyzer generation, so a restarted rescorer carries on
+where it stopped and a finished pass only looks at newer rows. After an
+analyzer reload the next batch targets the new versions and starts again from
+id 0. Rows scored with a lexicon overlay are rescored with that overlay's
+current analyzer, or the base one if the overlay was removed.
+
+Foreground traffic comes first: after each batch the rescorer sleeps long
+enough to keep its share of wall time under RESCORE_MAX_DUTY, and on
+PostgreSQL it backs off for RESCORE_BACKOFF_SECONDS while more than
+RESCORE_MAX_ACTIVE_QUERIES other queries are running.
+
+Run it as its own process, like the job worker:
+
+    python rescore.py run [--once]
+    python rescore.py status
+
+or inside a single-process API with RESCORE_BACKGROUND=1; progress is served
+at GET /stats/rescore.
+"""
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+
+import model
+import rollup
+import structured_log
+from db_utils import sql
+
+RESCORE_BATCH_SIZE = int(os.getenv("RESCORE_BATCH_SIZE", "500"))
+RESCORE_MAX_DUTY = float(os.getenv("RESCORE_MAX_DUTY", "0.2"))
+RESCORE_MAX_ACTIVE_QUERIES = int(os.getenv("RESCORE_MAX_ACTIVE_QUERIES", "8"))
+RESCORE_BACKOFF_SECONDS = float(os.getenv("RESCORE_BACKOFF_SECONDS", "5"))
+RESCORE_IDLE_SECONDS = float(os.getenv("RESCORE_IDLE_SECONDS", "300"))
+RESCORE_BACKGROUND = os.getenv("RESCORE_BACKGROUND", "0") == "1"
+
+log = structured_log.get_logger("rescore")
+
+
+def create_table(cur, db_type):
+    """Add reviews.analyzer_version to older databases and create the checkpoint table"""
+    if db_type == "sqlite":
+        cur.execute("PRAGMA table_info(reviews);")
+        if "analyzer_version" not in [row[1] for row in cur.fetchall()]:
+            cur.execute("ALTER TABLE reviews ADD COLUMN analyzer_version TEXT;")
+    else:
+        cur.execute("ALTER TABLE reviews ADD COLUMN IF NOT EXISTS analyzer_version TEXT;")
+
+    big_int = "INTEGER" if db_type == "sqlite" else "BIGINT"
+    cur.execute(f"""
+        CREATE TABLE IF NOT EXISTS rescore_checkpoints (
+            version TEXT PRIMARY KEY,
+            last_id {big_int} NOT NULL DEFAULT 0,
+            rows_rescored {big_int} NOT NULL DEFAULT 0,
+            rows_changed {big_int} NOT NULL DEFAULT 0,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        );
+    """)
+
+
+def get_checkpoint(cur, db_type, version):
+    cur.execute(sql("SELECT last_id FROM rescore_checkpoints WHERE version = ?;", db_type), (version,))
+    row = cur.fetchone()
+    return row[0] if row else 0
+
+
+def save_checkpoint(cur, db_type, version, last_id, rescored, changed):
+    greatest = "MAX" if db_type == "sqlite" else "GREATEST"
+    cur.execute(sql(f"""
+        INSERT INTO rescore_checkpoints (version, last_id, rows_rescored, rows_changed, updated_at)
+        VALUES (?, ?, ?, ?, CURRENT_TIMESTAMP)
+        ON CONFLICT (version) DO UPDATE SET
+            last_id = {greatest}(rescore_checkpoints.last_id, excluded.last_id),
+            rows_rescored = rescore_checkpoints.rows_rescored + excluded.rows_rescored,
+            rows_changed = rescore_checkpoints.rows_changed + excluded.rows_changed,
+            updated_at = excluded.updated_at;
+    """, db_type), (version, last_id, rescored, changed))
+
+
+def version_counts(cur):
+    """Reviews per analyzer_version; None counts rows stored before versions were recorded"""
+    cur.execute("SELECT analyzer_version, COUNT(*) FROM reviews GROUP BY analyzer_version;")
+    return {version: count for version, count in cur.fetchall()}
+
+
+class Rescorer:
+    """Rescores outdated reviews in keyset-ordered, throttled batches"""
+
+    def __init__(self, connect, db_type, analyzer=None, batch_size=RESCORE_BATCH_SIZE,
+                 max_duty=RESCORE_MAX_DUTY, max_active=RESCORE_MAX_ACTIVE_QUERIES):
+        self.connect = connect
+        self.db_type = db_type
+        # Follows the active analyzer across reloads unless one is given
+        self.analyzer = analyzer
+        self.batch_size = batch_size
+        self.max_duty = max_duty
+        self.max_active = max_active
+        self.rows_rescored = 0
+        self.rows_changed = 0
+        self.batches = 0
+        self.busy_seconds = 0.0
+        self.throttled_seconds = 0.0
+        self.backoffs = 0
+        self.last_id = None
+        self.pass_complete = False
+        self.started = None
+        self._stop = threading.Event()
+        self._thread = None
+
+    @property
+    def version(self):
+        """The analyzer generation rows are rescored to"""
+        return (self.analyzer or model.active()).generation
+
+    def run_batch(self, conn):
+        """Rescore the next batch after the checkpoint; returns how many rows it covered"""
+        analyzer = self.analyzer or model.active()
+        generation = analyzer.generation
+        current = analyzer.versions()
+        placeholders = ", ".join("?" * len(current))
+        cur = conn.cursor()
+        last_id = get_checkpoint(cur, self.db_type, generation)
+        if self.db_type == "sqlite":
+            # Hold the write lock from read to update so no row changes underneath the rollup
+            cur.execute("BEGIN IMMEDIATE;")
+            lock = ""
+        else:
+            # A second rescorer skips the rows this one is working on
+            lock = " FOR UPDATE SKIP LOCKED"
+        cur.execute(sql(f"""
+            SELECT id, text, sentiment, confidence_score, created_at, analyzer_version
+            FROM reviews
+            WHERE id > ? AND (analyzer_version IS NULL OR analyzer_version NOT IN ({placeholders}))
+            ORDER BY id
+            LIMIT ?{lock};
+        """, self.db_type), (last_id, *current, self.batch_size))
+        rows = cur.fetchall()
+        if not rows:
+            conn.rollback()
+            cur.close()
+            return 0
+
+        updates, removed, added = [], [], []
+        for review_id, text, sentiment, confidence, created_at, version in rows:
+            target = analyzer.for_version(version)
+            new_sentiment, new_confidence = target.score(text)
+            updates.append((new_sentiment, new_confidence, target.version, review_id, created_at))
+            if (new_sentiment, new_confidence) != (sentiment, confidence):
+                removed.append((created_at, sentiment, confidence))
+                added.append((created_at, new_sentiment, new_confidence))
+        cur.executemany(sql("""
+            UPDATE reviews SET sentiment = ?, confidence_score = ?, analyzer_version = ?
+            WHERE id = ? AND created_at = ?;
+        """, self.db_type), updates)
+        rollup.apply(cur, self.db_type, added)
+        rollup.apply(cur, self.db_type, removed, sign=-1)
+        self.last_id = rows[-1][0]
+        save_checkpoint(cur, self.db_type, generation, self.last_id, len(rows), len(added))
+        conn.commit()
+        cur.close()
+        self.rows_rescored += len(rows)
+        self.rows_changed += len(added)
+        self.batches += 1
+        return len(rows)
+
+    def throttle(self, conn, busy):
+        """Sleep so rescoring stays under max_duty of wall time, longer while the database is busy"""
+        pause = busy * (1 / self.max_duty - 1) if self.max_duty < 1 else 0.0
+        if self.db_type != "sqlite" and self.max_active:
+            cur = conn.cursor()
+            cur.execute("SELECT COUNT(*) FROM pg_stat_activity WHERE state = 'active' AND pid <> pg_backend_pid();")
+            active = cur.fetchone()[0]
+            conn.rollback()
+            cur.close()
+            if active > self.max_active:
+                pause = max(pause, RESCORE_BACKOFF_SECONDS)
+                self.backoffs += 1
+        self.throttled_seconds += pause
+        self._stop.wait(pause)
+
+    def run_pass(self):
+        """Rescore until no outdated row is left above the checkpoint or stop() is called"""
+        conn = self.connect()
+        if conn is None:
+            return False
+        self.started = self.started or time.monotonic()
+        self.pass_complete = False
+        try:
+            while not self._stop.is_set():
+                begin = time.monotonic()
+                if not self.run_batch(conn):
+                    self.pass_complete = True
+                    return True
+                busy = time.monotonic() - begin
+                self.busy_seconds += busy
+                self.throttle(conn, busy)
+            return False
+        finally:
+            conn.close()
+
+    def run_forever(self, idle=RESCORE_IDLE_SECONDS):
+        log.info("rescore_started", version=self.version)
+        while not self._stop.is_set():
+            try:
+                complete = self.run_pass()
+                if complete:
+                    log.info("rescore_pass_complete", version=self.version, rows_rescored=self.rows_rescored,
+                             rows_changed=self.rows_changed)
+            except Exception as e:
+                log.error("rescore_error", error=str(e))
+            self._stop.wait(idle)
+
+    def start(self):
+        """Rescore on a daemon thread until stop()"""
+        if self._thread is None:
+            self._thread = threading.Thread(target=self.run_forever, name="rescore", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def stats(self):
+        elapsed = time.monotonic() - self.started if self.started else 0
+        return {
+            "version": self.version,
+            "running": self._thread is not None and self._thread.is_alive(),
+            "last_id": self.last_id,
+            "pass_complete": self.pass_complete,
+            "rows_rescored": self.rows_rescored,
+            "rows_changed": self.rows_changed,
+            "batches": self.batches,
+            "rows_per_sec": round(self.rows_rescored / elapsed, 1) if elapsed else None,
+            "busy_seconds": round(self.busy_seconds, 3),
+            "throttled_seconds": round(self.throttled_seconds, 3),
+            "backoffs": self.backoffs,
+        }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Rescore reviews stored by an older analyzer version")
+    sub = parser.add_subparsers(dest="command", required=True)
+    run = sub.add_parser("run", help="rescore outdated reviews until interrupted")
+    run.add_argument("--once", action="store_true", help="stop after one pass")
+    run.add_argument("--batch-size", type=int, default=RESCORE_BATCH_SIZE)
+    run.add_argument("--max-duty", type=float, default=RESCORE_MAX_DUTY)
+    sub.add_parser("status", help="print reviews per analyzer version and the checkpoint")
+    args = parser.parse_args(argv)
+
+    from app import DB_TYPE, get_db_connection
+
+    if args.command == "status":
+        conn = get_db_connection()
+        if conn is None:
+            return 1
+        cur = conn.cursor()
+        counts = version_counts(cur)
+        analyzer = model.active()
+        result = {
+            "version": analyzer.version,
+            "by_version": [{"analyzer_version": v, "count": count} for v, count in counts.items()],
+            "outdated": sum(count for v, count in counts.items() if v not in analyzer.versions()),
+            "checkpoint": get_checkpoint(cur, DB_TYPE, analyzer.generation),
+        }
+        conn.close()
+        print(json.dumps(result))
+        return 0
+
+    rescorer = Rescorer(get_db_connection, DB_TYPE, batch_size=args.batch_size, max_duty=args.max_duty)
+    try:
+        if args.once:
+            rescorer.run_pass()
+        else:
+            rescorer.run_forever()
+    except KeyboardInterrupt:
+        rescorer.stop()
+    print(json.dumps(rescorer.stats()))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
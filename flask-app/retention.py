@@ -0,0 +1,170 @@
+"""Monthly partitioning and retention purge for the reviews table
+
+On PostgreSQL, setting REVIEWS_PARTITIONING=monthly makes init_db create reviews
+as a table partitioned by RANGE (created_at) with one partition per month.
+Retention then drops whole partitions instead of deleting rows. Rows that are
+not covered by a whole partition (SQLite, unpartitioned PostgreSQL, the default
+partition or a partial month) are deleted in id chunks with a commit and a
+short pause between chunks, so writers are never blocked for long. A SQLite
+database in WAL mode is also checkpointed between chunks.
+"""
+import os
+import time
+from datetime import datetime
+
+import rollup
+from db_utils import TIMESTAMP_FORMAT, sql, utc_now
+
+PARTITIONING = os.getenv("REVIEWS_PARTITIONING", "none").lower()
+PARTITION_MONTHS_AHEAD = int(os.getenv("REVIEWS_PARTITION_MONTHS_AHEAD", "3"))
+PURGE_BATCH_SIZE = int(os.getenv("REVIEWS_PURGE_BATCH_SIZE", "5000"))
+# Pause after each chunk, so waiting writers get the lock
+PURGE_PAUSE_SECONDS = 0.01
+PARTITION_PREFIX = "reviews_p"
+
+
+def partitioning_enabled(db_type):
+    return db_type != "sqlite" and PARTITIONING == "monthly"
+
+
+def create_partitioned_table(cur):
+    """Create reviews as a monthly range-partitioned table (PostgreSQL only)"""
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS reviews (
+            id SERIAL,
+            text TEXT NOT NULL,
+            sentiment TEXT NOT NULL,
+            confidence_score FLOAT,
+            created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+            analyzer_version TEXT,
+            PRIMARY KEY (id, created_at)
+        ) PARTITION BY RANGE (created_at);
+    """)
+    cur.execute("CREATE TABLE IF NOT EXISTS reviews_default PARTITION OF reviews DEFAULT;")
+
+
+def is_partitioned(cur):
+    cur.execute("SELECT relkind FROM pg_class WHERE relname = 'reviews' AND relkind IN ('r', 'p');")
+    row = cur.fetchone()
+    return row is not None and row[0] == 'p'
+
+
+def month_start(moment):
+    return datetime(moment.year, moment.month, 1)
+
+
+def add_months(moment, months):
+    index = moment.year * 12 + moment.month - 1 + months
+    return datetime(index // 12, index % 12 + 1, 1)
+
+
+def partition_name(start):
+    return f"{PARTITION_PREFIX}{start.strftime('%Y%m')}"
+
+
+def list_partitions(cur):
+    """Return (name, month_start) for every monthly partition, oldest first"""
+    cur.execute("""
+        SELECT child.relname
+        FROM pg_inherits
+        JOIN pg_class parent ON parent.oid = pg_inherits.inhparent
+        JOIN pg_class child ON child.oid = pg_inherits.inhrelid
+        WHERE parent.relname = 'reviews';
+    """)
+    partitions = []
+    for (name,) in cur.fetchall():
+        if name.startswith(PARTITION_PREFIX):
+            try:
+                partitions.append((name, datetime.strptime(name[len(PARTITION_PREFIX):], "%Y%m")))
+            except ValueError:
+                continue
+    return sorted(partitions, key=lambda item: item[1])
+
+
+def ensure_partitions(cur, months_ahead=PARTITION_MONTHS_AHEAD, start=None):
+    """Create monthly partitions from start (default: this month) to months_ahead"""
+    first = month_start(start or utc_now())
+    last = add_months(month_start(utc_now()), months_ahead)
+    created = []
+    existing = {name for name, _ in list_partitions(cur)}
+    current = first
+    while current <= last:
+        name = partition_name(current)
+        if name not in existing:
+            cur.execute(f"""
+                CREATE TABLE {name} PARTITION OF reviews
+                FOR VALUES FROM ('{current.strftime(TIMESTAMP_FORMAT)}')
+                TO ('{add_months(current, 1).strftime(TIMESTAMP_FORMAT)}');
+            """)
+            created.append(name)
+        current = add_months(current, 1)
+    return created
+
+
+def drop_partitions_before(cur, cutoff):
+    """Drop every monthly partition that ends on or before cutoff"""
+    dropped = []
+    for name, start in list_partitions(cur):
+        end = add_months(start, 1)
+        if end > cutoff:
+            break
+        # Whole hour/day buckets live inside one month, so the rollup rows go too
+        cur.execute(
+            "DELETE FROM sentiment_rollup WHERE bucket_start >= %s AND bucket_start < %s;",
+            (start.strftime(TIMESTAMP_FORMAT), end.strftime(TIMESTAMP_FORMAT))
+        )
+        cur.execute(f"ALTER TABLE reviews DETACH PARTITION {name};")
+        cur.execute(f"DROP TABLE {name};")
+        dropped.append(name)
+    return dropped
+
+
+def checkpoint(conn, db_type):
+    """Let other writers in between chunks and keep a SQLite WAL from growing"""
+    if db_type == "sqlite" and conn.execute("PRAGMA journal_mode;").fetchone()[0].lower() == "wal":
+        conn.execute("PRAGMA wal_checkpoint(PASSIVE);")
+    time.sleep(PURGE_PAUSE_SECONDS)
+
+
+def delete_in_batches(conn, db_type, cutoff, batch_size=PURGE_BATCH_SIZE):
+    """Delete reviews created before cutoff in id chunks, one transaction per chunk"""
+    deleted = 0
+    while True:
+        cur = conn.cursor()
+        cur.execute(sql("""
+            SELECT id, created_at, sentiment, confidence_score
+            FROM reviews
+            WHERE created_at < ?
+            ORDER BY id
+            LIMIT ?;
+        """, db_type), (cutoff.strftime(TIMESTAMP_FORMAT), batch_size))
+        rows = cur.fetchall()
+        if not rows:
+            cur.close()
+            break
+
+        placeholders = ", ".join("?" for _ in rows)
+        cur.execute(sql(f"DELETE FROM reviews WHERE id IN ({placeholders});", db_type), [row[0] for row in rows])
+        rollup.apply(cur, db_type, [tuple(row[1:]) for row in rows], sign=-1)
+        conn.commit()
+        cur.close()
+
+        deleted += len(rows)
+        checkpoint(conn, db_type)
+        if len(rows) < batch_size:
+            break
+    return deleted
+
+
+def purge_before(conn, db_type, cutoff, batch_size=PURGE_BATCH_SIZE):
+    """Remove every review created before cutoff, dropping whole partitions where possible"""
+    dropped = []
+    if db_type != "sqlite":
+        cur = conn.cursor()
+        if is_partitioned(cur):
+            dropped = drop_partitions_before(cur, cutoff)
+            conn.commit()
+        cur.close()
+
+    deleted = delete_in_batches(conn, db_type, cutoff, batch_size)
+    return {"dropped_partitions": dropped, "deleted_rows": deleted}
@@ -0,0 +1,130 @@
+"""Time-bucketed sentiment rollup kept in step with the reviews table
+
+Every insert into reviews adds to the matching hour and day buckets and every
+delete subtracts from them, inside the same transaction, so dashboards can read
+per-bucket counts without scanning reviews.
+"""
+from collections import defaultdict
+
+from db_utils import TIMESTAMP_FORMAT, sql, to_datetime
+
+GRANULARITIES = ("hour", "day")
+
+
+def create_table(cur, db_type):
+    """Create the rollup table and backfill it once from existing reviews"""
+    if db_type == "sqlite":
+        cur.execute("""
+            CREATE TABLE IF NOT EXISTS sentiment_rollup (
+                bucket_start TIMESTAMP NOT NULL,
+                granularity TEXT NOT NULL,
+                sentiment TEXT NOT NULL,
+                count INTEGER NOT NULL DEFAULT 0,
+                sum_confidence REAL NOT NULL DEFAULT 0,
+                PRIMARY KEY (granularity, bucket_start, sentiment)
+            );
+        """)
+    else:
+        cur.execute("""
+            CREATE TABLE IF NOT EXISTS sentiment_rollup (
+                bucket_start TIMESTAMP NOT NULL,
+                granularity TEXT NOT NULL,
+                sentiment TEXT NOT NULL,
+                count BIGINT NOT NULL DEFAULT 0,
+                sum_confidence DOUBLE PRECISION NOT NULL DEFAULT 0,
+                PRIMARY KEY (granularity, bucket_start, sentiment)
+            );
+        """)
+
+    cur.execute("SELECT 1 FROM sentiment_rollup LIMIT 1;")
+    if cur.fetchone() is None:
+        backfill(cur, db_type)
+
+
+def backfill(cur, db_type):
+    """Rebuild every bucket from reviews with one GROUP BY per granularity"""
+    cur.execute("DELETE FROM sentiment_rollup;")
+    for granularity in GRANULARITIES:
+        if db_type == "sqlite":
+            fmt = "%Y-%m-%d %H:00:00" if granularity == "hour" else "%Y-%m-%d 00:00:00"
+            bucket_expr = f"strftime('{fmt}', created_at)"
+        else:
+            bucket_expr = f"date_trunc('{granularity}', created_at)"
+        cur.execute(sql(f"""
+            INSERT INTO sentiment_rollup (bucket_start, granularity, sentiment, count, sum_confidence)
+            SELECT {bucket_expr}, ?, sentiment, COUNT(*), COALESCE(SUM(confidence_score), 0)
+            FROM reviews
+            WHERE created_at IS NOT NULL
+            GROUP BY {bucket_expr}, sentiment;
+        """, db_type), (granularity,))
+
+
+def bucket_start(created_at, granularity):
+    """Truncate a created_at value to the start of its bucket"""
+    moment = to_datetime(created_at)
+    if granularity == "hour":
+        return moment.replace(minute=0, second=0, microsecond=0)
+    return moment.replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+def apply(cur, db_type, rows, sign=1):
+    """Add (sign=1) or subtract (sign=-1) reviews from their buckets
+
+    rows is an iterable of (created_at, sentiment, confidence_score) tuples.
+    Rows are aggregated in Python first so a batch touches each bucket once.
+    """
+    deltas = defaultdict(lambda: [0, 0.0])
+    for created_at, sentiment, confidence in rows:
+        if created_at is None:
+            continue
+        for granularity in GRANULARITIES:
+            key = (bucket_start(created_at, granularity).strftime(TIMESTAMP_FORMAT), granularity, sentiment)
+            deltas[key][0] += sign
+            deltas[key][1] += sign * float(confidence or 0)
+
+    if not deltas:
+        return
+
+    cur.executemany(sql("""
+        INSERT INTO sentiment_rollup (bucket_start, granularity, sentiment, count, sum_confidence)
+        VALUES (?, ?, ?, ?, ?)
+        ON CONFLICT (granularity, bucket_start, sentiment) DO UPDATE SET
+            count = sentiment_rollup.count + excluded.count,
+            sum_confidence = sentiment_rollup.sum_confidence + excluded.sum_confidence;
+    """, db_type), [key + (count, total) for key, (count, total) in deltas.items()])
+
+    if sign < 0:
+        # Only the buckets this batch touched can have dropped to zero
+        cur.executemany(sql("""
+            DELETE FROM sentiment_rollup
+            WHERE bucket_start = ? AND granularity = ? AND sentiment = ? AND count <= 0;
+        """, db_type), list(deltas))
+
+
+def timeseries(cur, db_type, granularity, since, until=None):
+    """Read buckets in [since, until) from the rollup table only"""
+    query = """
+        SELECT bucket_start, sentiment, count, sum_confidence
+        FROM sentiment_rollup
+        WHERE granularity = ? AND bucket_start >= ?
+    """
+    params = [granularity, since.strftime(TIMESTAMP_FORMAT)]
+    if until is not None:
+        query += " AND bucket_start < ?"
+        params.append(until.strftime(TIMESTAMP_FORMAT))
+    query += " ORDER BY bucket_start;"
+    cur.execute(sql(query, db_type), params)
+
+    buckets = {}
+    for start, sentiment, count, sum_confidence in cur.fetchall():
+        key = to_datetime(start).strftime(TIMESTAMP_FORMAT)
+        bucket = buckets.setdefault(key, {
+            "bucket_start": key,
+            "total": 0,
+            "sentiment_distribution": {},
+            "avg_confidence": {},
+        })
+        bucket["total"] += count
+        bucket["sentiment_distribution"][sentiment] = count
+        bucket["avg_confidence"][sentiment] = round(float(sum_confidence) / count, 4) if count else None
+    return list(buckets.values())
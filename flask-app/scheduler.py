@@ -0,0 +1,138 @@
+"""Cost-based scheduling of scoring work onto separate lanes
+
+Work is classified by cost (total characters to score, i.e. text length times
+count). Cheap work goes to the interactive lane and expensive work to the bulk
+lane; each lane has its own bounded executor, concurrency limit and queue
+depth, so a large /batch-predict or one huge review can only ever occupy the
+bulk lane while /predict calls from the frontend keep flowing. When a lane's
+queue is full, submit raises LaneFull instead of queueing without bound, and
+work whose request deadline passed while it was queued is shed with
+DeadlineExceeded instead of being run for a client that has given up.
+"""
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+import metrics
+from admission import DeadlineExceeded
+
+LANE_BULK_COST = int(os.getenv("LANE_BULK_COST", "20000"))
+LANE_INTERACTIVE_WORKERS = int(os.getenv("LANE_INTERACTIVE_WORKERS", "4"))
+LANE_INTERACTIVE_QUEUE = int(os.getenv("LANE_INTERACTIVE_QUEUE", "256"))
+LANE_BULK_WORKERS = int(os.getenv("LANE_BULK_WORKERS", "2"))
+LANE_BULK_QUEUE = int(os.getenv("LANE_BULK_QUEUE", "16"))
+
+
+class LaneFull(Exception):
+    """Raised when a lane already holds as much work as its queue allows"""
+
+    def __init__(self, lane):
+        super().__init__(f"{lane} lane is full")
+        self.lane = lane
+
+
+class Lane:
+    """A bounded executor that tracks how long work waits before it starts"""
+
+    def __init__(self, name, workers, max_queue, samples=1024):
+        self.name = name
+        self.workers = workers
+        self.max_queue = max_queue
+        self._executor = ThreadPoolExecutor(workers, thread_name_prefix=f"lane-{name}")
+        self._slots = threading.BoundedSemaphore(workers + max_queue)
+        self._lock = threading.Lock()
+        self._waits = deque(maxlen=samples)
+        self.queued = 0
+        self.running = 0
+        self.completed = 0
+        self.rejected = 0
+        self.shed = 0
+
+    def submit(self, fn, *args, deadline=None):
+        if not self._slots.acquire(blocking=False):
+            with self._lock:
+                self.rejected += 1
+            raise LaneFull(self.name)
+
+        enqueued = time.monotonic()
+        with self._lock:
+            self.queued += 1
+        metrics.LANE_QUEUED.labels(self.name).inc()
+
+        def run():
+            started = time.monotonic()
+            metrics.LANE_QUEUED.labels(self.name).dec()
+            with self._lock:
+                self.queued -= 1
+                self._waits.append(started - enqueued)
+                if deadline is not None and started > deadline:
+                    self.shed += 1
+                    self._slots.release()
+                    raise DeadlineExceeded()
+                self.running += 1
+            metrics.LANE_RUNNING.labels(self.name).inc()
+            try:
+                return fn(*args)
+            finally:
+                with self._lock:
+                    self.running -= 1
+                    self.completed += 1
+                metrics.LANE_RUNNING.labels(self.name).dec()
+                self._slots.release()
+
+        return self._executor.submit(run)
+
+    def stats(self):
+        with self._lock:
+            waits = sorted(self._waits)
+            snapshot = {
+                "workers": self.workers,
+                "max_queue": self.max_queue,
+                "queued": self.queued,
+                "running": self.running,
+                "completed": self.completed,
+                "rejected": self.rejected,
+                "shed": self.shed,
+            }
+        if waits:
+            snapshot["queue_wait_ms"] = {
+                "avg": round(sum(waits) / len(waits) * 1000, 3),
+                "p50": round(waits[len(waits) // 2] * 1000, 3),
+                "p99": round(waits[min(len(waits) - 1, int(len(waits) * 0.99))] * 1000, 3),
+                "max": round(waits[-1] * 1000, 3),
+            }
+        else:
+            snapshot["queue_wait_ms"] = None
+        return snapshot
+
+
+class LaneScheduler:
+    """Routes scoring work to the interactive or bulk lane by cost"""
+
+    def __init__(self, bulk_cost=LANE_BULK_COST):
+        self.bulk_cost = bulk_cost
+        self.lanes = {
+            "interactive": Lane("interactive", LANE_INTERACTIVE_WORKERS, LANE_INTERACTIVE_QUEUE),
+            "bulk": Lane("bulk", LANE_BULK_WORKERS, LANE_BULK_QUEUE),
+        }
+
+    def classify(self, cost):
+        return "bulk" if cost >= self.bulk_cost else "interactive"
+
+    def submit(self, cost, fn, *args, deadline=None):
+        """Queue fn(*args) on the lane for cost; returns a Future"""
+        return self.lanes[self.classify(cost)].submit(fn, *args, deadline=deadline)
+
+    def run(self, cost, fn, *args, deadline=None):
+        """Run fn(*args) on the lane for cost and wait for the result"""
+        return self.submit(cost, fn, *args, deadline=deadline).result()
+
+    def stats(self):
+        return {name: lane.stats() for name, lane in self.lanes.items()}
+
+
+def text_cost(texts):
+    """Cost of scoring texts: the number of characters to process"""
+    return sum(len(text) for text in texts)
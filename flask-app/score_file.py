@@ -0,0 +1,248 @@
+"""Offline scoring of large review files on every core
+
+Scores an NDJSON file (a "text", "review" or "review_text" field per line,
+as bulk_import.py reads) or a plain file with one review per line, and writes
+each record back as NDJSON with "sentiment" and "confidence_score" added.
+
+The input is memory-mapped and split into byte ranges of about --chunk-bytes
+that end on line boundaries. Worker processes map the same file and score
+whole ranges, so only the range offsets and the finished output cross process
+boundaries. Output keeps input order by default; with --unordered each range
+is written as soon as it is done. With --mode fast reviews are scored by the
+analyzer's approximate lexicon-sum scorer (model.FastAnalyzer). Progress
+(MB/s, reviews/s) goes to stderr and a JSON summary to stdout.
+
+Every --checkpoint-seconds the output is flushed and the finished ranges are
+recorded in OUTPUT.checkpoint. Running the same command again after an
+interruption truncates the output to the last checkpoint and scores only the
+ranges not yet done. The checkpoint is removed once the file is complete.
+
+Usage:
+    python -m score_file reviews.ndjson -o scored.ndjson [--workers 8]
+                         [--format ndjson|lines] [--unordered] [--chunk-bytes 8388608]
+                         [--mode full|fast]
+"""
+import argparse
+import json
+import mmap
+import os
+import sys
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+import model
+from bulk_import import TEXT_FIELDS
+
+SCORE_FORMATS = ("ndjson", "lines")
+SCORE_CHUNK_BYTES = int(os.getenv("SCORE_CHUNK_BYTES", str(8 * 1024 * 1024)))
+SCORE_WORKERS = int(os.getenv("SCORE_WORKERS", str(os.cpu_count() or 1)))
+SCORE_CHECKPOINT_SECONDS = float(os.getenv("SCORE_CHECKPOINT_SECONDS", "30"))
+
+
+def split_ranges(path, chunk_bytes):
+    """(start, end) byte ranges of about chunk_bytes, each ending after a newline"""
+    size = os.path.getsize(path)
+    if size == 0:
+        return []
+    ranges = []
+    with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        start = 0
+        while start < size:
+            newline = mm.find(b"\n", min(start + chunk_bytes, size) - 1)
+            end = size if newline == -1 else newline + 1
+            ranges.append((start, end))
+            start = end
+    return ranges
+
+
+def parse_line(line, fmt):
+    """(output record, text) for one input line, or None when it has no text"""
+    if fmt == "lines":
+        record = {"text": line.decode("utf-8", "replace").rstrip("\r")}
+        text = record["text"].strip()
+    else:
+        record = json.loads(line)
+        if not isinstance(record, dict):
+            return None
+        text = next((record[field] for field in TEXT_FIELDS if isinstance(record.get(field), str)), "").strip()
+    if not text:
+        return None
+    return record, text
+
+
+def score_range(path, start, end, fmt, mode="full"):
+    """Score one byte range; runs inside the worker processes
+
+    Returns (output bytes, reviews scored, lines skipped)
+    """
+    analyzer = model.active().select(mode=mode)
+    with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        data = mm[start:end]
+    parsed = []
+    skipped = 0
+    for line in data.split(b"\n"):
+        if not line.strip():
+            continue
+        try:
+            item = parse_line(line, fmt)
+        except ValueError:
+            item = None
+        if item is None:
+            skipped += 1
+        else:
+            parsed.append(item)
+    out = []
+    for (record, _), scores in zip(parsed, analyzer.score_many([text for _, text in parsed])):
+        record["sentiment"], record["confidence_score"] = scores
+        out.append(json.dumps(record))
+    return ("\n".join(out) + "\n" if out else "").encode("utf-8"), len(out), skipped
+
+
+def results(path, ranges, todo, fmt, pool, ordered, depth, mode="full"):
+    """Yield (range index, score_range result), in input order unless ordered is False"""
+    if pool is None:
+        for index in todo:
+            yield index, score_range(path, *ranges[index], fmt, mode)
+        return
+
+    todo = iter(todo)
+    if ordered:
+        pending = deque()
+        for index in todo:
+            pending.append((index, pool.submit(score_range, path, *ranges[index], fmt, mode)))
+            if len(pending) >= depth:
+                done_index, future = pending.popleft()
+                yield done_index, future.result()
+        while pending:
+            done_index, future = pending.popleft()
+            yield done_index, future.result()
+        return
+
+    pending = {}
+    for index in todo:
+        pending[pool.submit(score_range, path, *ranges[index], fmt, mode)] = index
+        if len(pending) >= depth:
+            finished, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in finished:
+                yield pending.pop(future), future.result()
+    for future in list(pending):
+        yield pending.pop(future), future.result()
+
+
+def input_identity(path, chunk_bytes, fmt, ordered, mode="full"):
+    stat = os.stat(path)
+    return {"input": os.path.abspath(path), "input_size": stat.st_size, "input_mtime_ns": stat.st_mtime_ns,
+            "chunk_bytes": chunk_bytes, "format": fmt, "ordered": ordered, "mode": mode}
+
+
+def load_checkpoint(checkpoint_path, identity):
+    """Finished range indexes and output length from a matching checkpoint, if any"""
+    try:
+        with open(checkpoint_path) as f:
+            checkpoint = json.load(f)
+    except (OSError, ValueError):
+        return set(), 0
+    if {key: checkpoint.get(key) for key in identity} != identity:
+        raise SystemExit(f"{checkpoint_path} belongs to a different input or options; delete it to start over")
+    return set(checkpoint["done"]), checkpoint["output_bytes"]
+
+
+def save_checkpoint(checkpoint_path, identity, done, out):
+    out.flush()
+    os.fsync(out.fileno())
+    tmp = checkpoint_path + ".tmp"
+    with open(tmp, "w") as f:
+        json.dump({**identity, "done": sorted(done), "output_bytes": out.tell()}, f)
+    os.replace(tmp, checkpoint_path)
+
+
+def run(path, output, fmt="ndjson", workers=SCORE_WORKERS, ordered=True, chunk_bytes=SCORE_CHUNK_BYTES,
+        checkpoint_seconds=SCORE_CHECKPOINT_SECONDS, progress=None, mode="full"):
+    """Score path into output, resuming from output's checkpoint"""
+    checkpoint_path = output + ".checkpoint"
+    identity = input_identity(path, chunk_bytes, fmt, ordered, mode)
+    ranges = split_ranges(path, chunk_bytes)
+    done, output_bytes = load_checkpoint(checkpoint_path, identity)
+    todo = [index for index in range(len(ranges)) if index not in done]
+    total_bytes = identity["input_size"]
+    bytes_done = sum(end - start for index, (start, end) in enumerate(ranges) if index in done)
+
+    out = open(output, "r+b" if done else "wb")
+    out.truncate(output_bytes)
+    out.seek(output_bytes)
+    started = last_report = last_checkpoint = time.perf_counter()
+    bytes_read = reviews = skipped = 0
+    pool = ProcessPoolExecutor(max_workers=workers) if workers > 1 else None
+    try:
+        for index, (data, scored, bad) in results(path, ranges, todo, fmt, pool, ordered,
+                                                  max(workers, 1) * 2, mode):
+            out.write(data)
+            done.add(index)
+            start, end = ranges[index]
+            bytes_read += end - start
+            reviews += scored
+            skipped += bad
+            now = time.perf_counter()
+            if now - last_checkpoint >= checkpoint_seconds:
+                save_checkpoint(checkpoint_path, identity, done, out)
+                last_checkpoint = now
+            if progress and now - last_report >= 1:
+                progress(bytes_done + bytes_read, total_bytes, bytes_read, reviews, now - started)
+                last_report = now
+    except BaseException:
+        save_checkpoint(checkpoint_path, identity, done, out)
+        raise
+    finally:
+        if pool is not None:
+            pool.shutdown(cancel_futures=True)
+        out.close()
+    if os.path.exists(checkpoint_path):
+        os.remove(checkpoint_path)
+
+    elapsed = time.perf_counter() - started
+    return {
+        "input": path,
+        "output": output,
+        "mode": mode,
+        "ranges": len(ranges),
+        "resumed_ranges": len(ranges) - len(todo),
+        "reviews": reviews,
+        "skipped": skipped,
+        "seconds": round(elapsed, 3),
+        "mb_per_sec": round(bytes_read / elapsed / 1e6, 2) if elapsed else None,
+        "reviews_per_sec": round(reviews / elapsed, 1) if elapsed else None,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Score a review file offline on every core")
+    parser.add_argument("path")
+    parser.add_argument("-o", "--output", required=True)
+    parser.add_argument("--format", choices=SCORE_FORMATS, help="default: ndjson for .ndjson/.jsonl, else lines")
+    parser.add_argument("--workers", type=int, default=SCORE_WORKERS)
+    parser.add_argument("--unordered", action="store_true", help="write ranges as they finish")
+    parser.add_argument("--chunk-bytes", type=int, default=SCORE_CHUNK_BYTES)
+    parser.add_argument("--checkpoint-seconds", type=float, default=SCORE_CHECKPOINT_SECONDS)
+    parser.add_argument("--mode", choices=model.SCORING_MODES, default="full",
+                        help="fast: approximate lexicon-sum scoring for bulk analytics")
+    args = parser.parse_args(argv)
+
+    fmt = args.format or ("ndjson" if args.path.endswith((".ndjson", ".jsonl")) else "lines")
+
+    def progress(position, total, bytes_read, reviews, elapsed):
+        print(f"  {position / total:.0%} of input, {bytes_read / elapsed / 1e6:.1f} MB/s, "
+              f"{reviews / elapsed:.0f} reviews/sec", file=sys.stderr)
+
+    try:
+        result = run(args.path, args.output, fmt, args.workers, not args.unordered, args.chunk_bytes,
+                     args.checkpoint_seconds, progress, args.mode)
+    except KeyboardInterrupt:
+        print(f"Interrupted; run the same command again to resume from {args.output}.checkpoint", file=sys.stderr)
+        return 130
+    print(json.dumps(result))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,196 @@
+"""Slow-request and slow-query log
+
+Requests slower than SLOW_REQUEST_MS and SQL statements slower than
+SLOW_QUERY_MS are written to SLOW_LOG_PATH as one JSON object per line:
+
+* slow_request: route, method, status, duration, the Server-Timing phases,
+  every statement the request ran with its duration, text length, token
+  count and cache hits or misses
+* slow_query: the statement (placeholders only, never the bound values), its
+  duration and the route it ran for; on PostgreSQL also its EXPLAIN plan, at
+  most once per statement every SLOW_LOG_EXPLAIN_INTERVAL_SECONDS
+
+The request thread only puts the entry on a bounded queue (dropping it when
+the queue is full). A writer thread started on the first slow event renders
+the JSON, runs any EXPLAIN on its own connection and writes to a file that
+rotates at SLOW_LOG_MAX_BYTES.
+"""
+import json
+import logging
+import os
+import queue
+import threading
+import time
+from logging.handlers import RotatingFileHandler
+
+import timing
+
+SLOW_LOG_ENABLED = os.getenv("SLOW_LOG_ENABLED", "1") == "1"
+SLOW_REQUEST_MS = float(os.getenv("SLOW_REQUEST_MS", "1000"))
+SLOW_QUERY_MS = float(os.getenv("SLOW_QUERY_MS", "200"))
+SLOW_LOG_PATH = os.getenv("SLOW_LOG_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), "logs", "slow.jsonl"))
+SLOW_LOG_MAX_BYTES = int(os.getenv("SLOW_LOG_MAX_BYTES", str(10 * 1024 * 1024)))
+SLOW_LOG_BACKUPS = int(os.getenv("SLOW_LOG_BACKUPS", "5"))
+SLOW_LOG_QUEUE_SIZE = int(os.getenv("SLOW_LOG_QUEUE_SIZE", "10000"))
+SLOW_LOG_EXPLAIN_INTERVAL_SECONDS = float(os.getenv("SLOW_LOG_EXPLAIN_INTERVAL_SECONDS", "300"))
+
+EXPLAINABLE = ("select", "insert", "update", "delete", "with")
+
+# Set on the writer thread so the EXPLAIN queries it runs are not logged in turn
+_local = threading.local()
+
+
+def normalize(statement):
+    if isinstance(statement, bytes):
+        statement = statement.decode("utf-8", "replace")
+    return " ".join(str(statement).split())
+
+
+class JsonLinesFormatter(logging.Formatter):
+    def format(self, record):
+        return json.dumps(record.msg, default=str)
+
+
+class SlowLog:
+    """Queue of slow events drained to a rotating JSONL file by a writer thread"""
+
+    def __init__(self, path=SLOW_LOG_PATH, max_bytes=SLOW_LOG_MAX_BYTES, backups=SLOW_LOG_BACKUPS,
+                 queue_size=SLOW_LOG_QUEUE_SIZE, explain_interval=SLOW_LOG_EXPLAIN_INTERVAL_SECONDS):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.backups = backups
+        self.explain_interval = explain_interval
+        self.connect = None
+        self.db_type = None
+        self.written = 0
+        self.dropped = 0
+        self._queue = queue.Queue(queue_size)
+        self._thread = None
+        self._lock = threading.Lock()
+        self._explained = {}
+        self._explain_conn = None
+
+    def configure(self, connect, db_type):
+        """Database used for EXPLAIN; plans are only captured on PostgreSQL"""
+        self.connect = connect
+        self.db_type = db_type
+
+    def write(self, entry):
+        """Queue an entry without blocking; dropped when the writer is behind"""
+        if self._thread is None:
+            with self._lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._run, name="slow-log", daemon=True)
+                    self._thread.start()
+        try:
+            self._queue.put_nowait(entry)
+        except queue.Full:
+            self.dropped += 1
+
+    def flush(self, timeout=5):
+        """Wait until everything queued so far is on disk"""
+        deadline = time.monotonic() + timeout
+        while self._queue.unfinished_tasks and time.monotonic() < deadline:
+            time.sleep(0.01)
+
+    def _run(self):
+        _local.writer = True
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        handler = RotatingFileHandler(self.path, maxBytes=self.max_bytes, backupCount=self.backups,
+                                      encoding="utf-8")
+        handler.setFormatter(JsonLinesFormatter())
+        while True:
+            entry = self._queue.get()
+            try:
+                handler.emit(logging.makeLogRecord({"msg": self._render(entry)}))
+                self.written += 1
+            except Exception:
+                self.dropped += 1
+            finally:
+                self._queue.task_done()
+
+    def _render(self, entry):
+        if "statements" in entry:
+            entry["statements"] = [
+                {"statement": normalize(statement), "ms": round(seconds * 1000, 3)}
+                for statement, seconds in entry["statements"]
+            ]
+        explain = entry.pop("_explain", None)
+        if "statement" in entry:
+            entry["statement"] = normalize(entry["statement"])
+            if explain is not None:
+                plan = self._explain(entry["statement"], explain[0])
+                if plan is not None:
+                    entry["explain"] = plan
+        return entry
+
+    def _explain(self, statement, params):
+        now = time.monotonic()
+        last = self._explained.get(statement)
+        if last is not None and now - last < self.explain_interval:
+            return None
+        if len(self._explained) > 1000:
+            self._explained.clear()
+        self._explained[statement] = now
+
+        try:
+            if self._explain_conn is None:
+                self._explain_conn = self.connect()
+            if self._explain_conn is None:
+                return None
+            cur = self._explain_conn.cursor()
+            cur.execute(f"EXPLAIN {statement}", params)
+            plan = [row[0] for row in cur.fetchall()]
+            cur.close()
+            self._explain_conn.rollback()
+            return plan
+        except Exception as e:
+            try:
+                self._explain_conn.close()
+            except Exception:
+                pass
+            self._explain_conn = None
+            return [f"EXPLAIN failed: {e}"]
+
+    def stats(self):
+        return {"written": self.written, "dropped": self.dropped, "queued": self._queue.qsize()}
+
+
+slow_log = SlowLog()
+
+
+def check_query(statement, params, seconds):
+    """Log statement if it ran longer than SLOW_QUERY_MS"""
+    if not SLOW_LOG_ENABLED or seconds * 1000 < SLOW_QUERY_MS or getattr(_local, "writer", False):
+        return
+    request_timing = timing.current()
+    entry = {
+        "type": "slow_query",
+        "ts": time.time(),
+        "duration_ms": round(seconds * 1000, 3),
+        "statement": statement,
+        "route": request_timing.notes.get("route") if request_timing is not None else None,
+    }
+    explainable = str(statement).lstrip().lower().startswith(EXPLAINABLE)
+    if (slow_log.db_type == "postgresql" and slow_log.connect is not None
+            and explainable and not isinstance(params, list)):
+        entry["_explain"] = (params,)
+    slow_log.write(entry)
+
+
+def check_request(request_timing, route, method, status):
+    """Log the request if it took longer than SLOW_REQUEST_MS"""
+    seconds = request_timing.elapsed()
+    if not SLOW_LOG_ENABLED or seconds * 1000 < SLOW_REQUEST_MS:
+        return
+    slow_log.write({
+        "type": "slow_request",
+        "ts": time.time(),
+        "route": route,
+        "method": method,
+        "status": status,
+        "duration_ms": round(seconds * 1000, 3),
+        "phases": request_timing.as_dict(),
+        "statements": list(request_timing.statements),
+        **request_timing.notes,
+    })
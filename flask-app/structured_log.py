@@ -0,0 +1,164 @@
+"""Structured, buffered logging for the API and its workers
+
+Modules log named events with fields instead of printing:
+
+    log = structured_log.get_logger(__name__)
+    log.warning("db_store_failed", error=str(e))
+
+Records go onto a bounded in-memory queue (QueueHandler) and a single
+listener thread formats them as JSON lines and writes them to stderr, so a
+request thread never waits on stdout or on another thread's write. When the
+queue is full the record is dropped and counted rather than blocking.
+
+* LOG_LEVEL (default INFO) filters before anything is built. Per-request
+  events such as db_connected are DEBUG, so request-path logging is off by
+  default.
+* LOG_SAMPLE_RATES keeps only a fraction of chosen events, e.g.
+  "db_connection_failed=0.1,db_store_failed=0.01". Kept records carry
+  sample_rate so counts can be scaled back up.
+* LOG_FORMAT=text prints "LEVEL event key=value" lines for local development.
+"""
+import atexit
+import json
+import logging
+import os
+import queue
+import random
+import sys
+import time
+import traceback
+from logging.handlers import QueueHandler, QueueListener
+
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+LOG_FORMAT = os.getenv("LOG_FORMAT", "json")
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", "10000"))
+
+
+def parse_sample_rates(value):
+    rates = {}
+    for item in filter(None, (part.strip() for part in value.split(","))):
+        event, _, rate = item.partition("=")
+        rates[event.strip()] = min(1.0, max(0.0, float(rate)))
+    return rates
+
+
+LOG_SAMPLE_RATES = parse_sample_rates(os.getenv("LOG_SAMPLE_RATES", ""))
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {
+            "ts": time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime(record.created)) + f".{int(record.msecs):03d}Z",
+            "level": record.levelname.lower(),
+            "logger": record.name,
+            "event": record.msg,
+            "pid": record.process,
+        }
+        entry.update(getattr(record, "fields", {}))
+        if record.exc_text:
+            entry["exception"] = record.exc_text
+        return json.dumps(entry, default=str)
+
+
+class TextFormatter(logging.Formatter):
+    def format(self, record):
+        fields = " ".join(f"{key}={value}" for key, value in getattr(record, "fields", {}).items())
+        line = f"{record.levelname:<7} {record.msg} {fields}".rstrip()
+        return f"{line}\n{record.exc_text}" if record.exc_text else line
+
+
+class DroppingQueueHandler(QueueHandler):
+    """Puts records on the queue as they are; formatting happens on the listener thread"""
+
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record):
+        if record.exc_info:
+            # Traceback objects cannot outlive the except block, so render them now
+            record.exc_text = "".join(traceback.format_exception(*record.exc_info)).rstrip()
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+_root = logging.getLogger("sentiment")
+_handler = None
+_listener = None
+
+
+def _start_listener():
+    global _listener
+    output = logging.StreamHandler(sys.stderr)
+    output.setFormatter(TextFormatter() if LOG_FORMAT == "text" else JsonFormatter())
+    _listener = QueueListener(_handler.queue, output)
+    _listener.start()
+
+
+def configure():
+    """Install the queue handler and start the listener thread, once per process"""
+    global _handler
+    if _handler is not None:
+        return
+    _handler = DroppingQueueHandler(queue.Queue(LOG_QUEUE_SIZE))
+    _root.addHandler(_handler)
+    _root.setLevel(LOG_LEVEL)
+    _root.propagate = False
+    _start_listener()
+    atexit.register(lambda: _listener.stop())
+    # A forked worker (gunicorn --preload) inherits the queue but not the thread
+    os.register_at_fork(after_in_child=_start_listener)
+
+
+def flush():
+    """Write out everything queued so far"""
+    if _listener is not None:
+        _listener.stop()
+        _start_listener()
+
+
+def dropped():
+    return _handler.dropped if _handler is not None else 0
+
+
+class EventLogger:
+    """Logs named events with keyword fields, honouring level and sampling"""
+
+    def __init__(self, name):
+        self._logger = _root.getChild(name)
+
+    def _log(self, level, event, exc_info, fields):
+        if not self._logger.isEnabledFor(level):
+            return
+        rate = LOG_SAMPLE_RATES.get(event)
+        if rate is not None:
+            if random.random() >= rate:
+                return
+            fields["sample_rate"] = rate
+        self._logger.log(level, event, exc_info=exc_info, extra={"fields": fields})
+
+    def debug(self, event, **fields):
+        self._log(logging.DEBUG, event, None, fields)
+
+    def info(self, event, **fields):
+        self._log(logging.INFO, event, None, fields)
+
+    def warning(self, event, **fields):
+        self._log(logging.WARNING, event, None, fields)
+
+    def error(self, event, exc_info=None, **fields):
+        self._log(logging.ERROR, event, exc_info, fields)
+
+    def is_enabled(self, level):
+        return self._logger.isEnabledFor(level)
+
+
+def get_logger(name):
+    configure()
+    return EventLogger(name)
@@ -1,11 +1,44 @@
+import asyncio
+import io
+import ipaddress
+import json
 import unittest
+import sqlite3
+import subprocess
 import sys
+import threading
+import tempfile
+import time
+from datetime import datetime, timezone
+from types import SimpleNamespace
 import os
 
 # Add the parent directory to path to import app
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from app import app
+from flask import request
+import admission
+import asgi
+import batcher
+import bulk_import
+import corpus
+import db_utils
+import export
+import idempotency
+import jobs
+import metrics
+import model
+import profiler
+import rescore
+import retention
+import rollup
+import scheduler
+import score_file
+import slowlog
+import structured_log
+import timing
+import traffic
 
 class TestApp(unittest.TestCase):
     
@@ -34,5 +67,1110 @@ class TestApp(unittest.TestCase):
                                content_type='application/json')
         self.assertEqual(response.status_code, 200)
 
+    def test_timeseries_endpoint(self):
+        response = self.app.get('/stats/timeseries?granularity=day')
+        self.assertIn(response.status_code, [200, 503])  # 503 if DB not connected
+
+    def test_timeseries_rejects_bad_granularity(self):
+        response = self.app.get('/stats/timeseries?granularity=week')
+        self.assertEqual(response.status_code, 400)
+
+    @unittest.skipUnless(metrics.METRICS_ENABLED, "prometheus_client is not installed")
+    def test_client_metrics_roundtrip(self):
+        def totals():
+            reported = self.app.get('/client-metrics').get_json()['client_metrics']
+            return {(m['endpoint'], m['outcome']): (m['requests'], m['retries']) for m in reported}
+
+        before = totals()
+        for endpoint in ('/jobs/abc123', '/no-such-route'):
+            report = {'endpoint': endpoint, 'retries': 3, 'outcome': 'failed'}
+            self.assertEqual(self.app.post('/client-metrics', json=report).status_code, 200)
+        self.assertEqual(self.app.post('/client-metrics', json={'retries': 'x'}).status_code, 400)
+
+        after = totals()
+        for key in (('/jobs/<job_id>', 'failed'), ('other', 'failed')):
+            requests, retries = before.get(key, (0, 0))
+            self.assertEqual(after[key], (requests + 1, retries + 3))
+        scraped = self.app.get('/metrics').get_data(as_text=True)
+        self.assertIn('sentiment_client_retries_total{outcome="failed",route="/jobs/<job_id>"}', scraped)
+
+
+def make_reviews_db(rows):
+    """In-memory SQLite database with the reviews schema and the given rows"""
+    conn = sqlite3.connect(':memory:')
+    conn.execute("""
+        CREATE TABLE reviews (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            text TEXT NOT NULL,
+            sentiment TEXT NOT NULL,
+            confidence_score REAL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        );
+    """)
+    conn.executemany(
+        "INSERT INTO reviews (text, sentiment, confidence_score, created_at) VALUES (?, ?, ?, ?);",
+        rows
+    )
+    return conn
+
+
+class TestRollup(unittest.TestCase):
+
+    def setUp(self):
+        self.conn = make_reviews_db([
+            ('a', 'positive', 0.5, '2025-10-08 14:09:17'),
+            ('b', 'positive', 0.25, '2025-10-08 14:30:00'),
+            ('c', 'negative', 0.75, '2025-10-08 15:30:20'),
+        ])
+        self.cur = self.conn.cursor()
+
+    def tearDown(self):
+        self.conn.close()
+
+    def test_backfill_matches_group_by(self):
+        rollup.create_table(self.cur, 'sqlite')
+        buckets = rollup.timeseries(self.cur, 'sqlite', 'hour', rollup.bucket_start('2025-10-08 00:00:00', 'day'))
+        self.assertEqual([b['bucket_start'] for b in buckets], ['2025-10-08 14:00:00', '2025-10-08 15:00:00'])
+        self.assertEqual(buckets[0]['sentiment_distribution'], {'positive': 2})
+        self.assertEqual(buckets[0]['avg_confidence'], {'positive': 0.375})
+
+    def test_incremental_insert_and_delete(self):
+        rollup.create_table(self.cur, 'sqlite')
+        rollup.apply(self.cur, 'sqlite', [('2025-10-08 15:59:59', 'negative', 0.25)])
+        rollup.apply(self.cur, 'sqlite', [('2025-10-08 14:09:17', 'positive', 0.5)], sign=-1)
+        rollup.apply(self.cur, 'sqlite', [('2025-10-08 14:30:00', 'positive', 0.25)], sign=-1)
+
+        day = rollup.timeseries(self.cur, 'sqlite', 'day', rollup.bucket_start('2025-10-08 12:00:00', 'day'))
+        self.assertEqual(day[0]['sentiment_distribution'], {'negative': 2})
+        self.assertEqual(day[0]['total'], 2)
+        self.cur.execute("SELECT COUNT(*) FROM sentiment_rollup WHERE sentiment = 'positive';")
+        self.assertEqual(self.cur.fetchone()[0], 0)
+
+    def test_delete_only_clears_touched_buckets(self):
+        rollup.create_table(self.cur, 'sqlite')
+        self.cur.execute("UPDATE sentiment_rollup SET count = 0 WHERE sentiment = 'negative';")
+        rollup.apply(self.cur, 'sqlite', [('2025-10-08 14:09:17', 'positive', 0.5)], sign=-1)
+        self.cur.execute("SELECT COUNT(*) FROM sentiment_rollup WHERE sentiment = 'negative';")
+        self.assertEqual(self.cur.fetchone()[0], 2)
+
+    def test_timestamps_with_offsets_are_converted_to_utc(self):
+        self.assertEqual(db_utils.parse_timestamp('2025-10-08T19:30:00+05:30'), datetime(2025, 10, 8, 14, 0))
+        self.assertEqual(db_utils.parse_timestamp('2025-10-08T14:00:00Z'), datetime(2025, 10, 8, 14, 0))
+        self.assertEqual(db_utils.parse_timestamp('2025-10-08'), datetime(2025, 10, 8))
+        with self.assertRaises(ValueError):
+            db_utils.parse_timestamp('yesterday')
+
+
+class TestRetention(unittest.TestCase):
+
+    def test_purge_deletes_in_batches_and_updates_rollup(self):
+        rows = [(f'old {i}', 'negative', 0.5, f'2024-01-{i + 1:02d} 10:00:00') for i in range(7)]
+        rows.append(('new', 'positive', 0.5, '2025-06-01 10:00:00'))
+        conn = make_reviews_db(rows)
+        rollup.create_table(conn.cursor(), 'sqlite')
+
+        result = retention.purge_before(conn, 'sqlite', datetime(2025, 1, 1), batch_size=3)
+
+        self.assertEqual(result, {"dropped_partitions": [], "deleted_rows": 7})
+        self.assertEqual(conn.execute("SELECT text FROM reviews;").fetchall(), [('new',)])
+        self.assertEqual(conn.execute("SELECT DISTINCT sentiment FROM sentiment_rollup;").fetchall(), [('positive',)])
+        conn.close()
+
+    def test_checkpoint_only_in_wal_mode(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            for journal_mode in ('delete', 'wal'):
+                conn = sqlite3.connect(os.path.join(tmp, f'{journal_mode}.db'))
+                conn.execute(f"PRAGMA journal_mode = {journal_mode};")
+                statements = []
+                conn.set_trace_callback(statements.append)
+                retention.checkpoint(conn, 'sqlite')
+                conn.close()
+                checkpointed = any('wal_checkpoint' in statement for statement in statements)
+                self.assertEqual(checkpointed, journal_mode == 'wal', journal_mode)
+
+    def test_add_months_wraps_year(self):
+        self.assertEqual(retention.add_months(datetime(2025, 11, 1), 3), datetime(2026, 2, 1))
+        self.assertEqual(retention.partition_name(datetime(2026, 2, 1)), 'reviews_p202602')
+
+
+class TestExport(unittest.TestCase):
+
+    ROWS = [(f'review {i}', 'positive', 0.5, '2025-10-08 14:09:17') for i in range(5)]
+
+    def test_export_endpoint_rejects_unknown_format(self):
+        response = app.test_client().get('/reviews/export?format=xml')
+        self.assertEqual(response.status_code, 400)
+
+    def test_ndjson_resumes_after_id(self):
+        chunks = list(export.stream(make_reviews_db(self.ROWS), 'sqlite', 'ndjson', after_id=2, batch_size=2))
+        records = [json.loads(line) for line in ''.join(chunks).splitlines()]
+        self.assertEqual(len(chunks), 2)
+        self.assertEqual([r['id'] for r in records], [3, 4, 5])
+        self.assertEqual(records[0]['created_at'], '2025-10-08 14:09:17')
+
+    def test_csv_has_header(self):
+        lines = ''.join(export.stream(make_reviews_db(self.ROWS), 'sqlite', 'csv')).splitlines()
+        self.assertEqual(lines[0], 'id,text,sentiment,confidence_score,created_at')
+        self.assertEqual(lines[1], '1,review 0,positive,0.5,2025-10-08 14:09:17')
+        self.assertEqual(len(lines), 6)
+
+
+class TestBulkImport(unittest.TestCase):
+
+    CSV = "review,sentiment\ngreat great movie,positive\n,skipped\nawful boring plot,negative\nit was fine,neutral\n"
+
+    def setUp(self):
+        self.conn = make_reviews_db([])
+        rollup.create_table(self.conn.cursor(), 'sqlite')
+        rescore.create_table(self.conn.cursor(), 'sqlite')
+        bulk_import.create_table(self.conn.cursor(), 'sqlite')
+
+    def tearDown(self):
+        self.conn.close()
+
+    def test_import_skips_empty_rows_and_updates_rollup(self):
+        records = bulk_import.read_records(io.StringIO(self.CSV), 'csv')
+        result = bulk_import.run_import(self.conn, 'sqlite', records, 'imdb', chunk_size=2, workers=1)
+
+        self.assertEqual(result['rows_done'], 4)
+        self.assertEqual(result['rows_imported'], 3)
+        self.assertEqual(self.conn.execute("SELECT COUNT(*) FROM reviews;").fetchone()[0], 3)
+        self.assertEqual(self.conn.execute(
+            "SELECT SUM(count) FROM sentiment_rollup WHERE granularity = 'day';").fetchone()[0], 3)
+
+    def test_import_resumes_from_checkpoint(self):
+        bulk_import.save_checkpoint(self.conn.cursor(), 'sqlite', 'imdb', 2)
+        records = bulk_import.read_records(io.StringIO(self.CSV), 'csv')
+        result = bulk_import.run_import(self.conn, 'sqlite', records, 'imdb', workers=1)
+
+        self.assertEqual(result['rows_imported'], 2)
+        texts = [row[0] for row in self.conn.execute("SELECT text FROM reviews ORDER BY id;")]
+        self.assertEqual(texts, ['awful boring plot', 'it was fine'])
+
+    def test_import_endpoint_requires_import_id(self):
+        response = app.test_client().post('/reviews/import', data=self.CSV)
+        self.assertEqual(response.status_code, 400)
+
+    def test_created_at_is_stored_as_utc_timestamp(self):
+        ndjson = ''.join(json.dumps(record) + '\n' for record in [
+            {'text': 'great movie', 'created_at': '2025-10-08T14:09:17Z'},
+            {'text': 'awful plot', 'created_at': '2025-10-09T01:30:00+02:00'},
+            {'text': 'it was fine', 'created_at': '2025-10-10'},
+        ])
+        records = bulk_import.read_records(io.StringIO(ndjson), 'ndjson')
+        bulk_import.run_import(self.conn, 'sqlite', records, 'dates', workers=1)
+
+        stored = [row[0] for row in self.conn.execute("SELECT created_at FROM reviews ORDER BY id;")]
+        self.assertEqual(stored, ['2025-10-08 14:09:17', '2025-10-08 23:30:00', '2025-10-10 00:00:00'])
+        days = [row[0] for row in self.conn.execute(
+            "SELECT bucket_start FROM sentiment_rollup WHERE granularity = 'day' ORDER BY bucket_start;")]
+        self.assertEqual(days, ['2025-10-08 00:00:00', '2025-10-08 00:00:00', '2025-10-10 00:00:00'])
+
+    def test_invalid_created_at_is_rejected_before_loading(self):
+        ndjson = '{"text": "great movie"}\n{"text": "awful plot", "created_at": "last tuesday"}\n'
+        records = bulk_import.read_records(io.StringIO(ndjson), 'ndjson')
+        with self.assertRaises(ValueError):
+            bulk_import.run_import(self.conn, 'sqlite', records, 'dates', workers=1)
+        self.assertEqual(self.conn.execute("SELECT COUNT(*) FROM reviews;").fetchone()[0], 0)
+
+
+class TestRescore(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.db_path = os.path.join(self.tmp.name, 'rescore.db')
+        conn = self.connect()
+        conn.execute("""
+            CREATE TABLE reviews (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                text TEXT NOT NULL,
+                sentiment TEXT NOT NULL,
+                confidence_score REAL,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            );
+        """)
+        conn.executemany(
+            "INSERT INTO reviews (text, sentiment, confidence_score, created_at) VALUES (?, ?, ?, ?);",
+            [('great great movie', 'negative', 0.1, '2025-10-08 14:09:17'),
+             ('awful boring plot', 'negative', 0.1, '2025-10-08 14:30:00'),
+             ('it was fine', 'positive', 0.9, '2025-10-09 15:30:20')]
+        )
+        rollup.create_table(conn.cursor(), 'sqlite')
+        rescore.create_table(conn.cursor(), 'sqlite')
+        conn.commit()
+        conn.close()
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def connect(self):
+        return sqlite3.connect(self.db_path)
+
+    def test_rescore_updates_rows_rollup_and_checkpoint(self):
+        rescorer = rescore.Rescorer(self.connect, 'sqlite', batch_size=2, max_duty=1.0)
+        self.assertTrue(rescorer.run_pass())
+        self.assertEqual(rescorer.batches, 2)
+        self.assertEqual(rescorer.rows_rescored, 3)
+
+        conn = self.connect()
+        rows = conn.execute("SELECT text, sentiment, confidence_score, analyzer_version FROM reviews ORDER BY id;")
+        for text, sentiment, confidence, version in rows:
+            self.assertEqual((sentiment, confidence), model.predict_sentiment(text))
+            self.assertEqual(version, model.active().version)
+        rollup_counts = dict(conn.execute(
+            "SELECT sentiment, SUM(count) FROM sentiment_rollup WHERE granularity = 'day' GROUP BY sentiment;"))
+        review_counts = dict(conn.execute("SELECT sentiment, COUNT(*) FROM reviews GROUP BY sentiment;"))
+        self.assertEqual(rollup_counts, review_counts)
+        self.assertEqual(rescore.get_checkpoint(conn.cursor(), 'sqlite', model.active().version), 3)
+        conn.close()
+
+    def test_rescore_resumes_after_checkpoint(self):
+        rescore.Rescorer(self.connect, 'sqlite', max_duty=1.0).run_pass()
+        conn = self.connect()
+        conn.execute("INSERT INTO reviews (text, sentiment, confidence_score) VALUES ('great fun', 'neutral', 0);")
+        conn.commit()
+        conn.close()
+
+        rescorer = rescore.Rescorer(self.connect, 'sqlite', max_duty=1.0)
+        rescorer.run_pass()
+        self.assertEqual(rescorer.rows_rescored, 1)
+        self.assertEqual(rescorer.last_id, 4)
+
+
+class TestAnalyzerReload(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.config_path = os.path.join(self.tmp.name, 'analyzer.json')
+        self.original = model.active()
+
+    def tearDown(self):
+        model.reload(None)
+        self.tmp.cleanup()
+
+    def write_config(self, config):
+        with open(self.config_path, 'w') as f:
+            json.dump(config, f)
+
+    def test_reload_swaps_analyzer_and_version(self):
+        self.write_config({"lexicon": {"meh": -2}})
+        previous, analyzer = model.reload(self.config_path)
+
+        self.assertIs(previous, self.original)
+        self.assertIs(model.active(), analyzer)
+        self.assertNotEqual(analyzer.version, previous.version)
+        self.assertEqual(model.predict_sentiment('meh')[0], 'negative')
+        # A request that started on the old analyzer keeps its results
+        self.assertEqual(model.predict_sentiment('meh', previous)[0], 'neutral')
+
+    def test_failed_canary_keeps_current_analyzer(self):
+        self.write_config({"lexicon": {"fantastic": -3, "great": -3}})
+        with self.assertRaises(model.CanaryFailed) as raised:
+            model.reload(self.config_path)
+        self.assertEqual(raised.exception.failures[0]['expected'], 'positive')
+        self.assertIs(model.active(), self.original)
+
+    def test_overlays_compile_phrases_and_select_by_tenant(self):
+        with open(os.path.join(self.tmp.name, 'horror.tsv'), 'w') as f:
+            f.write("# entry\tmean\tstd\tratings\ngory\t-1.5\t0.5\t[-1, -2]\n")
+        self.write_config({
+            "overlays": {"movies": {"gripping": 2, "cheesy": -2, "plot hole": -2}, "horror": "horror.tsv"},
+            "tenants": {"key-1": "movies"},
+        })
+        _, base = model.reload(self.config_path)
+        movies = base.select("movies")
+
+        self.assertEqual(base.score("a cheesy plot hole")[0], 'neutral')
+        self.assertEqual(movies.score("The ending was a PLOT  HOLE")[0], 'negative')
+        self.assertEqual(base.select("horror").score("so gory")[0], 'negative')
+        self.assertIs(base.select(api_key="key-1"), movies)
+        self.assertIs(base.select(api_key="other"), base)
+        self.assertTrue(movies.version.startswith(base.version + "+movies-"))
+        self.assertIs(base.for_version(base.version + "+movies-00000000"), movies)
+        with self.assertRaises(model.UnknownOverlay):
+            base.select("nope")
+
+        client = app.test_client()
+        response = client.post('/predict', json={"text": "so cheesy", "overlay": "movies"})
+        self.assertEqual(response.get_json()['sentiment'], 'negative')
+        response = client.post('/batch-predict', json={"texts": ["so cheesy"]}, headers={'X-API-Key': 'key-1'})
+        self.assertEqual(response.get_json()['results'][0]['sentiment'], 'negative')
+        self.assertEqual(client.post('/predict', json={"text": "fine", "overlay": "nope"}).status_code, 400)
+
+    def test_endpoint_reports_canary_failures(self):
+        self.write_config({"lexicon": {"fantastic": -3, "great": -3}})
+        saved = asgi.wsgi.ADMIN_TOKEN
+        saved_path = model.ANALYZER_CONFIG_PATH
+        try:
+            asgi.wsgi.ADMIN_TOKEN = 'secret'
+            model.ANALYZER_CONFIG_PATH = self.config_path
+            response = app.test_client().post('/admin/analyzer/reload', headers={'X-Admin-Token': 'secret'})
+        finally:
+            asgi.wsgi.ADMIN_TOKEN = saved
+            model.ANALYZER_CONFIG_PATH = saved_path
+        self.assertEqual(response.status_code, 422)
+        self.assertEqual(response.get_json()['analyzer_version'], self.original.version)
+
+
+class TestFastMode(unittest.TestCase):
+
+    def setUp(self):
+        sia = SimpleNamespace(lexicon={"great": 3.1, "boring": -1.3, ":)": 2.0, model.phrase_key("plot hole"): -2.0})
+        self.analyzer = model.Analyzer("vader", sia, model.compile_phrases(["plot hole"]), version="vader-test")
+
+    def test_lexicon_sum_with_negation_emoticons_and_phrases(self):
+        fast = self.analyzer.select(mode="fast")
+        self.assertIs(fast, self.analyzer.fast)
+        self.assertEqual(fast.score("GREAT!"), ('positive', 0.6249))
+        self.assertEqual(fast.score("It was not that great")[0], 'negative')
+        self.assertEqual(fast.score("boring :)")[0], 'positive')
+        self.assertEqual(fast.score("one big Plot Hole")[0], 'negative')
+        self.assertEqual(fast.score("")[0], 'neutral')
+        # Stored fast scores are rescored in full
+        self.assertEqual(fast.version, "vader-test:fast")
+        self.assertIs(self.analyzer.for_version(fast.version), self.analyzer)
+
+    def test_batch_predict_selects_mode(self):
+        client = app.test_client()
+        response = client.post('/batch-predict', json={"texts": ["a great movie"], "mode": "fast"})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.get_json()['mode'], 'fast')
+        self.assertEqual(response.get_json()['results'][0]['sentiment'], 'positive')
+        self.assertEqual(client.post('/batch-predict', json={"texts": ["fine"], "mode": "quick"}).status_code, 400)
+        status, body = call_asgi('POST', '/batch-predict', json.dumps({"texts": ["fine"], "mode": "quick"}).encode())
+        self.assertEqual(status, 400)
+
+
+class TestVaderPhrases(unittest.TestCase):
+
+    def setUp(self):
+        from nltk.sentiment import SentimentIntensityAnalyzer
+        with tempfile.NamedTemporaryFile('w', suffix='.txt', delete=False) as f:
+            # VADER's tab-separated format; no trailing newline, which its reader would choke on
+            f.write("good\t1.9\t0.0\t[]\nbad\t-2.5\t0.0\t[]")
+        try:
+            sia = SentimentIntensityAnalyzer(lexicon_file=f"file:{f.name}")
+        finally:
+            os.remove(f.name)
+        sia.lexicon[model.phrase_key('plot hole')] = -2.0
+        self.analyzer = model.Analyzer('vader', sia, model.compile_phrases(['plot hole']), version='vader-test')
+
+    def test_phrases_next_to_punctuation_are_scored(self):
+        expected = self.analyzer.score('a plot hole')
+        self.assertEqual(expected[0], 'negative')
+        for text in ('a plot hole.', 'Plot hole!', 'a plot hole, sadly', 'İ saw a plot hole.'):
+            self.assertEqual(self.analyzer.score(text)[0], 'negative', text)
+        self.assertEqual(self.analyzer.score('a plot hole.'), expected)
+
+
+class TestScoreMany(unittest.TestCase):
+
+    def test_analyzer_score_many_matches_score(self):
+        analyzer = model.compile_analyzer("fallback", {"plot hole": -1})
+        texts = ["a plot hole", "very good", "", "fine"]
+        self.assertEqual(analyzer.score_many(texts), [analyzer.score(text) for text in texts])
+
+
+class TestCorpus(unittest.TestCase):
+
+    END = datetime(2026, 1, 1, tzinfo=timezone.utc)
+
+    def test_seeded_output_is_deterministic(self):
+        first = list(corpus.generate(50, seed=3, end=self.END))
+        self.assertEqual(first, list(corpus.generate(50, seed=3, end=self.END)))
+        self.assertNotEqual(first, list(corpus.generate(50, seed=4, end=self.END)))
+        self.assertTrue(all(review['created_at'] < '2026-01-01' for review in first))
+
+    def test_formats_read_back_by_bulk_import(self):
+        for fmt in corpus.CORPUS_FORMATS:
+            out = io.StringIO()
+            written = corpus.write(corpus.batches(1200, mix=(1, 0, 0), emoticons=1.0, end=self.END), out, fmt)
+            out.seek(0)
+            records = list(bulk_import.read_records(out, fmt))
+            self.assertEqual((written, len(records)), (1200, 1200))
+            self.assertTrue(all(text and db_utils.to_datetime(created_at) <= self.END.replace(tzinfo=None) for text, created_at in records))
+
+class TestScoreFile(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.input = os.path.join(self.tmp.name, 'in.ndjson')
+        with open(self.input, 'w') as f:
+            for i in range(300):
+                f.write(json.dumps({'id': i, 'text': 'a great movie' if i % 2 else 'awful and boring'}) + '\n')
+            f.write('not json\n')
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_ranges_end_on_line_boundaries(self):
+        ranges = score_file.split_ranges(self.input, 1000)
+        self.assertGreater(len(ranges), 5)
+        self.assertEqual((ranges[0][0], ranges[-1][1]), (0, os.path.getsize(self.input)))
+        with open(self.input, 'rb') as f:
+            data = f.read()
+        self.assertTrue(all(data[end - 1:end] == b'\n' for _, end in ranges))
+
+    def test_scores_in_order_and_resumes_from_checkpoint(self):
+        output = os.path.join(self.tmp.name, 'out.ndjson')
+        result = score_file.run(self.input, output, workers=1, chunk_bytes=1000)
+        self.assertEqual((result['reviews'], result['skipped']), (300, 1))
+        with open(output, 'rb') as f:
+            expected = f.read()
+        records = [json.loads(line) for line in expected.splitlines()]
+        self.assertEqual([r['id'] for r in records], list(range(300)))
+        self.assertEqual(records[0]['sentiment'], 'negative')
+
+        # An interrupted run: two ranges checkpointed, a partial third written after
+        identity = score_file.input_identity(self.input, 1000, 'ndjson', True)
+        first_two = sum(len(score_file.score_range(self.input, *r, 'ndjson')[0])
+                        for r in score_file.split_ranges(self.input, 1000)[:2])
+        with open(output + '.checkpoint', 'w') as f:
+            json.dump({**identity, 'done': [0, 1], 'output_bytes': first_two}, f)
+        with open(output, 'r+b') as f:
+            f.truncate(first_two + 10)
+        result = score_file.run(self.input, output, workers=1, chunk_bytes=1000)
+        self.assertEqual(result['resumed_ranges'], 2)
+        with open(output, 'rb') as f:
+            self.assertEqual(f.read(), expected)
+        self.assertFalse(os.path.exists(output + '.checkpoint'))
+
+class TestJobs(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.db_path = os.path.join(self.tmp.name, 'jobs.db')
+        self.jobs_dir, jobs.JOBS_DIR = jobs.JOBS_DIR, self.tmp.name
+        conn = self.connect()
+        jobs.create_table(conn.cursor(), 'sqlite')
+        conn.commit()
+        conn.close()
+        self.runner = jobs.JobRunner(self.connect, 'sqlite', workers=1, chunk_size=2)
+
+    def tearDown(self):
+        jobs.JOBS_DIR = self.jobs_dir
+        self.tmp.cleanup()
+
+    def connect(self):
+        return sqlite3.connect(self.db_path)
+
+    def submit(self, texts):
+        conn = self.connect()
+        job_id = jobs.create_job(conn, 'sqlite', 'ndjson',
+                                 lambda f: f.writelines(json.dumps({"text": t}) + "\n" for t in texts))
+        conn.close()
+        return job_id
+
+    def job(self, job_id):
+        conn = self.connect()
+        job = jobs.get_job(conn, 'sqlite', job_id)
+        conn.close()
+        return job
+
+    def test_runner_scores_all_records(self):
+        job_id = self.submit(['great film', 'awful film', 'fine'])
+        self.assertTrue(self.runner.run_next())
+        self.assertFalse(self.runner.run_next())
+
+        job = self.job(job_id)
+        status = jobs.describe(job)
+        self.assertEqual((status['job_status'], status['processed'], status['progress']), ('done', 3, 1.0))
+        results = [json.loads(line) for line in jobs.iter_results(job)]
+        self.assertEqual([r['index'] for r in results], [0, 1, 2])
+        self.assertEqual(results[1]['sentiment'], 'negative')
+
+    def test_stale_job_resumes_from_committed_chunk(self):
+        job_id = self.submit(['great film', 'awful film', 'fine'])
+        conn = self.connect()
+        conn.execute("UPDATE jobs SET status = 'running', processed = 2, started_ts = 1, heartbeat_ts = 1 WHERE id = ?;",
+                     (job_id,))
+        conn.commit()
+        conn.close()
+        # Two committed lines plus one written before the crash but never committed
+        with open(jobs.result_path(job_id), 'w') as f:
+            f.write('{"index": 0}\n{"index": 1}\n{"index": 2, "partial": true}\n')
+
+        self.assertTrue(self.runner.run_next())
+        results = [json.loads(line) for line in jobs.iter_results(self.job(job_id))]
+        self.assertEqual(len(results), 3)
+        self.assertEqual(results[2]['text'], 'fine')
+
+    def test_mode_is_stored_and_added_to_older_tables(self):
+        conn = self.connect()
+        job_id = jobs.create_job(conn, 'sqlite', 'ndjson', lambda f: f.write('{"text": "great film"}\n'), mode='fast')
+        conn.close()
+        self.assertEqual(jobs.describe(self.job(job_id))['mode'], 'fast')
+        self.assertTrue(self.runner.run_next())
+        self.assertEqual(json.loads(next(jobs.iter_results(self.job(job_id))))['sentiment'], 'positive')
+
+        conn = sqlite3.connect(':memory:')
+        conn.execute("CREATE TABLE jobs (id TEXT PRIMARY KEY, status TEXT, input_format TEXT);")
+        jobs.create_table(conn.cursor(), 'sqlite')
+        columns = [row[1] for row in conn.execute("PRAGMA table_info(jobs);")]
+        self.assertIn('mode', columns)
+        self.assertIn('owner', columns)
+        conn.close()
+
+    def test_runner_stops_when_job_is_taken_over(self):
+        job_id = self.submit(['great film', 'awful film', 'fine'])
+        conn = self.connect()
+        job = self.runner.claim(conn)
+        self.assertEqual(job['owner'], self.runner.owner)
+        conn.execute("UPDATE jobs SET owner = 'other' WHERE id = ?;", (job_id,))
+        conn.commit()
+
+        with self.assertRaises(jobs.LeaseLost):
+            self.runner.execute(conn, job)
+        conn.close()
+        job = self.job(job_id)
+        self.assertEqual((job['status'], job['processed'], job['owner']), ('running', 0, 'other'))
+        self.assertEqual(list(jobs.iter_results(job)), [])
+        with open(jobs.result_path(job_id)) as f:
+            self.assertEqual(f.read(), '')
+
+    def test_heartbeat_renews_until_taken_over(self):
+        job_id = self.submit(['great film'])
+        conn = self.connect()
+        self.runner.claim(conn)
+        conn.execute("UPDATE jobs SET heartbeat_ts = 1 WHERE id = ?;", (job_id,))
+        conn.commit()
+
+        self.assertTrue(self.runner.renew(conn, job_id))
+        self.assertGreater(self.job(job_id)['heartbeat_ts'], 1)
+        conn.execute("UPDATE jobs SET owner = 'other', heartbeat_ts = 1 WHERE id = ?;", (job_id,))
+        conn.commit()
+        self.assertFalse(self.runner.renew(conn, job_id))
+        self.assertEqual(self.job(job_id)['heartbeat_ts'], 1)
+        conn.close()
+
+
+def call_asgi(method, path, body=b'', query_string=b''):
+    """Drive asgi.application for one request and collect the response"""
+    status, _, body = call_asgi_with_headers(method, path, body, query_string)
+    return status, body
+
+
+def call_asgi_with_headers(method, path, body=b'', query_string=b'', headers=()):
+    """Like call_asgi, with the response headers as a dict as well
+
+    body may also be a list of chunks, each received as its own message.
+    """
+    scope = {'type': 'http', 'method': method, 'path': path, 'query_string': query_string,
+             'headers': [(b'content-type', b'application/json'), *headers], 'http_version': '1.1'}
+    chunks = [body] if isinstance(body, bytes) else body
+    messages = [{'type': 'http.request', 'body': chunk, 'more_body': i < len(chunks) - 1}
+                for i, chunk in enumerate(chunks)]
+    sent = []
+
+    async def receive():
+        return messages.pop(0)
+
+    async def send(message):
+        sent.append(message)
+
+    asyncio.run(asgi.application(scope, receive, send))
+    headers = {name.decode('latin-1'): value.decode('latin-1') for name, value in sent[0]['headers']}
+    return sent[0]['status'], headers, b''.join(m.get('body', b'') for m in sent[1:])
+
+
+class TestAsgi(unittest.TestCase):
+
+    def test_predict_matches_wsgi_contract(self):
+        status, body = call_asgi('POST', '/predict', json.dumps({'text': 'great movie'}).encode())
+        self.assertEqual(status, 200)
+        data = json.loads(body)
+        self.assertEqual((data['sentiment'], data['status']), ('positive', 'success'))
+
+    def test_predict_rejects_missing_text(self):
+        status, _ = call_asgi('POST', '/predict', b'{}')
+        self.assertEqual(status, 400)
+
+    def test_health_matches_wsgi(self):
+        status, body = call_asgi('GET', '/health')
+        self.assertEqual(status, 200)
+        data = json.loads(body)
+        expected = app.test_client().get('/health').get_json()
+        self.assertEqual(set(data), set(expected))
+        self.assertEqual(data['analyzer_version'], expected['analyzer_version'])
+
+    def test_other_routes_fall_back_to_flask(self):
+        status, body = call_asgi('GET', '/')
+        self.assertEqual(status, 200)
+        self.assertIn(b'Movie Sentiment Analysis API', body)
+
+    def test_flask_reads_a_body_sent_in_chunks(self):
+        body = json.dumps({'text': 'great movie'}).encode()
+        status, _, response = call_asgi_with_headers('POST', '/predict', [body[:5], body[5:9], b'', body[9:]],
+                                                     headers=[(b'idempotency-key', f'chunks-{time.time()}'.encode())])
+        self.assertEqual(status, 200)
+        self.assertEqual(json.loads(response)['sentiment'], 'positive')
+
+    def test_wsgi_input_receives_chunks_as_it_is_read(self):
+        messages = [{'type': 'http.request', 'body': b'abc', 'more_body': True},
+                    {'type': 'http.request', 'body': b'def', 'more_body': False}]
+        received = []
+
+        async def receive():
+            received.append(messages[len(received)])
+            return received[-1]
+
+        async def read():
+            stream = io.BufferedReader(asgi.RequestBody(receive, asyncio.get_running_loop()))
+            first = await asyncio.to_thread(stream.read1, 2)
+            self.assertEqual((first, len(received)), (b'ab', 1))
+            return first + await asyncio.to_thread(stream.read)
+
+        self.assertEqual(asyncio.run(read()), b'abcdef')
+        self.assertEqual(len(received), 2)
+
+    def test_native_route_rejects_a_body_over_the_limit(self):
+        saved, asgi.ASGI_MAX_BODY_BYTES = asgi.ASGI_MAX_BODY_BYTES, 16
+        try:
+            status, body = call_asgi('POST', '/predict', [b'{"text": "great', b' movie, great plot"}'])
+        finally:
+            asgi.ASGI_MAX_BODY_BYTES = saved
+        self.assertEqual(status, 413)
+        self.assertEqual(json.loads(body)['status'], 'error')
+
+
+class TestMicroBatcher(unittest.TestCase):
+
+    def test_lone_request_is_not_delayed(self):
+        mb = batcher.MicroBatcher(lambda items: [item * 2 for item in items], max_wait=1.0)
+        self.assertEqual(mb.window(1), 0.0)
+        self.assertEqual(mb.submit(21).result(timeout=0.5), 42)
+
+    def test_concurrent_requests_share_a_batch(self):
+        sizes = []
+
+        def process(items):
+            sizes.append(len(items))
+            return [item * 2 for item in items]
+
+        mb = batcher.MicroBatcher(process, max_items=8, max_wait=0.05)
+        futures = [mb.submit(i) for i in range(6)]
+
+        self.assertEqual([f.result(timeout=1) for f in futures], [0, 2, 4, 6, 8, 10])
+        self.assertEqual(sum(sizes), 6)
+        self.assertLess(len(sizes), 6)
+
+    def test_batch_failure_reaches_every_caller(self):
+        def process(items):
+            raise RuntimeError("scoring failed")
+
+        mb = batcher.MicroBatcher(process)
+        with self.assertRaises(RuntimeError):
+            mb.submit('x').result(timeout=1)
+
+
+class TestLaneScheduler(unittest.TestCase):
+
+    def test_interactive_work_does_not_wait_behind_bulk(self):
+        lanes = scheduler.LaneScheduler(bulk_cost=100)
+        release = threading.Event()
+        bulk = [lanes.submit(1000, release.wait, 2) for _ in range(lanes.lanes['bulk'].workers)]
+
+        self.assertEqual(lanes.run(10, len, 'quick'), 5)
+        self.assertEqual(lanes.stats()['bulk']['running'], len(bulk))
+        release.set()
+
+    def test_full_lane_rejects_instead_of_queueing(self):
+        lane = scheduler.Lane('bulk', workers=1, max_queue=1)
+        release = threading.Event()
+        lane.submit(release.wait, 2)
+        lane.submit(release.wait, 2)
+
+        with self.assertRaises(scheduler.LaneFull):
+            lane.submit(release.wait, 2)
+        self.assertEqual(lane.stats()['rejected'], 1)
+        release.set()
+
+    def test_lane_stats_endpoint(self):
+        response = app.test_client().get('/stats/lanes')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('interactive', response.get_json()['lanes'])
+
+
+class TestAdmission(unittest.TestCase):
+
+    def test_token_bucket_limits_each_client(self):
+        now = [0.0]
+        controller = admission.AdmissionController(max_concurrency=10, rate=1, burst=2, clock=lambda: now[0])
+        for _ in range(2):
+            self.assertIsNone(controller.admit('ip:1'))
+            controller.release()
+
+        rejection = controller.admit('ip:1')
+        self.assertEqual((rejection.status, rejection.headers()), (429, {'Retry-After': '1'}))
+        self.assertIsNone(controller.admit('ip:2'))
+        now[0] = 1.0
+        self.assertIsNone(controller.admit('ip:1'))
+
+    def test_concurrency_limit_rejects_with_503(self):
+        controller = admission.AdmissionController(max_concurrency=1, rate=100, burst=100)
+        self.assertIsNone(controller.admit('a'))
+        self.assertEqual(controller.admit('b').status, 503)
+        controller.release()
+        self.assertIsNone(controller.admit('b'))
+
+    def test_forwarded_for_is_only_believed_from_trusted_proxies(self):
+        headers = {'X-Forwarded-For': '203.0.113.9, 10.0.0.7'}
+        self.assertEqual(admission.client_key(headers, '198.51.100.1', []), 'ip:198.51.100.1')
+        self.assertEqual(admission.client_key(headers, '10.0.0.5'), 'ip:10.0.0.5')
+
+        proxies = [ipaddress.ip_network('10.0.0.0/8')]
+        self.assertEqual(admission.client_key(headers, '10.0.0.5', proxies), 'ip:203.0.113.9')
+        spoofed = {'X-Forwarded-For': '1.2.3.4, 203.0.113.9'}
+        self.assertEqual(admission.client_key(spoofed, '10.0.0.5', proxies), 'ip:203.0.113.9')
+        self.assertEqual(admission.client_key({}, '10.0.0.5', proxies), 'ip:10.0.0.5')
+
+    def test_expired_work_is_shed_not_run(self):
+        lane = scheduler.Lane('interactive', workers=1, max_queue=1)
+        future = lane.submit(len, 'text', deadline=time.monotonic() - 1)
+        with self.assertRaises(admission.DeadlineExceeded):
+            future.result()
+        self.assertEqual(lane.stats()['shed'], 1)
+
+    def test_deadline_counts_time_queued_before_the_app(self):
+        headers = {'X-Request-Start': f't={time.time() - 10:.3f}', 'X-Request-Timeout': '1000'}
+        self.assertLess(admission.request_deadline(headers), time.monotonic())
+
+    def test_rate_limited_request_gets_retry_after(self):
+        original = asgi.wsgi.admission_controller
+        asgi.wsgi.admission_controller = admission.AdmissionController(rate=0.5, burst=1)
+        try:
+            client = app.test_client()
+            headers = {'X-API-Key': 'test'}
+            self.assertEqual(client.get('/stats/lanes', headers=headers).status_code, 200)
+            response = client.get('/stats/lanes', headers=headers)
+            self.assertEqual(response.status_code, 429)
+            self.assertEqual(response.headers['Retry-After'], '2')
+
+            status, _ = call_asgi('GET', '/stats/lanes')
+            self.assertEqual(status, 200)
+            status, _ = call_asgi('GET', '/stats/lanes')
+            self.assertEqual(status, 429)
+        finally:
+            asgi.wsgi.admission_controller = original
+
+
+class TestIdempotency(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.db_path = os.path.join(self.tmp.name, 'keys.db')
+        conn = self.connect()
+        idempotency.create_table(conn.cursor(), 'sqlite')
+        conn.commit()
+        conn.close()
+        self.calls = 0
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def connect(self):
+        return sqlite3.connect(self.db_path, timeout=10)
+
+    def score(self, status=200, delay=0):
+        def fn():
+            self.calls += 1
+            time.sleep(delay)
+            return {'id': self.calls}, status, {}
+        return fn
+
+    def test_repeat_replays_first_response(self):
+        store = idempotency.IdempotencyStore(self.connect, 'sqlite')
+        first, replayed = store.run('k1', 'h', self.score())
+        self.assertFalse(replayed)
+        second, replayed = store.run('k1', 'h', self.score())
+        self.assertTrue(replayed)
+        self.assertEqual((first[0], second[0], self.calls), ({'id': 1}, {'id': 1}, 1))
+
+        with self.assertRaises(idempotency.KeyReused):
+            store.run('k1', 'other', self.score())
+
+    def test_other_process_replays_from_table(self):
+        idempotency.IdempotencyStore(self.connect, 'sqlite').run('k1', 'h', self.score())
+        (payload, status, _), replayed = idempotency.IdempotencyStore(self.connect, 'sqlite').run(
+            'k1', 'h', self.score())
+        self.assertEqual((payload, status, replayed, self.calls), ({'id': 1}, 200, True, 1))
+
+    def test_datetime_payload_is_stored_as_rendered(self):
+        created_at = datetime(2025, 10, 8, 14, 9, 17)
+        fn = lambda: ({'id': 1, 'created_at': created_at}, 200, {})
+        first, _ = idempotency.IdempotencyStore(self.connect, 'sqlite', dumps=app.json.dumps).run('k1', 'h', fn)
+        (payload, status, _), replayed = idempotency.IdempotencyStore(self.connect, 'sqlite').run('k1', 'h', fn)
+
+        self.assertTrue(replayed)
+        self.assertEqual(app.json.loads(app.json.dumps(first[0])), payload)
+        self.assertEqual(payload['created_at'], 'Wed, 08 Oct 2025 14:09:17 GMT')
+
+    def test_concurrent_duplicates_wait_for_the_first(self):
+        store = idempotency.IdempotencyStore(self.connect, 'sqlite')
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(store.run('k1', 'h', self.score(delay=0.2))))
+                   for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(self.calls, 1)
+        self.assertEqual({result[0][0]['id'] for result in results}, {1})
+
+    def test_waiters_run_again_after_a_failed_first_request(self):
+        store = idempotency.IdempotencyStore(self.connect, 'sqlite')
+        results = []
+        first = threading.Thread(target=lambda: results.append(store.run('k1', 'h', self.score(503, delay=0.2))))
+        first.start()
+        time.sleep(0.05)
+        results.append(store.run('k1', 'h', self.score()))
+        first.join()
+        (_, status, _), replayed = results[1]
+        self.assertEqual((status, replayed, self.calls), (200, False, 2))
+
+    def test_errors_are_not_remembered(self):
+        store = idempotency.IdempotencyStore(self.connect, 'sqlite')
+        store.run('k1', 'h', self.score(status=503))
+        (_, status, _), replayed = store.run('k1', 'h', self.score())
+        self.assertEqual((status, replayed, self.calls), (200, False, 2))
+
+    def test_predict_endpoint_replays_keyed_request(self):
+        client = app.test_client()
+        headers = {'Idempotency-Key': f'test-{time.time()}'}
+        first = client.post('/predict', json={'text': 'great movie'}, headers=headers)
+        second = client.post('/predict', json={'text': 'great movie'}, headers=headers)
+        self.assertEqual(first.get_json(), second.get_json())
+        self.assertEqual(second.headers.get('Idempotent-Replayed'), 'true')
+        self.assertEqual(client.post('/predict', json={'text': 'awful'}, headers=headers).status_code, 422)
+
+
+class TestMetrics(unittest.TestCase):
+
+    def test_metrics_endpoint_reports_routes_and_scoring(self):
+        client = app.test_client()
+        client.post('/predict', json={'text': 'great movie'})
+        response = client.get('/metrics')
+        self.assertEqual(response.status_code, 200)
+        body = response.get_data(as_text=True)
+        self.assertIn('sentiment_http_requests_total{method="POST",route="/predict",status="200"}', body)
+        self.assertIn('sentiment_scoring_duration_seconds_count{text_length="0-100"}', body)
+
+    def test_sqlite_statements_and_commits_are_timed(self):
+        def count(operation):
+            return metrics.prometheus_client.REGISTRY.get_sample_value(
+                'sentiment_db_operation_duration_seconds_count', {'operation': operation}) or 0
+
+        before = count('query'), count('commit')
+        conn = sqlite3.connect(':memory:', factory=metrics.TimedSqliteConnection)
+        conn.cursor().execute('CREATE TABLE t (x INTEGER)')
+        conn.commit()
+        self.assertEqual((count('query'), count('commit')), (before[0] + 1, before[1] + 1))
+
+    def test_multiprocess_mode_aggregates_workers(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            env = dict(os.environ, PROMETHEUS_MULTIPROC_DIR=tmp)
+            cwd = os.path.dirname(os.path.abspath(__file__))
+            record = "import metrics; metrics.observe_request('/predict', 'POST', 200, 0.01)"
+            for _ in range(2):
+                subprocess.run([sys.executable, '-c', record], env=env, cwd=cwd, check=True)
+            output = subprocess.run([sys.executable, '-c', 'import metrics; print(metrics.render()[0].decode())'],
+                                    env=env, cwd=cwd, check=True, capture_output=True, text=True).stdout
+        self.assertIn('sentiment_http_requests_total{method="POST",route="/predict",status="200"} 2.0', output)
+
+
+class TestServerTiming(unittest.TestCase):
+
+    def setUp(self):
+        self.saved = timing.SERVER_TIMING, timing.SERVER_TIMING_BODY
+        timing.SERVER_TIMING = timing.SERVER_TIMING_BODY = True
+
+    def tearDown(self):
+        timing.SERVER_TIMING, timing.SERVER_TIMING_BODY = self.saved
+
+    def test_predict_reports_phases(self):
+        response = app.test_client().post('/predict', json={'text': 'great movie'})
+        phases = [entry.split(';')[0] for entry in response.headers['Server-Timing'].split(', ')]
+        for name in ('parse', 'score', 'serialize', 'total'):
+            self.assertIn(name, phases)
+        self.assertIn('score', response.get_json()['_timing'])
+
+    def test_asgi_predict_reports_phases(self):
+        status, body = call_asgi('POST', '/predict', json.dumps({'text': 'great movie'}).encode())
+        self.assertEqual(status, 200)
+        self.assertLessEqual({'parse', 'score', 'total'}, set(json.loads(body)['_timing']))
+
+    def test_timing_is_off_by_default(self):
+        timing.SERVER_TIMING = False
+        response = app.test_client().post('/predict', json={'text': 'great movie'})
+        self.assertNotIn('Server-Timing', response.headers)
+        self.assertNotIn('_timing', response.get_json())
+
+    def test_asgi_timing_is_off_by_default(self):
+        timing.SERVER_TIMING = False
+        saved, slowlog.SLOW_LOG_ENABLED = slowlog.SLOW_LOG_ENABLED, True
+        try:
+            status, headers, body = call_asgi_with_headers('POST', '/predict',
+                                                           json.dumps({'text': 'great movie'}).encode())
+        finally:
+            slowlog.SLOW_LOG_ENABLED = saved
+        self.assertEqual(status, 200)
+        self.assertNotIn('server-timing', headers)
+        self.assertNotIn('_timing', json.loads(body))
+
+
+class TestProfiler(unittest.TestCase):
+
+    def test_collapsed_stacks_include_busy_thread(self):
+        stop = threading.Event()
+
+        def spin_until_stopped():
+            while not stop.is_set():
+                sum(range(1000))
+
+        worker = threading.Thread(target=spin_until_stopped, name='spinner')
+        worker.start()
+        try:
+            stacks, samples = profiler.Profiler(min_interval=0).run(0.2, interval_ms=5)
+        finally:
+            stop.set()
+            worker.join()
+        self.assertGreater(samples, 0)
+        line = next(line for line in stacks.splitlines() if line.startswith('spinner;'))
+        self.assertIn('spin_until_stopped', line)
+        self.assertTrue(line.rsplit(' ', 1)[1].isdigit())
+
+    def test_runs_are_rate_limited(self):
+        runner = profiler.Profiler(min_interval=60)
+        runner.run(0.1)
+        with self.assertRaises(profiler.ProfilerBusy):
+            runner.run(0.1)
+
+    def test_endpoint_requires_admin_token(self):
+        saved = asgi.wsgi.ADMIN_TOKEN
+        client = app.test_client()
+        try:
+            asgi.wsgi.ADMIN_TOKEN = None
+            self.assertEqual(client.get('/admin/profile').status_code, 403)
+            asgi.wsgi.ADMIN_TOKEN = 'secret'
+            self.assertEqual(client.get('/admin/profile').status_code, 401)
+            response = client.get('/admin/profile?seconds=0.1', headers={'X-Admin-Token': 'secret'})
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.mimetype, 'text/plain')
+        finally:
+            asgi.wsgi.ADMIN_TOKEN = saved
+
+
+class TestSlowLog(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp.name, 'slow.jsonl')
+        self.saved = slowlog.slow_log, slowlog.SLOW_REQUEST_MS, slowlog.SLOW_QUERY_MS
+        slowlog.slow_log = slowlog.SlowLog(path=self.path, max_bytes=2000, backups=2)
+
+    def tearDown(self):
+        slowlog.slow_log, slowlog.SLOW_REQUEST_MS, slowlog.SLOW_QUERY_MS = self.saved
+        self.tmp.cleanup()
+
+    def entries(self):
+        slowlog.slow_log.flush()
+        with open(self.path) as f:
+            return [json.loads(line) for line in f]
+
+    def test_slow_request_records_context(self):
+        slowlog.SLOW_REQUEST_MS = 0
+        app.test_client().post('/predict', json={'text': 'a truly great movie'})
+        entry = next(e for e in self.entries() if e['type'] == 'slow_request')
+        self.assertEqual((entry['route'], entry['status']), ('/predict', 200))
+        self.assertEqual((entry['text_length'], entry['token_count']), (19, 4))
+        self.assertIn('total', entry['phases'])
+
+    def test_slow_query_logs_statement_without_values(self):
+        slowlog.SLOW_QUERY_MS = 0
+        conn = sqlite3.connect(':memory:', factory=metrics.TimedSqliteConnection)
+        conn.cursor().execute('CREATE TABLE t (x TEXT)')
+        conn.cursor().execute('INSERT INTO t (x)\n   VALUES (?)', ('secret',))
+        entry = self.entries()[-1]
+        self.assertEqual(entry['statement'], 'INSERT INTO t (x) VALUES (?)')
+        self.assertNotIn('secret', json.dumps(entry))
+
+    def test_file_rotates(self):
+        for i in range(50):
+            slowlog.slow_log.write({'type': 'slow_request', 'n': i, 'padding': 'x' * 100})
+        slowlog.slow_log.flush()
+        self.assertTrue(os.path.exists(self.path + '.1'))
+
+class TestStructuredLog(unittest.TestCase):
+
+    def setUp(self):
+        self.queue = structured_log.queue.Queue(2)
+        self.handler = structured_log.DroppingQueueHandler(self.queue)
+        self.log = structured_log.EventLogger('test')
+        self.log._logger.addHandler(self.handler)
+        self.saved = structured_log.LOG_SAMPLE_RATES
+
+    def tearDown(self):
+        self.log._logger.removeHandler(self.handler)
+        structured_log.LOG_SAMPLE_RATES = self.saved
+
+    def test_request_path_events_off_by_default(self):
+        self.log.debug('db_connected', method=1)
+        self.assertTrue(self.queue.empty())
+
+    def test_json_event_with_fields(self):
+        self.log.warning('db_store_failed', error='boom')
+        entry = json.loads(structured_log.JsonFormatter().format(self.queue.get_nowait()))
+        self.assertEqual((entry['level'], entry['event'], entry['error']), ('warning', 'db_store_failed', 'boom'))
+
+    def test_sampling_and_full_queue_drop(self):
+        structured_log.LOG_SAMPLE_RATES = structured_log.parse_sample_rates('never=0, always=1')
+        for _ in range(10):
+            self.log.warning('never')
+        self.assertTrue(self.queue.empty())
+        for _ in range(5):
+            self.log.warning('always')
+        self.assertEqual((self.queue.qsize(), self.handler.dropped), (2, 3))
+        self.assertEqual(self.queue.get_nowait().fields['sample_rate'], 1.0)
+
+class TestTrafficRecording(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp.name, 'traffic.jsonl')
+        self.saved = traffic.recorder
+        traffic.recorder = slowlog.SlowLog(path=self.path)
+
+    def tearDown(self):
+        traffic.recorder = self.saved
+        self.tmp.cleanup()
+
+    def test_records_replayable_request_without_credentials(self):
+        app.test_client().post('/predict?x=1', json={'text': 'great film'},
+                               headers={'X-API-Key': 'secret-key', 'Idempotency-Key': 'k1'})
+        traffic.recorder.flush()
+        with open(self.path) as f:
+            entry = json.loads(f.readline())
+        self.assertEqual((entry['method'], entry['path'], entry['query']), ('POST', '/predict', 'x=1'))
+        self.assertEqual(json.loads(entry['body']), {'text': 'great film'})
+        self.assertEqual(entry['headers']['Idempotency-Key'], 'k1')
+        self.assertNotIn('secret-key', json.dumps(entry))
+        self.assertEqual(len(entry['client']), 12)
+
+    def test_streamed_import_body_is_left_for_the_route(self):
+        csv_body = b'review\ngreat film\n'
+        with app.test_request_context('/reviews/import?import_id=i1', method='POST', data=csv_body,
+                                      content_type='text/csv'):
+            app.preprocess_request()
+            self.assertEqual(request.stream.read(), csv_body)
+        traffic.recorder.flush()
+        with open(self.path) as f:
+            entry = json.loads(f.readline())
+        self.assertEqual((entry['path'], entry['body_length']), ('/reviews/import', len(csv_body)))
+        self.assertNotIn('body', entry)
+
+    def test_multipart_upload_records_only_its_length(self):
+        self.assertFalse(traffic.records_body('/jobs', 'multipart/form-data; boundary=x'))
+        self.assertTrue(traffic.records_body('/jobs', 'application/json'))
+
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file
@@ -0,0 +1,104 @@
+"""Per-request timing breakdown for the Server-Timing header
+
+With SERVER_TIMING=1 every request records how long it spent parsing the
+body, scoring, connecting to and querying the database and serializing the
+response, and sends the totals as a Server-Timing header that browser dev
+tools, the frontend and the load-test tools can read per request. With
+SERVER_TIMING_BODY=1 as well (a debug flag) the same breakdown is added to
+JSON responses as a "_timing" object.
+
+Phases are recorded against the request's context, so work done on another
+thread (a scoring lane, the micro-batcher) is timed around the wait in the
+request thread instead. The same record also collects each SQL statement's
+duration and a few notes (text size, cache hits) for the slow log.
+"""
+import contextvars
+import os
+import time
+from contextlib import contextmanager
+
+SERVER_TIMING = os.getenv("SERVER_TIMING", "0") == "1"
+SERVER_TIMING_BODY = os.getenv("SERVER_TIMING_BODY", "0") == "1"
+
+# Statements kept per request; a runaway loop of queries should not grow without bound
+MAX_STATEMENTS = 50
+
+_current = contextvars.ContextVar("request_timing", default=None)
+
+
+class RequestTiming:
+    """Monotonic start time plus total seconds spent in each phase"""
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.phases = {}
+        self.statements = []
+        self.notes = {}
+
+    def add(self, name, seconds):
+        self.phases[name] = self.phases.get(name, 0.0) + seconds
+
+    def elapsed(self):
+        return time.perf_counter() - self.start
+
+    def as_dict(self):
+        """Milliseconds per phase, plus the total so far"""
+        timing = {name: round(seconds * 1000, 3) for name, seconds in self.phases.items()}
+        timing["total"] = round((time.perf_counter() - self.start) * 1000, 3)
+        return timing
+
+    def header(self):
+        return ", ".join(f"{name};dur={ms}" for name, ms in self.as_dict().items())
+
+
+def start():
+    """Begin timing the current request; returns the token to pass to finish"""
+    return _current.set(RequestTiming())
+
+
+def finish(token):
+    _current.reset(token)
+
+
+def current():
+    return _current.get()
+
+
+def record(name, seconds):
+    timing = _current.get()
+    if timing is not None:
+        timing.add(name, seconds)
+
+
+def record_statement(statement, seconds):
+    timing = _current.get()
+    if timing is not None and len(timing.statements) < MAX_STATEMENTS:
+        timing.statements.append((statement, seconds))
+
+
+def note(key, value):
+    timing = _current.get()
+    if timing is not None:
+        timing.notes[key] = value
+
+
+def note_texts(texts):
+    """Record how much text the request carried"""
+    timing = _current.get()
+    if timing is not None:
+        timing.notes["text_length"] = sum(len(text) for text in texts)
+        timing.notes["token_count"] = sum(len(text.split()) for text in texts)
+
+
+@contextmanager
+def phase(name):
+    """Time the enclosed block as part of phase name, if the request is being timed"""
+    timing = _current.get()
+    if timing is None:
+        yield
+        return
+    begin = time.perf_counter()
+    try:
+        yield
+    finally:
+        timing.add(name, time.perf_counter() - begin)
@@ -0,0 +1,72 @@
+"""Traffic recording for load-test replay
+
+With TRAFFIC_RECORD_PATH set, the API appends a sample of the requests it
+receives (TRAFFIC_RECORD_SAMPLE, 1.0 by default) to that file as JSON lines,
+which benchmarks/loadtest.py replays against a local server:
+
+    {"t": 1760000000.123, "method": "POST", "path": "/predict", "query": "",
+     "headers": {"Content-Type": "application/json"}, "client": "3f2a9c01d4e5",
+     "body": "{\\"text\\": \\"...\\"}"}
+
+Only headers that shape how a request is served are kept (REPLAY_HEADERS).
+Credentials are never written; the client's API key or address becomes an
+opaque "client" hash so replay can reproduce per-client rate limiting. With
+TRAFFIC_RECORD_BODIES=0 the bodies are left out and replay sends a generated
+review of the recorded length instead. Streamed imports and multipart uploads
+never have their bodies read for the log, which would use up the stream the
+route reads from and hold whole files in memory; only their Content-Length is
+recorded.
+
+Entries go through the same queue-and-writer-thread file writer as the slow
+log, so recording never blocks a request.
+"""
+import hashlib
+import os
+import random
+import time
+
+import admission
+import slowlog
+
+TRAFFIC_RECORD_PATH = os.getenv("TRAFFIC_RECORD_PATH")
+TRAFFIC_RECORD_SAMPLE = float(os.getenv("TRAFFIC_RECORD_SAMPLE", "1.0"))
+TRAFFIC_RECORD_BODIES = os.getenv("TRAFFIC_RECORD_BODIES", "1") == "1"
+TRAFFIC_RECORD_MAX_BYTES = int(os.getenv("TRAFFIC_RECORD_MAX_BYTES", str(100 * 1024 * 1024)))
+
+REPLAY_HEADERS = ("Content-Type", "Idempotency-Key", "X-Request-Timeout")
+STREAMED_BODY_PATHS = ("/reviews/import",)
+
+recorder = slowlog.SlowLog(path=TRAFFIC_RECORD_PATH, max_bytes=TRAFFIC_RECORD_MAX_BYTES) if TRAFFIC_RECORD_PATH else None
+
+
+def client_hash(headers, remote_addr):
+    return hashlib.sha256(admission.client_key(headers, remote_addr).encode("utf-8")).hexdigest()[:12]
+
+
+def records_body(path, content_type):
+    """Whether a request's body may be read for the log, rather than just its length"""
+    return path not in STREAMED_BODY_PATHS and not (content_type or "").startswith("multipart/")
+
+
+def record(method, path, query, headers, remote_addr, body):
+    """Queue one request for the traffic log, if recording is on and it is sampled
+
+    body is None for requests whose body is not read (see records_body).
+    """
+    if recorder is None or method == "OPTIONS" or random.random() >= TRAFFIC_RECORD_SAMPLE:
+        return
+    entry = {
+        "t": time.time(),
+        "method": method,
+        "path": path,
+        "query": query,
+        "headers": {name: headers[name] for name in REPLAY_HEADERS if name in headers},
+        "client": client_hash(headers, remote_addr),
+    }
+    if body is None:
+        entry["body_length"] = int(headers.get("Content-Length") or 0)
+    elif TRAFFIC_RECORD_BODIES:
+        entry["body"] = body.decode("utf-8", "replace")
+    else:
+        entry["body_length"] = len(body)
+    recorder.write(entry)
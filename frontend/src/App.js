@@ -1,4 +1,4 @@
-  import React, { useState } from 'react';
+  import React, { useRef, useState } from 'react';
   import axios from 'axios';
   import './App.css';
 
@@ -7,6 +7,46 @@
   const API_BASE = process.env.REACT_APP_API_BASE || "http://sentiment-api:5000"; 
   const PREDICT_ENDPOINT = `${API_BASE}/predict`;
   const STATS_ENDPOINT = `${API_BASE}/stats`;
+  const CLIENT_METRICS_ENDPOINT = `${API_BASE}/client-metrics`;
+
+  // Retry policy: capped exponential backoff with full jitter, so tabs that
+  // failed together do not all come back at the same moment
+  const MAX_RETRIES = 6;
+  const BASE_DELAY_MS = 500;
+  const MAX_DELAY_MS = 30000;
+  const RETRYABLE_STATUS = [429, 502, 503, 504];
+
+  const backoffDelay = (attempt) =>
+    Math.random() * Math.min(MAX_DELAY_MS, BASE_DELAY_MS * 2 ** attempt);
+
+  // Retry-After is either a number of seconds or an HTTP date
+  const retryAfterMs = (err) => {
+    const value = err.response?.headers?.['retry-after'];
+    if (!value) return 0;
+    const seconds = Number(value);
+    if (!Number.isNaN(seconds)) return seconds * 1000;
+    return Math.max(0, Date.parse(value) - Date.now()) || 0;
+  };
+
+  // Network errors (backend still starting) and overload responses are worth retrying
+  const isRetryable = (err) =>
+    !err.response || RETRYABLE_STATUS.includes(err.response.status);
+
+  const sleep = (ms, signal) => new Promise((resolve, reject) => {
+    const timer = setTimeout(resolve, ms);
+    signal?.addEventListener('abort', () => {
+      clearTimeout(timer);
+      reject(new axios.CanceledError());
+    }, { once: true });
+  });
+
+  const reportRetries = (endpoint, retries, outcome) => {
+    if (retries === 0) return;
+    axios.post(CLIENT_METRICS_ENDPOINT, { endpoint, retries, outcome }).catch(() => {});
+  };
+
+  const newIdempotencyKey = () =>
+    window.crypto?.randomUUID?.() || `${Date.now()}-${Math.random().toString(36).slice(2)}`;
 
   function App() {
     const [review, setReview] = useState('');
@@ -16,22 +56,46 @@
     const [statsLoading, setStatsLoading] = useState(false);
     const [activeTab, setActiveTab] = useState('analyze');
 
-    // Helper: Retry requests if backend is not ready yet
-    const fetchWithRetry = async (axiosConfig, retries = 10, delay = 1000) => {
-      for (let i = 0; i < retries; i++) {
+    const predictAbort = useRef(null);
+
+    // Helper: Retry requests if backend is not ready yet or is shedding load.
+    // A POST is only retried when it carries an Idempotency-Key, so a retry
+    // can never store the same review twice.
+    const fetchWithRetry = async (axiosConfig, retries = MAX_RETRIES) => {
+      const method = (axiosConfig.method || 'get').toLowerCase();
+      const idempotent = method === 'get' || Boolean(axiosConfig.headers?.['Idempotency-Key']);
+      const endpoint = new URL(axiosConfig.url, window.location.href).pathname;
+
+      for (let attempt = 0; ; attempt++) {
         try {
           const response = await axios(axiosConfig);
+          reportRetries(endpoint, attempt, 'success');
           return response;
         } catch (err) {
-          if (i === retries - 1) throw err; // last try, throw error
-          await new Promise(r => setTimeout(r, delay));
+          if (axios.isCancel(err)) throw err;
+          if (!idempotent || !isRetryable(err) || attempt >= retries) {
+            reportRetries(endpoint, attempt, 'failed');
+            throw err;
+          }
+          // The server's hint is a lower bound; jitter still spreads clients out
+          await sleep(Math.max(retryAfterMs(err), backoffDelay(attempt)), axiosConfig.signal);
         }
       }
     };
 
+    const editReview = (text) => {
+      // The result of an in-flight request would be for text that no longer exists
+      predictAbort.current?.abort();
+      setReview(text);
+    };
+
     const analyzeSentiment = async () => {
       if (!review.trim()) return;
       
+      predictAbort.current?.abort();
+      const controller = new AbortController();
+      predictAbort.current = controller;
+
       setLoading(true);
       setResult(null);
       try {
@@ -39,14 +103,22 @@
           method: 'post',
           url: PREDICT_ENDPOINT,
           data: { text: review },
-        }, 15, 1000); // 15 retries with 1s interval
+          // One key per click: retries of this submission are collapsed server side
+          headers: { 'Idempotency-Key': newIdempotencyKey() },
+          signal: controller.signal,
+        });
 
         setResult(response.data);
       } catch (error) {
+        if (axios.isCancel(error)) return; // superseded by an edit or a new submission
         console.error('Error analyzing sentiment:', error);
         setResult({ error: 'Failed to analyze sentiment. Make sure the backend is running.' });
+      } finally {
+        if (predictAbort.current === controller) {
+          predictAbort.current = null;
+          setLoading(false);
+        }
       }
-      setLoading(false);
     };
 
     const loadStats = async () => {
@@ -55,7 +127,7 @@
         const response = await fetchWithRetry({
           method: 'get',
           url: STATS_ENDPOINT,
-        }, 15, 1000);
+        });
 
         setStats(response.data);
       } catch (error) {
@@ -105,7 +177,7 @@
               <div className="input-section">
                 <textarea
                   value={review}
-                  onChange={(e) => setReview(e.target.value)}
+                  onChange={(e) => editReview(e.target.value)}
                   placeholder="Enter your movie review here... 
   Example: 'This movie was absolutely fantastic! Great acting and storyline.'"
                   rows="6"